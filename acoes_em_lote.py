@@ -0,0 +1,137 @@
+# ==================== AÇÕES EM LOTE SOBRE INVESTIGAÇÕES ====================
+# Reatribuir, mudar status ou prorrogar prazo de várias investigações de uma vez:
+#
+#   alvo = select(Investigacao.id).where(...)      # selecionadas ou filtro da lista
+#   alteradas = acoes_em_lote.aplicar(alvo, 'status', 'Concluída', usuario='Odon')
+#
+# Cada ação é um INSERT ... SELECT do histórico (com os valores antigos) seguido de um
+# único UPDATE, na mesma transação. As regras da data de conclusão são as mesmas da
+# edição individual (editar_investigacao).
+from datetime import datetime
+from sqlalchemy import select, update, insert, literal, case, cast, func, or_, String
+from models import db, Investigacao, HistoricoDiligencia, somar_dias, hoje_sql
+import carga
+import tendencias
+import cache_fragmentos
+
+ACOES = {
+    'responsavel': 'Reatribuir responsável',
+    'status': 'Alterar status',
+    'prazo': 'Prorrogar prazo',
+}
+
+STATUS_VALIDOS = ['Em Fila', 'Em Andamento', 'Concluída']
+
+
+def _texto(coluna):
+    """Valor da coluna como texto para a descrição ('' quando vazio)"""
+    return func.coalesce(cast(coluna, String), '')
+
+
+def _alteracao_responsavel(novo):
+    filtro = or_(Investigacao.responsavel.is_(None), Investigacao.responsavel != novo)
+    linhas = literal("- Responsável: de '") + _texto(Investigacao.responsavel) + f"' para '{novo}'"
+    return filtro, {'responsavel': novo}, linhas
+
+
+def _alteracao_status(novo):
+    filtro = or_(Investigacao.status.is_(None), Investigacao.status != novo)
+    linha_status = literal("- Status: de '") + _texto(Investigacao.status) + f"' para '{novo}'"
+
+    if novo == 'Concluída':
+        # Mantém a data já registrada; sem data, conclui hoje
+        hoje = datetime.now().date()
+        valores = {'status': novo, 'data_conclusao': func.coalesce(Investigacao.data_conclusao, hoje_sql())}
+        linha_data = case(
+            (Investigacao.data_conclusao.is_(None),
+             literal(f"- Status alterado para 'Concluída' em {hoje.strftime('%d/%m/%Y')}\n")),
+            else_=literal(''),
+        )
+    else:
+        # Saindo de 'Concluída': limpa a data de conclusão
+        valores = {'status': novo, 'data_conclusao': case(
+            (Investigacao.status == 'Concluída', None), else_=Investigacao.data_conclusao)}
+        linha_data = case(
+            (Investigacao.status == 'Concluída',
+             literal(f"- Data de Conclusão removida (status mudou de 'Concluída' para '{novo}')\n")),
+            else_=literal(''),
+        )
+
+    return filtro, valores, linha_data + linha_status
+
+
+def _alteracao_prazo(dias):
+    # Só faz sentido para as que ainda correm prazo
+    filtro = Investigacao.previsao_conclusao.isnot(None) & (Investigacao.status != 'Concluída')
+    nova_data = somar_dias(Investigacao.previsao_conclusao, dias)
+    linhas = (literal("- Previsão Conclusão: de '") + _texto(Investigacao.previsao_conclusao)
+              + "' para '" + _texto(nova_data) + f"' (prorrogada em {dias} dias)")
+    return filtro, {'previsao_conclusao': nova_data}, linhas
+
+
+def validar(acao, valor):
+    """Converte o valor do formulário; ValueError com a mensagem para o usuário"""
+    if acao not in ACOES:
+        raise ValueError('Ação inválida')
+    valor = (valor or '').strip()
+    if acao == 'responsavel':
+        if not valor:
+            raise ValueError('Informe o novo responsável')
+        return valor
+    if acao == 'status':
+        if valor not in STATUS_VALIDOS:
+            raise ValueError('Status inválido')
+        return valor
+    try:
+        dias = int(valor)
+    except ValueError:
+        raise ValueError('Informe a quantidade de dias da prorrogação')
+    if not 0 < dias <= 3650:
+        raise ValueError('A prorrogação deve ser de 1 a 3650 dias')
+    return dias
+
+
+def aplicar(alvo, acao, valor, usuario):
+    """Aplica a ação às investigações cujos ids o SELECT `alvo` retorna. Retorna quantas mudaram."""
+    valor = validar(acao, valor)
+    montar = {'responsavel': _alteracao_responsavel, 'status': _alteracao_status, 'prazo': _alteracao_prazo}[acao]
+    filtro, valores, linhas = montar(valor)
+    condicao = Investigacao.id.in_(alvo) & filtro
+
+    try:
+        # Responsáveis antes da mudança (para recalcular a carga de trabalho)
+        responsaveis = set(db.session.execute(select(Investigacao.responsavel).where(condicao).distinct()).scalars())
+        if not responsaveis:
+            return 0
+
+        # 1. Histórico com os valores antigos (lido antes do UPDATE)
+        descricao = literal(f"Investigação editada por {usuario} (ação em lote):\n") + linhas
+        db.session.execute(insert(HistoricoDiligencia).from_select(
+            ['investigacao_id', 'data', 'usuario', 'descricao', 'tipo'],
+            select(Investigacao.id, literal(datetime.utcnow()), literal(usuario), descricao, literal('edicao'))
+            .where(condicao),
+        ))
+
+        # Meses de entrada/conclusão antes da mudança (resumo mensal)
+        tendencias.marcar_investigacoes(condicao)
+
+        # 2. Um único UPDATE para todas
+        alteradas = db.session.execute(
+            update(Investigacao).where(condicao).values(**valores, atualizado_em=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        # UPDATE em massa não passa pelos eventos do ORM
+        if acao == 'responsavel':
+            responsaveis.add(valor)
+        carga.recalcular([r for r in responsaveis if r])
+        if acao == 'status' and valor == 'Concluída':
+            tendencias.marcar_meses([datetime.now().date()])  # As que não tinham data concluem hoje
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    cache_fragmentos.invalidar('investigacoes')
+    return alteradas
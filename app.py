@@ -1,20 +1,48 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, current_app, jsonify # Adicionei jsonify
-from models import db, Investigacao, HistoricoDiligencia, Usuario, Anexo
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, current_app, jsonify, Response, stream_with_context, abort # Adicionei jsonify
+from models import db, Investigacao, HistoricoDiligencia, Usuario, Anexo, CargaResponsavel, Servidor, normalizar_matricula
+import carga  # Registra os eventos que mantêm a tabela de carga por responsável
+from cache_http import resposta_condicional, validador_layout, calcular_etag, nao_modificado
+import assets
+import compressao
+import cache_fragmentos
+import importacao
+import acoes_em_lote
+import exclusao_arquivos
+import armazenamento
+import compressao_anexos
+import zip_anexos
+import duplicidade  # Registra os eventos que mantêm o índice de possíveis duplicidades
+import explorador
+import busca_servidores
+import replica
+import tendencias  # Registra os eventos que anotam os meses a recalcular no resumo mensal
+import arquivo
+from cache_fragmentos import fragmentos
+import metricas
 from config import Config
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
 import json
+import hashlib
+import base64
 import pandas as pd  # ✅ DESCOMENTADO E USADO
 from io import BytesIO
 from collections import Counter
 from werkzeug.utils import secure_filename
 import os
+import atexit
 import mimetypes
+import time
 from flask_login import login_required
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
 db.init_app(app)
+assets.registrar(app)  # Pacotes CSS/JS locais (/assets) e helpers incluir_css / incluir_js
+compressao.registrar(app)  # gzip/brotli nas respostas HTML/JSON
+cache_fragmentos.registrar(app, db.session)  # {% cache %} nos templates + invalidação após commit
+exclusao_arquivos.registrar(app)  # Arquivos de anexos apagados em segundo plano após o commit
+replica.registrar(app, db)  # SELECTs das rotas @replica.somente_leitura na réplica (DATABASE_REPLICA_URL)
 
 # ==================== FILTRO DE DATA (CORREÇÃO DE FUSO HORÁRIO) ====================
 @app.template_filter('data_brasil')
@@ -55,11 +83,8 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Configuração de pastas (garantir que a pasta 'uploads' exista)
-UPLOAD_FOLDER = 'uploads'
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# Armazenamento dos anexos (pasta UPLOAD_FOLDER do config.py ou S3, ver armazenamento.py)
+armazenamento.registrar(app)
 
 
 # ==================== INICIALIZAÇÃO DO BANCO ====================
@@ -85,44 +110,29 @@ with app.app_context():
     print("🔐 Migração de usuários concluída!")
 
 
-# ==================== NOVO MODELO: SERVIDOR ====================
-class Servidor(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    nome = db.Column(db.String(150), nullable=False)
-    matricula = db.Column(db.String(50), nullable=True, unique=True) # Matrícula única
-    cargo = db.Column(db.String(100), nullable=True)
-    lotacao = db.Column(db.String(100), nullable=True)
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'nome': self.nome,
-            'matricula': self.matricula,
-            'cargo': self.cargo,
-            'lotacao': self.lotacao
-        }
+# ==================== CONTEXT PROCESSOR PARA NOTIFICAÇÕES ====================
+def contar_alertas():
+    """Investigações em andamento atrasadas e próximas do prazo (15 dias)"""
+    def contar():
+        atrasadas = Investigacao.query.filter(Investigacao.esta_atrasado).count()
+        proximas_prazo = Investigacao.query.filter(Investigacao.alerta_prazo).count()
+        return atrasadas, proximas_prazo
+
+    # Usado em toda página (menu e ETag): guardado por 1 minuto ou até a próxima gravação
+    return fragmentos.obter_ou_calcular(('investigacoes:alertas', date.today()), 60, contar)
+
+
+@validador_layout
+def validador_pagina_base():
+    """O que o base.html mostra além do conteúdo: usuário, nível e badge de alertas"""
+    return (session.get('usuario_id'), session.get('nome'), session.get('nivel'), *contar_alertas())
 
 
-# ==================== CONTEXT PROCESSOR PARA NOTIFICAÇÕES ====================
 @app.context_processor
 def inject_notifications():
     """Injeta contador de notificações e nível do usuário em todos os templates"""
     if 'usuario' in session:
-        hoje = datetime.now().date()
-
-        # Investigações atrasadas (em andamento)
-        atrasadas = Investigacao.query.filter(
-            Investigacao.status == 'Em Andamento',
-            Investigacao.previsao_conclusao < hoje
-        ).count()
-
-        # Investigações próximas do prazo (15 dias)
-        prazo_limite = hoje + timedelta(days=15)
-        proximas_prazo = Investigacao.query.filter(
-            Investigacao.status == 'Em Andamento',
-            Investigacao.previsao_conclusao >= hoje,
-            Investigacao.previsao_conclusao <= prazo_limite
-        ).count()
+        atrasadas, proximas_prazo = contar_alertas()
 
         total_alertas = atrasadas + proximas_prazo
 
@@ -169,8 +179,11 @@ def login():
                 session['nivel'] = usuario.nivel
                 session.permanent = True
 
-                # Registrar último login
+                # Registrar último login (gravado em lote, ver gravar_logins_periodicamente)
+                # e o novo hash, se a política mudou
                 usuario.registrar_login()
+                if db.session.is_modified(usuario):
+                    db.session.commit()
 
                 print(f"✅ Login bem-sucedido: {usuario.nome} ({usuario.nivel})")
                 flash(f'Bem-vindo, {usuario.nome}!', 'success')
@@ -194,6 +207,7 @@ def logout():
 
 
 @app.route('/dashboard')
+@replica.somente_leitura
 def dashboard():
     if 'usuario' not in session:
         flash('Você precisa fazer login primeiro!', 'warning')
@@ -202,40 +216,22 @@ def dashboard():
     hoje = datetime.now().date()
 
     # === DADOS GERAIS ===
-    total = Investigacao.query.count()
+    # As arquivadas são todas concluídas (contagem guardada, ver arquivo.py)
+    arquivadas = arquivo.total_arquivadas()
+    total = Investigacao.query.count() + arquivadas
     em_andamento = Investigacao.query.filter_by(status='Em Andamento').count()
-    concluidas = Investigacao.query.filter_by(status='Concluída').count()
-
-    # === DADOS PARA GRÁFICOS ===
+    concluidas = Investigacao.query.filter_by(status='Concluída').count() + arquivadas
 
-    # 1. Gráfico de Pizza: Status
-    # Conta quantas investigações existem para cada status
-    status_raw = db.session.query(Investigacao.status, db.func.count(Investigacao.status)).group_by(Investigacao.status).all()
-    # Transforma em formato fácil para o gráfico: {'Em Andamento': 10, 'Concluída': 5}
-    dados_status = {s[0]: s[1] for s in status_raw if s[0]}
-
-    # 2. Gráfico de Barras: Investigações por Ano
-    ano_raw = db.session.query(Investigacao.ano, db.func.count(Investigacao.ano)).group_by(Investigacao.ano).all()
-    dados_ano = {str(a[0]): a[1] for a in ano_raw if a[0]}
-
-    # 3. Gráfico de Barras: Por Classificação (Assédio, Furto, etc)
-    class_raw = db.session.query(Investigacao.classificacao, db.func.count(Investigacao.classificacao)).group_by(Investigacao.classificacao).all()
-    dados_classificacao = {c[0]: c[1] for c in class_raw if c[0]}
+    # Gráficos de classificação e ano: buscados pela página depois (api_grafico)
 
     # === TABELAS DE ALERTA ===
     # Investigações atrasadas
-    atrasadas = Investigacao.query.filter(
-        Investigacao.status == 'Em Andamento',
-        Investigacao.previsao_conclusao < hoje
-    ).order_by(Investigacao.previsao_conclusao.asc()).all()
+    atrasadas = Investigacao.query.filter(Investigacao.esta_atrasado) \
+        .order_by(Investigacao.previsao_conclusao.asc()).all()
 
     # Investigações próximas do prazo
-    prazo_limite = hoje + timedelta(days=15)
-    proximas_prazo = Investigacao.query.filter(
-        Investigacao.status == 'Em Andamento',
-        Investigacao.previsao_conclusao >= hoje,
-        Investigacao.previsao_conclusao <= prazo_limite
-    ).order_by(Investigacao.previsao_conclusao.asc()).all()
+    proximas_prazo = Investigacao.query.filter(Investigacao.alerta_prazo) \
+        .order_by(Investigacao.previsao_conclusao.asc()).all()
 
     # Investigações recentes
     recentes = Investigacao.query.order_by(Investigacao.id.desc()).limit(5).all()
@@ -247,16 +243,13 @@ def dashboard():
                          recentes=recentes,
                          atrasadas=atrasadas,
                          proximas_prazo=proximas_prazo,
-                         hoje=hoje,
-                         # Passando os dados novos para o HTML
-                         dados_status=dados_status,
-                         dados_ano=dados_ano,
-                         dados_classificacao=dados_classificacao)
+                         hoje=hoje)
 
 
 
 # ==================== ROTA: RELATÓRIOS ====================
 @app.route('/relatorios')
+@replica.somente_leitura
 def relatorios():
     if 'usuario' not in session:
         flash('Você precisa fazer login primeiro!', 'warning')
@@ -264,161 +257,373 @@ def relatorios():
 
     hoje = datetime.now().date()
 
-    # Buscar todas as investigações
-    todas = Investigacao.query.all()
+    arquivadas = arquivo.total_arquivadas()
+    total = Investigacao.query.count() + arquivadas
+    concluidas = Investigacao.query.filter_by(status='Concluída').count() + arquivadas
 
-    # Total
-    total = len(todas)
+    # Gráficos: buscados pela página depois (api_grafico)
 
-    # Contadores para os gráficos
-    status_counts = dict(Counter([inv.status for inv in todas if inv.status]))
-    responsavel_counts = dict(Counter([inv.responsavel for inv in todas if inv.responsavel]))
-    assunto_counts = dict(Counter([inv.assunto for inv in todas if inv.assunto]))
-    ano_counts = dict(Counter([str(inv.ano) for inv in todas if inv.ano]))
-
-    # Investigações atrasadas
-    atrasadas_query = Investigacao.query.filter(
-        Investigacao.status == 'Em Andamento',
-        Investigacao.previsao_conclusao < hoje
-    ).order_by(Investigacao.previsao_conclusao.asc()).all()
+    # Investigações atrasadas (dias calculados no banco)
+    atrasadas_query = db.session.query(Investigacao, Investigacao.dias_restantes) \
+        .filter(Investigacao.esta_atrasado) \
+        .order_by(Investigacao.previsao_conclusao.asc()).all()
 
     atrasadas = len(atrasadas_query)
 
     # Lista de atrasadas COM dias_restantes
     lista_atrasadas = []
-    for inv in atrasadas_query:
+    for inv, dias in atrasadas_query:
         lista_atrasadas.append({
             'investigacao': inv,
-            'dias_atrasados': (hoje - inv.previsao_conclusao).days
+            'dias_atrasados': -dias
         })
 
     # Investigações próximas do prazo
-    prazo_limite = hoje + timedelta(days=15)
-    proximas_query = Investigacao.query.filter(
-        Investigacao.status == 'Em Andamento',
-        Investigacao.previsao_conclusao >= hoje,
-        Investigacao.previsao_conclusao <= prazo_limite
-    ).order_by(Investigacao.previsao_conclusao.asc()).all()
+    proximas_query = db.session.query(Investigacao, Investigacao.dias_restantes) \
+        .filter(Investigacao.alerta_prazo) \
+        .order_by(Investigacao.previsao_conclusao.asc()).all()
 
     proximas_prazo = len(proximas_query)
 
     # Lista de próximas COM dias_restantes
     lista_proximas = []
-    for inv in proximas_query:
+    for inv, dias in proximas_query:
         lista_proximas.append({
             'investigacao': inv,
-            'dias_restantes': (inv.previsao_conclusao - hoje).days
+            'dias_restantes': dias
         })
 
     return render_template('relatorios.html',
                          total=total,
                          atrasadas=atrasadas,
                          proximas_prazo=proximas_prazo,
-                         status_counts=status_counts,
-                         responsavel_counts=responsavel_counts,
-                         assunto_counts=assunto_counts,
-                         ano_counts=ano_counts,
+                         concluidas=concluidas,
                          lista_atrasadas=lista_atrasadas,
                          lista_proximas=lista_proximas,
                          hoje=hoje)
 
 
-# ==================== ROTA: LISTA DE INVESTIGAÇÕES (COM PAGINAÇÃO E FILTROS) ====================
-@app.route('/investigacoes')
-def investigacoes():
+# ==================== DADOS DOS GRÁFICOS (CARREGADOS PELA PÁGINA) ====================
+# O dashboard e os relatórios saem só com os cards e tabelas; cada gráfico busca o
+# seu JSON depois. O JSON fica no cache de fragmentos (grupo 'investigacoes', limpo a
+# cada escrita) junto com o hash do conteúdo, que vira o ETag: a revalidação do
+# navegador responde 304 sem consultar o banco.
+GRAFICOS = ('status', 'responsavel', 'assunto', 'classificacao', 'ano')
+GRAFICOS_TTL = 300
+
+
+def contagem_por(campo):
+    """{valor: quantidade} agrupado no banco, na ordem dos valores (inclui as arquivadas)"""
+    coluna = arquivo.uniao(campo).c[campo]
+    linhas = db.session.query(coluna, db.func.count()) \
+        .filter(coluna.isnot(None)).group_by(coluna).order_by(coluna).all()
+    return {str(valor): quantidade for valor, quantidade in linhas if valor}
+
+
+@app.route('/api/graficos/<nome>')
+def api_grafico(nome):
+    exigir_login_api()
+    if nome not in GRAFICOS:
+        raise ErroApi('Gráfico inexistente', 404)
+
+    def montar():
+        contagens = contagem_por(nome)
+        dados = {'rotulos': list(contagens), 'valores': list(contagens.values())}
+        versao = hashlib.sha1(json.dumps(dados, ensure_ascii=False).encode('utf-8')).hexdigest()
+        return dados, versao
+
+    dados, versao = fragmentos.obter_ou_calcular(('investigacoes:grafico', nome), GRAFICOS_TTL, montar)
+    etag = calcular_etag(versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+    return resposta_json(dados, etag)
+
+
+# ==================== ROTA: CARGA DE TRABALHO POR RESPONSÁVEL ====================
+def validador_carga_trabalho():
+    return list(db.session.query(
+        db.func.count(CargaResponsavel.responsavel), db.func.max(CargaResponsavel.atualizado_em)
+    ).one())
+
+
+@app.route('/carga-trabalho')
+@replica.somente_leitura
+@resposta_condicional(validador_carga_trabalho)
+def carga_trabalho():
+    if 'usuario' not in session:
+        flash('Você precisa fazer login primeiro!', 'warning')
+        return redirect(url_for('login'))
+
+    # Lê apenas a tabela resumo (mantida a cada escrita e reconciliada à noite)
+    cargas = CargaResponsavel.query.order_by(CargaResponsavel.abertas.desc(), CargaResponsavel.responsavel).all()
+
+    # Primeira execução: tabela ainda vazia, monta o resumo completo uma vez
+    if not cargas and db.session.query(Investigacao.id).first():
+        carga.reconciliar()
+        cargas = CargaResponsavel.query.order_by(CargaResponsavel.abertas.desc(), CargaResponsavel.responsavel).all()
+
+    totais = {contador: sum(getattr(c, contador) for c in cargas) for contador in carga.CONTADORES}
+    reconciliado_em = max((c.reconciliado_em for c in cargas if c.reconciliado_em), default=None)
+
+    return render_template('carga_trabalho.html',
+                         cargas=cargas,
+                         totais=totais,
+                         reconciliado_em=reconciliado_em,
+                         ano_atual=datetime.now().year)
+
+
+# ==================== HISTÓRICO DO SERVIDOR E REINCIDÊNCIA ====================
+# Ligação pela matrícula normalizada (Investigacao.matricula_chave, indexada):
+# '012.345-6', '0123456' e '123456' são o mesmo servidor.
+@app.route('/servidores/<matricula>')
+@replica.somente_leitura
+def historico_servidor(matricula):
     if 'usuario' not in session:
         flash('Você precisa fazer login primeiro!', 'warning')
         return redirect(url_for('login'))
 
-    # Query base
-    query = Investigacao.query
+    chave = normalizar_matricula(matricula)
+    servidor = Servidor.query.filter_by(matricula_chave=chave).first() if chave else None
+    modelo = arquivo.com_arquivadas()  # O histórico inclui as arquivadas
+    investigacoes_servidor = db.session.query(modelo).filter(modelo.matricula_chave == chave) \
+        .order_by(modelo.entrada_prfi.desc(), modelo.id.desc()).all() if chave else []
+
+    if not servidor and not investigacoes_servidor:
+        flash(f'Nenhum servidor ou investigação com a matrícula {matricula}.', 'warning')
+        return redirect(url_for('investigacoes'))
 
-    # ==================== FILTROS AVANÇADOS ====================
+    # Nome do cadastro do RH; sem cadastro, o mais recente digitado nas investigações
+    nome = servidor.nome if servidor else next(
+        (inv.nome_denunciado for inv in investigacoes_servidor if inv.nome_denunciado), None)
 
+    return render_template('historico_servidor.html',
+                           servidor=servidor,
+                           nome=nome,
+                           matricula=servidor.matricula if servidor else matricula,
+                           investigacoes=investigacoes_servidor,
+                           por_status=Counter(inv.status for inv in investigacoes_servidor),
+                           anos=sorted({inv.ano for inv in investigacoes_servidor if inv.ano}))
+
+
+@app.route('/relatorios/reincidencia')
+@replica.somente_leitura
+def relatorio_reincidencia():
+    """Servidores denunciados em mais de uma investigação (uma consulta agrupada)"""
+    if 'usuario' not in session:
+        flash('Você precisa fazer login primeiro!', 'warning')
+        return redirect(url_for('login'))
+
+    minimo = max(request.args.get('minimo', 2, type=int) or 2, 2)
+    anos_diferentes = request.args.get('anos_diferentes') == '1'
+    classificacao = request.args.get('classificacao') or 'todos'
+
+    # Inclui as arquivadas: reincidência é justamente sobre anos anteriores
+    inv = arquivo.uniao('id', 'matricula_chave', 'matricula_denunciado', 'nome_denunciado',
+                        'ano', 'status', 'entrada_prfi', 'classificacao').c
+    total = db.func.count(db.distinct(inv.id))
+    anos = db.func.count(db.distinct(inv.ano))
+    consulta = db.session.query(
+        inv.matricula_chave,
+        db.func.max(inv.matricula_denunciado).label('matricula'),
+        db.func.coalesce(db.func.max(Servidor.nome), db.func.max(inv.nome_denunciado)).label('nome'),
+        db.func.max(Servidor.lotacao).label('lotacao'),
+        total.label('total'),
+        anos.label('anos'),
+        db.func.min(inv.ano).label('primeiro_ano'),
+        db.func.max(inv.ano).label('ultimo_ano'),
+        db.func.count(db.distinct(db.case((inv.status != 'Concluída', inv.id)))).label('em_aberto'),
+        db.func.max(inv.entrada_prfi).label('ultima_entrada'),
+    ).outerjoin(Servidor, Servidor.matricula_chave == inv.matricula_chave) \
+        .filter(inv.matricula_chave.isnot(None))
+
+    if classificacao != 'todos':
+        consulta = consulta.filter(inv.classificacao == classificacao)
+
+    consulta = consulta.group_by(inv.matricula_chave).having(total >= minimo)
+    if anos_diferentes:
+        consulta = consulta.having(anos >= 2)
+    reincidentes = consulta.order_by(total.desc(), anos.desc(), inv.matricula_chave).all()
+
+    classificacoes = [c for (c,) in db.session.query(inv.classificacao).distinct()
+                      .filter(inv.classificacao.isnot(None)).order_by(inv.classificacao)]
+
+    return render_template('relatorio_reincidencia.html',
+                           reincidentes=reincidentes,
+                           minimo=minimo,
+                           anos_diferentes=anos_diferentes,
+                           classificacao=classificacao,
+                           classificacoes=classificacoes)
+
+
+# ==================== TENDÊNCIAS MENSAIS ====================
+# Lê só a tabela resumos_mensais (ver tendencias.py): o custo não cresce com os anos
+# de investigações. Os meses alterados são recalculados pelo atualizar_tendencias.py.
+PERIODOS_TENDENCIAS = {'12': 12, '24': 24, '60': 60, 'todos': None}
+
+
+@app.route('/relatorios/tendencias')
+@replica.somente_leitura
+def relatorio_tendencias():
+    if 'usuario' not in session:
+        flash('Você precisa fazer login primeiro!', 'warning')
+        return redirect(url_for('login'))
+
+    classificacao = request.args.get('classificacao') or tendencias.TODOS
+    responsavel = request.args.get('responsavel') or tendencias.TODOS
+    periodo = request.args.get('periodo') if request.args.get('periodo') in PERIODOS_TENDENCIAS else '24'
+
+    desde = None
+    if PERIODOS_TENDENCIAS[periodo]:
+        hoje = datetime.now().date()
+        meses = hoje.year * 12 + hoje.month - PERIODOS_TENDENCIAS[periodo]
+        desde = date(meses // 12, meses % 12 + 1, 1)
+
+    serie = tendencias.serie(classificacao, responsavel, desde)
+    classificacoes, responsaveis = tendencias.opcoes()
+    atualizado_em, meses_pendentes = tendencias.situacao()
+
+    return render_template('relatorio_tendencias.html',
+                           serie=serie,
+                           rotulos=[m['mes'].strftime('%m/%Y') for m in serie],
+                           classificacao=classificacao,
+                           responsavel=responsavel,
+                           periodo=periodo,
+                           classificacoes=classificacoes,
+                           responsaveis=responsaveis,
+                           todos=tendencias.TODOS,
+                           atualizado_em=atualizado_em,
+                           meses_pendentes=meses_pendentes,
+                           total_entradas=sum(m['entradas'] for m in serie),
+                           total_conclusoes=sum(m['conclusoes'] for m in serie))
+
+
+# ==================== FILTROS E ORDENAÇÃO DA LISTA (REUSADOS PELA API) ====================
+def filtrar_investigacoes(query, args, modelo=Investigacao):
+    """Aplica os filtros da tela de investigações (request.args ou equivalente).
+    modelo: Investigacao ou arquivo.com_arquivadas() (o mesmo da query)"""
     # 1. Filtro por MÚLTIPLOS STATUS (checkboxes)
-    filtros_status = request.args.getlist('status')  # Pega lista de valores
+    filtros_status = args.getlist('status')  # Pega lista de valores
     if filtros_status and 'todos' not in filtros_status:
-        query = query.filter(Investigacao.status.in_(filtros_status))
+        query = query.filter(modelo.status.in_(filtros_status))
 
     # 2. Filtro por MÚLTIPLOS RESPONSÁVEIS (checkboxes)
-    filtros_responsavel = request.args.getlist('responsavel')
+    filtros_responsavel = args.getlist('responsavel')
     if filtros_responsavel and 'todos' not in filtros_responsavel:
-        query = query.filter(Investigacao.responsavel.in_(filtros_responsavel))
+        query = query.filter(modelo.responsavel.in_(filtros_responsavel))
 
     # 3. Filtro por CLASSIFICAÇÃO (dropdown)
-    filtro_classificacao = request.args.get('classificacao')
+    filtro_classificacao = args.get('classificacao')
     if filtro_classificacao and filtro_classificacao != 'todos':
-        query = query.filter(Investigacao.classificacao == filtro_classificacao)
+        query = query.filter(modelo.classificacao == filtro_classificacao)
 
     # 4. Filtro por ANO (dropdown)
-    filtro_ano = request.args.get('ano')
+    filtro_ano = args.get('ano')
     if filtro_ano and filtro_ano != 'todos':
-        query = query.filter(Investigacao.ano == int(filtro_ano))
+        try:
+            query = query.filter(modelo.ano == int(filtro_ano))
+        except ValueError:
+            pass
 
     # 5. Filtro por PERÍODO DE DATA (Entrada PRFI)
-    data_inicio = request.args.get('data_inicio')
-    data_fim = request.args.get('data_fim')
+    data_inicio = args.get('data_inicio')
+    data_fim = args.get('data_fim')
 
     if data_inicio:
         try:
             data_inicio_obj = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-            query = query.filter(Investigacao.entrada_prfi >= data_inicio_obj)
+            query = query.filter(modelo.entrada_prfi >= data_inicio_obj)
         except:
             pass
 
     if data_fim:
         try:
             data_fim_obj = datetime.strptime(data_fim, '%Y-%m-%d').date()
-            query = query.filter(Investigacao.entrada_prfi <= data_fim_obj)
+            query = query.filter(modelo.entrada_prfi <= data_fim_obj)
         except:
             pass
 
     # 6. Filtro por COMPLEXIDADE (dropdown)
-    filtro_complexidade = request.args.get('complexidade')
+    filtro_complexidade = args.get('complexidade')
     if filtro_complexidade and filtro_complexidade != 'todos':
-        query = query.filter(Investigacao.complexidade == filtro_complexidade)
+        query = query.filter(modelo.complexidade == filtro_complexidade)
 
-    # 7. BUSCA POR PALAVRA-CHAVE (melhorada)
-    busca = request.args.get('busca')
+    # 7. Filtro por FAIXA DE PRAZO (calculado no banco)
+    filtro_prazo = args.get('prazo')
+    if filtro_prazo and filtro_prazo != 'todos':
+        condicao_prazo = modelo.filtro_faixa_prazo(filtro_prazo)
+        if condicao_prazo is not None:
+            query = query.filter(condicao_prazo)
+
+    # 8. BUSCA POR PALAVRA-CHAVE (melhorada)
+    busca = args.get('busca')
     if busca:
         search_term = f"%{busca}%"
         query = query.filter(
-            (Investigacao.processo_gdoc.ilike(search_term)) |
-            (Investigacao.assunto.ilike(search_term)) |
-            (Investigacao.denunciante.ilike(search_term)) |
-            (Investigacao.nome_denunciado.ilike(search_term)) |
-            (Investigacao.objeto_especificacao.ilike(search_term)) |
-            (Investigacao.protocolo_origem.ilike(search_term))
+            (modelo.processo_gdoc.ilike(search_term)) |
+            (modelo.assunto.ilike(search_term)) |
+            (modelo.denunciante.ilike(search_term)) |
+            (modelo.nome_denunciado.ilike(search_term)) |
+            (modelo.objeto_especificacao.ilike(search_term)) |
+            (modelo.protocolo_origem.ilike(search_term))
         )
 
-    # ==================== ORDENAÇÃO (AJUSTADA) ====================
-    # Mudei o padrão para 'entrada_desc' (Data de Entrada mais recente primeiro)
-    ordenar_por = request.args.get('ordenar_por', 'entrada_desc')
+    return query
 
+
+def ordenar_investigacoes(query, ordenar_por, modelo=Investigacao):
+    """Aplica a ordenação escolhida na tela de investigações"""
     if ordenar_por == 'entrada_desc':
         # Ordena por data de entrada (mais recente no topo) e usa ID como desempate
-        query = query.order_by(Investigacao.entrada_prfi.desc(), Investigacao.id.desc())
+        query = query.order_by(modelo.entrada_prfi.desc(), modelo.id.desc())
     elif ordenar_por == 'entrada_asc':
-        query = query.order_by(Investigacao.entrada_prfi.asc(), Investigacao.id.asc())
+        query = query.order_by(modelo.entrada_prfi.asc(), modelo.id.asc())
     elif ordenar_por == 'id_asc':
-        query = query.order_by(Investigacao.id.asc())
+        query = query.order_by(modelo.id.asc())
     elif ordenar_por == 'id_desc':
-        query = query.order_by(Investigacao.id.desc())
+        query = query.order_by(modelo.id.desc())
     elif ordenar_por == 'previsao_asc':
-        query = query.order_by(Investigacao.previsao_conclusao.asc())
+        query = query.order_by(modelo.previsao_conclusao.asc())
     elif ordenar_por == 'previsao_desc':
-        query = query.order_by(Investigacao.previsao_conclusao.desc())
+        query = query.order_by(modelo.previsao_conclusao.desc())
+    elif ordenar_por == 'prazo_asc':
+        # Dias restantes (atrasadas primeiro; concluídas e sem prazo no fim)
+        query = query.order_by(modelo.dias_restantes.asc().nulls_last(), modelo.id.asc())
+    elif ordenar_por == 'prazo_desc':
+        query = query.order_by(modelo.dias_restantes.desc().nulls_last(), modelo.id.desc())
     elif ordenar_por == 'status_asc':
-        query = query.order_by(Investigacao.status.asc())
+        query = query.order_by(modelo.status.asc())
     elif ordenar_por == 'status_desc':
-        query = query.order_by(Investigacao.status.desc())
+        query = query.order_by(modelo.status.desc())
     elif ordenar_por == 'responsavel_asc':
-        query = query.order_by(Investigacao.responsavel.asc())
+        query = query.order_by(modelo.responsavel.asc())
     elif ordenar_por == 'responsavel_desc':
-        query = query.order_by(Investigacao.responsavel.desc())
+        query = query.order_by(modelo.responsavel.desc())
     else:
         # Fallback caso venha algo estranho, garante a ordem por data
-        query = query.order_by(Investigacao.entrada_prfi.desc(), Investigacao.id.desc())
+        query = query.order_by(modelo.entrada_prfi.desc(), modelo.id.desc())
+
+    return query
+
+
+# ==================== ROTA: LISTA DE INVESTIGAÇÕES (COM PAGINAÇÃO E FILTROS) ====================
+@app.route('/investigacoes')
+@replica.somente_leitura
+def investigacoes():
+    if 'usuario' not in session:
+        flash('Você precisa fazer login primeiro!', 'warning')
+        return redirect(url_for('login'))
+
+    # Só as tabelas principais; com "Incluir arquivadas", também as do arquivo
+    incluir_arquivadas = request.args.get('arquivadas') == '1'
+    modelo = arquivo.com_arquivadas() if incluir_arquivadas else Investigacao
+
+    # Query base com os filtros avançados
+    query = filtrar_investigacoes(db.session.query(modelo), request.args, modelo)
+
+    # Mudei o padrão para 'entrada_desc' (Data de Entrada mais recente primeiro)
+    ordenar_por = request.args.get('ordenar_por', 'entrada_desc')
+    query = ordenar_investigacoes(query, ordenar_por, modelo)
 
     # ==================== EXECUTAR QUERY COM PAGINAÇÃO ====================
     # Pega o número da página da URL (padrão = 1)
@@ -431,12 +636,26 @@ def investigacoes():
     # Total de resultados encontrados (para exibir na tela)
     total_resultados = pagination.total
 
+    # Valores atuais dos filtros (para manter selecionados)
+    filtros_status = request.args.getlist('status')
+    filtros_responsavel = request.args.getlist('responsavel')
+    filtro_classificacao = request.args.get('classificacao')
+    filtro_ano = request.args.get('ano')
+    filtro_complexidade = request.args.get('complexidade')
+    filtro_prazo = request.args.get('prazo')
+    data_inicio = request.args.get('data_inicio')
+    data_fim = request.args.get('data_fim')
+    busca = request.args.get('busca')
+
+    # Arquivadas na página (marcadas na lista)
+    arquivadas = arquivo.arquivadas_entre([inv.id for inv in pagination.items]) if incluir_arquivadas else set()
+
     # ==================== LISTAS PARA OS FILTROS DINÂMICOS ====================
-    lista_status = db.session.query(Investigacao.status).distinct().order_by(Investigacao.status).all()
-    lista_responsaveis = db.session.query(Investigacao.responsavel).distinct().order_by(Investigacao.responsavel).all()
-    lista_classificacoes = db.session.query(Investigacao.classificacao).distinct().order_by(Investigacao.classificacao).all()
-    lista_anos = db.session.query(Investigacao.ano).distinct().order_by(Investigacao.ano.desc()).all()
-    lista_complexidades = db.session.query(Investigacao.complexidade).distinct().order_by(Investigacao.complexidade).all()
+    lista_status = db.session.query(modelo.status).distinct().order_by(modelo.status).all()
+    lista_responsaveis = db.session.query(modelo.responsavel).distinct().order_by(modelo.responsavel).all()
+    lista_classificacoes = db.session.query(modelo.classificacao).distinct().order_by(modelo.classificacao).all()
+    lista_anos = db.session.query(modelo.ano).distinct().order_by(modelo.ano.desc()).all()
+    lista_complexidades = db.session.query(modelo.complexidade).distinct().order_by(modelo.complexidade).all()
 
     return render_template('investigacoes.html',
                          investigacoes=pagination, 
@@ -453,24 +672,103 @@ def investigacoes():
                          filtro_classificacao=filtro_classificacao,
                          filtro_ano=filtro_ano,
                          filtro_complexidade=filtro_complexidade,
+                         filtro_prazo=filtro_prazo,
+                         faixas_prazo=Investigacao.FAIXAS_PRAZO,
                          data_inicio=data_inicio,
                          data_fim=data_fim,
                          busca=busca,
                          ordenar_por=ordenar_por,
+                         incluir_arquivadas=incluir_arquivadas,
+                         arquivadas=arquivadas,
                          hoje=datetime.now().date())
 
 
 
+# ==================== VALIDADOR (ETAG) DAS PÁGINAS DE UMA INVESTIGAÇÃO ====================
+def validador_investigacao(id):
+    """Versão da investigação: alteração do registro, do histórico e dos anexos (1 consulta)"""
+    def agregado(funcao, modelo):
+        return db.session.query(funcao).filter(modelo.investigacao_id == id).scalar_subquery()
+
+    linha = db.session.query(
+        Investigacao.atualizado_em,
+        agregado(db.func.count(HistoricoDiligencia.id), HistoricoDiligencia),
+        agregado(db.func.max(HistoricoDiligencia.data), HistoricoDiligencia),
+        agregado(db.func.count(Anexo.id), Anexo),
+        agregado(db.func.max(Anexo.id), Anexo),
+        agregado(db.func.max(Anexo.data_upload), Anexo)
+    ).filter(Investigacao.id == id).first()
+    if linha is None:
+        return None  # A rota responde o 404
+    return list(linha)
+
+
+# ==================== INVESTIGAÇÃO PELO ID (INCLUSIVE ARQUIVADA) ====================
+def investigacao_ou_404(id, restaurar=False):
+    """Como Investigacao.query.get_or_404, mas também acha as arquivadas (ver arquivo.py):
+    lidas do arquivo (investigacao.arquivada) ou, com restaurar=True (rotas que gravam),
+    trazidas de volta às tabelas principais"""
+    investigacao = db.session.get(Investigacao, id)
+    if investigacao is None:
+        if restaurar and arquivo.restaurar(id):
+            investigacao = db.session.get(Investigacao, id)
+        else:
+            investigacao = arquivo.arquivada(id)
+    if investigacao is None:
+        abort(404)
+    return investigacao
+
+
+def anexo_ou_404(id):
+    """Anexo pelo id, inclusive de investigação arquivada (anexo.arquivada, somente leitura)"""
+    anexo = db.session.get(Anexo, id) or arquivo.anexo_arquivado(id)
+    if anexo is None:
+        abort(404)
+    return anexo
+
+
+def modelos_da_investigacao(id):
+    """Para a API: (Investigacao, HistoricoDiligencia, Anexo) das tabelas onde a investigação
+    está (principais ou, somente leitura, de arquivo)"""
+    if db.session.query(Investigacao.id).filter(Investigacao.id == id).first() is not None:
+        return arquivo.modelos(False)
+    if arquivo.arquivadas_entre([id]):
+        return arquivo.modelos(True)
+    raise ErroApi('Investigação não encontrada', 404)
+
+
+# Timeline dos detalhes: eventos renderizados com a página (o resto vem ao rolar)
+HISTORICO_INICIAL = 20
+
+TIPOS_HISTORICO = {
+    'criacao': 'Criação',
+    'diligencia': 'Diligência',
+    'edicao': 'Edição',
+    'status': 'Status',
+    'upload_anexo': 'Anexo enviado',
+    'exclusao_anexo': 'Anexo excluído',
+}
+
+
 # ==================== ROTA: DETALHES DA INVESTIGAÇÃO (CORRIGIDA!) ====================
 @app.route('/investigacoes/<int:id>')
+@resposta_condicional(validador_investigacao)
 def detalhes(id):
     if 'usuario' not in session:
         flash('Você precisa fazer login primeiro!', 'warning')
         return redirect(url_for('login'))
 
-    investigacao = Investigacao.query.get_or_404(id)
-    historico = HistoricoDiligencia.query.filter_by(investigacao_id=id).order_by(HistoricoDiligencia.data.desc()).all()
-    anexos = Anexo.query.filter_by(investigacao_id=id).order_by(Anexo.data_upload.desc()).all()
+    investigacao = investigacao_ou_404(id)
+    _, ModeloHistorico, ModeloAnexo = arquivo.modelos(investigacao.arquivada)
+    # Só os eventos mais recentes; a timeline busca os demais ao rolar (/api/investigacoes/<id>/historico)
+    historico, cursor_historico = pagina_historico(id, HISTORICO_INICIAL, modelo=ModeloHistorico)
+    tipos_historico = dict(
+        db.session.query(ModeloHistorico.tipo, db.func.count(ModeloHistorico.id))
+        .filter(ModeloHistorico.investigacao_id == id)
+        .group_by(ModeloHistorico.tipo).all()
+    )
+    anexos = db.session.query(ModeloAnexo).filter(ModeloAnexo.investigacao_id == id) \
+        .order_by(ModeloAnexo.data_upload.desc()).all()
 
     # Calcular dias restantes (SEM atribuir ao objeto)
     dias_restantes = None
@@ -484,6 +782,10 @@ def detalhes(id):
     return render_template('detalhes_investigacao.html',
                            investigacao=investigacao,
                            historico=historico,
+                           cursor_historico=cursor_historico,
+                           total_historico=sum(tipos_historico.values()),
+                           tipos_historico={t: n for t, n in tipos_historico.items() if t},
+                           rotulos_historico=TIPOS_HISTORICO,
                            anexos=anexos,
                            dias_restantes=dias_restantes,
                            esta_atrasado=esta_atrasado,
@@ -492,14 +794,19 @@ def detalhes(id):
 
 # ==================== ROTA DE IMPRESSÃO DA INVESTIGAÇÃO (CORRIGIDA!) ====================
 @app.route('/investigacoes/<int:id>/imprimir')
+@replica.somente_leitura
+@resposta_condicional(validador_investigacao)
 def imprimir_investigacao(id):
     if 'usuario' not in session:
         flash('Você precisa fazer login primeiro!', 'warning')
         return redirect(url_for('login'))
 
-    investigacao = Investigacao.query.get_or_404(id)
-    historico = HistoricoDiligencia.query.filter_by(investigacao_id=id).order_by(HistoricoDiligencia.data.desc()).all()
-    anexos = Anexo.query.filter_by(investigacao_id=id).order_by(Anexo.data_upload.desc()).all()
+    investigacao = investigacao_ou_404(id)
+    _, ModeloHistorico, ModeloAnexo = arquivo.modelos(investigacao.arquivada)
+    historico = db.session.query(ModeloHistorico).filter(ModeloHistorico.investigacao_id == id) \
+        .order_by(ModeloHistorico.data.desc()).all()
+    anexos = db.session.query(ModeloAnexo).filter(ModeloAnexo.investigacao_id == id) \
+        .order_by(ModeloAnexo.data_upload.desc()).all()
 
     # Calcular dias restantes (SEM atribuir ao objeto)
     dias_restantes = None
@@ -520,6 +827,7 @@ def imprimir_investigacao(id):
 
 # ==================== ROTA: EXPORTAR PDF (LAYOUT RESTAURADO - VERSÃO BOA) ====================
 @app.route('/investigacoes/<int:id>/exportar-pdf')
+@replica.somente_leitura
 def exportar_pdf_investigacao(id):
     if 'usuario' not in session:
         return redirect(url_for('login'))
@@ -535,8 +843,10 @@ def exportar_pdf_investigacao(id):
         from io import BytesIO
         from reportlab.lib.utils import ImageReader
 
-        investigacao = Investigacao.query.get_or_404(id)
-        anexos = Anexo.query.filter_by(investigacao_id=id).order_by(Anexo.data_upload.desc()).all()
+        investigacao = investigacao_ou_404(id)
+        _, _, ModeloAnexo = arquivo.modelos(investigacao.arquivada)
+        anexos = db.session.query(ModeloAnexo).filter(ModeloAnexo.investigacao_id == id) \
+            .order_by(ModeloAnexo.data_upload.desc()).all()
 
         buffer = BytesIO()
 
@@ -765,11 +1075,11 @@ def exportar_pdf_investigacao(id):
                 if hasattr(anexo, 'tamanho_bytes') and anexo.tamanho_bytes:
                      tamanho = f"{round(anexo.tamanho_bytes / 1024, 2)} KB"
                 else:
-                    # Tenta calcular pelo arquivo físico se não tiver no banco
+                    # Tenta calcular pelo arquivo armazenado se não tiver no banco
                     try:
-                        path = os.path.join(app.config['UPLOAD_FOLDER'], anexo.caminho_arquivo)
-                        if os.path.exists(path):
-                            size_kb = os.path.getsize(path) / 1024
+                        tamanho_arquivo = armazenamento.atual().tamanho(anexo.caminho_arquivo)
+                        if tamanho_arquivo is not None:
+                            size_kb = tamanho_arquivo / 1024
                             tamanho = f"{size_kb:.2f} KB"
                     except:
                         pass
@@ -833,7 +1143,7 @@ def upload_anexo(id):
         flash('Você não tem permissão para enviar anexos!', 'danger')
         return redirect(url_for('detalhes', id=id))
 
-    investigacao = Investigacao.query.get_or_404(id)
+    investigacao = investigacao_ou_404(id, restaurar=True)
 
     if 'file' not in request.files:
         flash('Nenhum arquivo selecionado!', 'warning')
@@ -846,22 +1156,25 @@ def upload_anexo(id):
         return redirect(url_for('detalhes', id=id))
 
     if file and allowed_file(file.filename):
+        chave = None
         try:
             filename = secure_filename(file.filename)
-            # Garante nome único para o arquivo no sistema de arquivos
-            unique_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(filepath)
-
-            # Obtém o tamanho do arquivo
-            tamanho_bytes = os.path.getsize(filepath)
+            tipo_mime = mimetypes.guess_type(filename)[0]
+            # Chave única (com subpastas) no armazenamento configurado;
+            # txt/doc/xls são guardados comprimidos (ver compressao_anexos.py)
+            chave = armazenamento.nova_chave(filename)
+            codificacao, tamanho_bytes, tamanho_armazenado = compressao_anexos.salvar(
+                armazenamento.atual(), chave, file.stream, tipo_mime)
 
             novo_anexo = Anexo(
                 investigacao_id=id,
                 nome_arquivo=filename,
-                caminho_arquivo=unique_filename, # Salva o nome único no banco
+                caminho_arquivo=chave, # Salva a chave do arquivo no banco
+                tipo_mime=tipo_mime,
                 usuario_upload=session.get('nome'),
-                tamanho_bytes=tamanho_bytes
+                tamanho_bytes=tamanho_bytes,
+                codificacao=codificacao,
+                tamanho_armazenado=tamanho_armazenado
             )
             db.session.add(novo_anexo)
 
@@ -877,6 +1190,9 @@ def upload_anexo(id):
             flash('Anexo enviado com sucesso!', 'success')
         except Exception as e:
             db.session.rollback()
+            # Sem o registro no banco, o arquivo gravado não serve para nada
+            if chave:
+                armazenamento.atual().remover(chave)
             flash(f'Erro ao enviar anexo: {str(e)}', 'danger')
             print(f"❌ Erro ao enviar anexo: {e}")
     else:
@@ -889,40 +1205,95 @@ def download_anexo(id):
     if 'usuario' not in session:
         return redirect(url_for('login'))
 
-    anexo = Anexo.query.get_or_404(id)
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], anexo.caminho_arquivo)
+    anexo = anexo_ou_404(id)
+    arquivos = armazenamento.atual()
 
-    if os.path.exists(filepath):
+    if arquivos.existe(anexo.caminho_arquivo):
         # Tenta adivinhar o mimetype
-        mimetype, _ = mimetypes.guess_type(filepath)
+        mimetype = anexo.tipo_mime or mimetypes.guess_type(anexo.nome_arquivo)[0]
         if mimetype is None:
             mimetype = 'application/octet-stream' # Tipo genérico se não conseguir adivinhar
 
-        return send_file(filepath, as_attachment=True, download_name=anexo.nome_arquivo, mimetype=mimetype)
+        return compressao_anexos.resposta(arquivos, anexo, mimetype)
     else:
         flash('Arquivo não encontrado!', 'danger')
         return redirect(url_for('detalhes', id=anexo.investigacao_id))
 
+def resposta_zip(anexos, nome_zip, agrupar=False):
+    """ZIP dos anexos gerado enquanto é enviado (ver zip_anexos.py)"""
+    metricas.incrementar('zip_anexos.downloads')
+    metricas.incrementar('zip_anexos.arquivos', len(anexos))
+    return Response(
+        stream_with_context(zip_anexos.gerar(armazenamento.atual(), anexos, agrupar=agrupar)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{nome_zip}"'},
+    )
+
+@app.route('/investigacoes/<int:id>/anexos.zip')
+@replica.somente_leitura
+def baixar_anexos_zip(id):
+    if 'usuario' not in session:
+        return redirect(url_for('login'))
+
+    investigacao = investigacao_ou_404(id)
+    _, _, ModeloAnexo = arquivo.modelos(investigacao.arquivada)
+    anexos = db.session.query(ModeloAnexo).filter(ModeloAnexo.investigacao_id == id) \
+        .order_by(ModeloAnexo.data_upload, ModeloAnexo.id).all()
+    if not anexos:
+        flash('Esta investigação não tem anexos.', 'warning')
+        return redirect(url_for('detalhes', id=id))
+
+    return resposta_zip(anexos, f"anexos_{zip_anexos.pasta_da_investigacao(investigacao)}.zip")
+
+@app.route('/investigacoes/anexos.zip')
+@replica.somente_leitura
+def baixar_anexos_filtrados_zip():
+    """Anexos de todas as investigações do filtro atual da lista, uma pasta por investigação"""
+    if 'usuario' not in session:
+        return redirect(url_for('login'))
+
+    alvo = filtrar_investigacoes(Investigacao.query, request.args).with_entities(Investigacao.id)
+    consulta = Anexo.query.filter(Anexo.investigacao_id.in_(alvo))
+    quantidade = consulta.count()
+    voltar = url_for('investigacoes') + ('?' + request.query_string.decode() if request.query_string else '')
+    if not quantidade:
+        flash('Nenhum anexo nas investigações filtradas.', 'warning')
+        return redirect(voltar)
+    if quantidade > zip_anexos.MAXIMO_ANEXOS:
+        flash(f'{quantidade} anexos: refine os filtros (máximo de {zip_anexos.MAXIMO_ANEXOS} por download).', 'warning')
+        return redirect(voltar)
+
+    anexos = consulta.options(db.joinedload(Anexo.investigacao)) \
+        .order_by(Anexo.investigacao_id, Anexo.data_upload, Anexo.id).all()
+    return resposta_zip(anexos, f"anexos_{datetime.now().strftime('%Y%m%d_%H%M')}.zip", agrupar=True)
+
 @app.route('/anexos/<int:id>/excluir', methods=['POST'])
 def excluir_anexo(id):
     if 'usuario' not in session:
         return redirect(url_for('login'))
+
+    anexo = anexo_ou_404(id)
+
     if session.get('nivel') not in ['admin', 'editor']: # Apenas admin/editor podem excluir
         flash('Acesso negado para excluir anexos!', 'danger')
         return redirect(url_for('detalhes', id=anexo.investigacao_id)) # Redireciona para a investigação do anexo
 
-    anexo = Anexo.query.get_or_404(id)
     investigacao_id = anexo.investigacao_id # Guarda o ID antes de excluir o anexo
     nome_arquivo = anexo.nome_arquivo # Guarda o nome para a mensagem
 
+    # Anexo de investigação arquivada: ela volta do arquivo antes da exclusão
+    if anexo.arquivada:
+        arquivo.restaurar(investigacao_id)
+        anexo = db.session.get(Anexo, id)
+        if anexo is None:
+            abort(404)
+
     try:
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], anexo.caminho_arquivo)
-        if os.path.exists(filepath):
-            os.remove(filepath) # Exclui o arquivo físico
+        # O arquivo físico é apagado em segundo plano, só depois do commit
+        exclusao_arquivos.agendar([anexo.caminho_arquivo])
 
         # Excluir registro do banco de dados
         db.session.delete(anexo)
-        db.session.commit()
 
         # Registrar no histórico
         historico = HistoricoDiligencia(
@@ -1018,6 +1389,92 @@ def nova_investigacao():
     return render_template('nova_investigacao.html', datetime=datetime)
 
 
+# ==================== AÇÕES EM LOTE (LISTA DE INVESTIGAÇÕES) ====================
+@app.route('/investigacoes/acoes-em-lote', methods=['POST'])
+def acoes_em_lote_investigacoes():
+    if 'usuario' not in session:
+        flash('Você precisa fazer login primeiro!', 'warning')
+        return redirect(url_for('login'))
+
+    # Volta para a lista com os mesmos filtros (vêm na query string)
+    voltar = url_for('investigacoes') + ('?' + request.query_string.decode() if request.query_string else '')
+
+    if session.get('nivel') not in ['admin', 'investigador']:
+        flash('Você não tem permissão para editar investigações!', 'danger')
+        return redirect(voltar)
+
+    # Selecionadas na página ou todas as do filtro atual (só as das tabelas principais:
+    # uma arquivada precisa ser aberta antes de ser alterada)
+    if request.form.get('escopo') == 'filtro':
+        alvo = filtrar_investigacoes(Investigacao.query, request.args).with_entities(Investigacao.id)
+    else:
+        ids = request.form.getlist('ids', type=int)
+        if not ids:
+            flash('Selecione ao menos uma investigação!', 'warning')
+            return redirect(voltar)
+        alvo = db.select(Investigacao.id).where(Investigacao.id.in_(ids))
+
+    acao = request.form.get('acao')
+    try:
+        alteradas = acoes_em_lote.aplicar(alvo, acao, request.form.get(f'valor_{acao}'), usuario=session.get('nome'))
+        if alteradas:
+            flash(f'{acoes_em_lote.ACOES[acao]}: {alteradas} investigação(ões) atualizada(s)!', 'success')
+        else:
+            flash('Nenhuma investigação precisou ser alterada.', 'info')
+    except ValueError as e:
+        flash(str(e), 'warning')
+    except Exception as e:
+        flash(f'Erro ao aplicar ação em lote: {str(e)}', 'danger')
+        print(f"❌ Erro na ação em lote: {e}")
+        import traceback
+        traceback.print_exc()
+
+    return redirect(voltar)
+
+
+# ==================== IMPORTAÇÃO DE INVESTIGAÇÕES (PLANILHA) ====================
+@app.route('/investigacoes/importar', methods=['GET', 'POST'])
+def importar_investigacoes():
+    if 'usuario' not in session:
+        flash('Você precisa fazer login primeiro!', 'warning')
+        return redirect(url_for('login'))
+
+    if session.get('nivel') not in ['admin', 'investigador']:
+        flash('Você não tem permissão para criar investigações!', 'danger')
+        return redirect(url_for('dashboard'))
+
+    resultado = None
+
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename.lower().endswith(('.csv', '.xlsx', '.xls')):
+            flash('Formato inválido! Use CSV (.csv) ou Excel (.xlsx)', 'danger')
+            return redirect(request.url)
+
+        try:
+            df = importacao.ler_planilha(file)
+            resultado = importacao.importar(df, usuario=session.get('nome'), origem=secure_filename(file.filename))
+
+            if resultado['importadas']:
+                flash(f"{resultado['importadas']} investigações importadas com sucesso!", 'success')
+            if resultado['erros']:
+                flash(f"{len(resultado['erros'])} linha(s) com erro não foram importadas.", 'warning')
+
+        except ValueError as e:
+            flash(f'Planilha inválida: {str(e)}', 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao processar arquivo: {str(e)}', 'danger')
+            print(f"❌ Erro ao importar investigações: {e}")
+            import traceback
+            traceback.print_exc()
+
+    return render_template('importar_investigacoes.html',
+                         resultado=resultado,
+                         colunas=importacao.COLUNAS,
+                         valores_permitidos=importacao.VALORES_PERMITIDOS)
+
+
 @app.route('/investigacoes/<int:id>/editar', methods=['GET', 'POST'])
 def editar_investigacao(id):
     if 'usuario' not in session:
@@ -1028,7 +1485,8 @@ def editar_investigacao(id):
         flash('Você não tem permissão para editar investigações!', 'danger')
         return redirect(url_for('detalhes', id=id))
 
-    investigacao = Investigacao.query.get_or_404(id)
+    # O formulário mostra a arquivada; salvar (POST) a traz de volta do arquivo
+    investigacao = investigacao_ou_404(id, restaurar=request.method == 'POST')
 
     if request.method == 'POST':
         try:
@@ -1162,7 +1620,7 @@ def adicionar_diligencia(id):
         flash('Você não tem permissão para adicionar diligências!', 'danger')
         return redirect(url_for('detalhes', id=id))
 
-    investigacao = Investigacao.query.get_or_404(id)
+    investigacao = investigacao_ou_404(id, restaurar=True)
 
     try:
         descricao = request.form.get('descricao', '').strip()
@@ -1269,6 +1727,21 @@ def adicionar_diligencia(id):
 #         return redirect(url_for('dashboard'))
 
 
+# ==================== MÉTRICAS DO PROCESSO (ADMIN) ====================
+@app.route('/admin/metricas')
+def admin_metricas():
+    if 'usuario' not in session or session.get('nivel') != 'admin':
+        return jsonify({'erro': 'Acesso negado'}), 403
+
+    dados = metricas.instantaneo()
+    originais = dados['contadores'].get('compressao.bytes_originais', 0)
+    enviados = dados['contadores'].get('compressao.bytes_enviados', 0)
+    dados['compressao_taxa'] = round(1 - enviados / originais, 3) if originais else None
+    dados['anexos_armazenamento'] = compressao_anexos.economia()
+    dados['autocomplete_taxa_acerto'] = busca_servidores.taxa_acerto()
+    return jsonify(dados)
+
+
 # ==================== ROTA DE GERENCIAMENTO DE USUÁRIOS ====================
 @app.route('/usuarios')
 def usuarios():
@@ -1280,6 +1753,9 @@ def usuarios():
         flash('Você não tem permissão para acessar essa página!', 'danger')
         return redirect(url_for('dashboard'))
 
+    # Garante que a coluna "último login" esteja atualizada
+    Usuario.descarregar_logins_pendentes(forcar=True)
+
     todos_usuarios = Usuario.query.order_by(Usuario.nome).all()
 
     return render_template('usuarios.html', usuarios=todos_usuarios)
@@ -1421,19 +1897,12 @@ def excluir_investigacao(id):
         return redirect(url_for('investigacoes'))
 
     try:
-        investigacao = Investigacao.query.get_or_404(id)
+        investigacao = investigacao_ou_404(id, restaurar=True)
         processo_gdoc = investigacao.processo_gdoc
 
-        # 1. PRIMEIRO: Excluir arquivos físicos dos anexos
-        anexos = Anexo.query.filter_by(investigacao_id=id).all()
-        for anexo in anexos:
-            caminho_completo = os.path.join(current_app.config['UPLOAD_FOLDER'], anexo.caminho_arquivo)
-            if os.path.exists(caminho_completo):
-                try:
-                    os.remove(caminho_completo)
-                    print(f"✅ Arquivo físico excluído: {caminho_completo}")
-                except Exception as e:
-                    print(f"⚠️ Erro ao excluir arquivo: {e}")
+        # 1. PRIMEIRO: Agendar a exclusão dos arquivos físicos (feita após o commit)
+        caminhos = db.session.query(Anexo.caminho_arquivo).filter_by(investigacao_id=id).all()
+        exclusao_arquivos.agendar([c for (c,) in caminhos])
 
         # 2. SEGUNDO: Excluir registros de anexos do banco
         Anexo.query.filter_by(investigacao_id=id).delete()
@@ -1523,6 +1992,7 @@ def importar_servidores():
                 if novos_servidores:
                     db.session.bulk_save_objects(novos_servidores)
                     db.session.commit()
+                    busca_servidores.invalidar()  # bulk_save_objects não passa pelos eventos da sessão
 
                 flash(f'{contador} servidores importados com sucesso!', 'success')
                 return redirect(url_for('dashboard'))
@@ -1545,36 +2015,352 @@ def importar_servidores():
 # @login_required  <-- MANTENHA COMENTADO POR ENQUANTO
 def buscar_servidor():
     try:
-        termo = request.args.get('q', '')
+        # Menos de 3 letras não busca nada; o resto vem do cache quando possível (ver busca_servidores.py)
+        return jsonify(busca_servidores.buscar(request.args.get('q', '')))
 
-        # Se digitar menos de 3 letras, não busca nada
-        if len(termo) < 3:
-            return jsonify([])
+    except Exception as e:
+        print(f"ERRO AO BUSCAR SERVIDOR: {e}")
+        return jsonify([])
 
-        # Busca no banco de dados (limite de 10 para não travar)
-        servidores = Servidor.query.filter(Servidor.nome.ilike(f'%{termo}%')).limit(10).all()
 
-        # Monta a lista de resultados
-        resultado = []
-        for s in servidores:
-            resultado.append({
-                'nome': s.nome,
-                'matricula': s.matricula,
-                'cargo': s.cargo,
-                'lotacao': s.lotacao
-            })
+# ==================== API JSON (SOMENTE LEITURA) ====================
+# Aceita os mesmos filtros da tela /investigacoes, paginação por cursor,
+# fields= (só as colunas pedidas saem do banco), ids= (busca em lote)
+# e ETag/304 a partir de atualizado_em.
+API_LIMITE_PADRAO = 50
+API_LIMITE_MAXIMO = 500
 
-        return jsonify(resultado)
+# Colunas do modelo + campos de prazo calculados no banco (propriedades híbridas)
+CAMPOS_API = [coluna.name for coluna in Investigacao.__table__.columns] + \
+    ['dias_restantes', 'esta_atrasado', 'alerta_prazo']
 
-    except Exception as e:
-        print(f"ERRO AO BUSCAR SERVIDOR: {e}")
-        return jsonify([])
+
+class ErroApi(Exception):
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.mensagem = mensagem
+        self.status = status
+
+
+@app.errorhandler(ErroApi)
+def tratar_erro_api(erro):
+    return jsonify({'erro': erro.mensagem}), erro.status
+
+
+def _valor_json(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f'Tipo não serializável: {type(valor).__name__}')
+
+
+def resposta_json(dados, etag=None):
+    """Serializa direto com json.dumps (sem passar por objetos ORM) e aplica o ETag"""
+    corpo = json.dumps(dados, ensure_ascii=False, separators=(',', ':'), default=_valor_json)
+    resposta = app.response_class(corpo, mimetype='application/json')
+    if etag:
+        resposta.set_etag(etag)
+        resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+
+def exigir_login_api():
+    if 'usuario' not in session:
+        raise ErroApi('Não autenticado', 401)
+
+
+def campos_solicitados():
+    """Lista de campos do parâmetro fields= (o id sempre vai junto, é usado no cursor)"""
+    fields = request.args.get('fields')
+    if not fields:
+        return list(CAMPOS_API)
+
+    campos = [c.strip() for c in fields.split(',') if c.strip()]
+    invalidos = [c for c in campos if c not in CAMPOS_API]
+    if invalidos:
+        raise ErroApi(f"Campos inválidos: {', '.join(invalidos)}")
+
+    if 'id' not in campos:
+        campos.insert(0, 'id')
+    return campos
+
+
+def limite_solicitado():
+    limite = request.args.get('limit', API_LIMITE_PADRAO, type=int)
+    return max(1, min(limite, API_LIMITE_MAXIMO))
+
+
+def codificar_cursor(ultimo_id):
+    return base64.urlsafe_b64encode(str(ultimo_id).encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ErroApi('Cursor inválido')
+
+
+def decodificar_cursor_historico(cursor):
+    """(data, id) do último evento da página anterior"""
+    try:
+        data, ultimo_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return datetime.fromisoformat(data), int(ultimo_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ErroApi('Cursor inválido')
+
+
+def pagina_historico(id, limite, tipo=None, cursor=None, modelo=HistoricoDiligencia):
+    """Eventos da investigação, do mais recente ao mais antigo (keyset em data, id), e o cursor da próxima página.
+    modelo: HistoricoDiligencia ou o do arquivo (arquivo.modelos)"""
+    query = db.session.query(modelo).filter(modelo.investigacao_id == id)
+    if tipo:
+        query = query.filter(modelo.tipo == tipo)
+    if cursor:
+        query = query.filter(db.tuple_(modelo.data, modelo.id) < decodificar_cursor_historico(cursor))
+
+    registros = query.order_by(modelo.data.desc(), modelo.id.desc()).limit(limite + 1).all()
+    if len(registros) <= limite:
+        return registros, None
+    ultimo = registros[limite - 1]
+    return registros[:limite], codificar_cursor(f'{ultimo.data.isoformat()}|{ultimo.id}')
+
+
+def ids_solicitados():
+    """ids=1,2,3 (busca em lote)"""
+    ids = request.args.get('ids')
+    if not ids:
+        return None
+    try:
+        lista = [int(i) for i in ids.split(',') if i.strip()]
+    except ValueError:
+        raise ErroApi('Parâmetro ids inválido')
+    if len(lista) > API_LIMITE_MAXIMO:
+        raise ErroApi(f'Máximo de {API_LIMITE_MAXIMO} ids por requisição')
+    return lista
+
+
+@app.route('/api/investigacoes')
+@replica.somente_leitura
+def api_investigacoes():
+    exigir_login_api()
+
+    campos = campos_solicitados()
+    limite = limite_solicitado()
+    cursor = request.args.get('cursor')
+
+    # arquivadas=1: também as investigações do arquivo (ver arquivo.py)
+    modelo = arquivo.com_arquivadas() if request.args.get('arquivadas') == '1' else Investigacao
+    query = filtrar_investigacoes(db.session.query(modelo), request.args, modelo)
+    ids = ids_solicitados()
+    if ids is not None:
+        query = query.filter(modelo.id.in_(ids))
+
+    # Validador: quantidade + última alteração do conjunto filtrado
+    total, ultima_alteracao = query.with_entities(
+        db.func.count(modelo.id), db.func.max(modelo.atualizado_em)
+    ).one()
+    etag = calcular_etag(total, ultima_alteracao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    # Paginação por cursor (keyset no id, do mais recente para o mais antigo)
+    if cursor:
+        query = query.filter(modelo.id < decodificar_cursor(cursor))
+
+    linhas = query.with_entities(*[getattr(modelo, c) for c in campos]) \
+        .order_by(modelo.id.desc()) \
+        .limit(limite + 1).all()
+
+    tem_mais = len(linhas) > limite
+    linhas = linhas[:limite]
+    dados = [dict(zip(campos, linha)) for linha in linhas]
+
+    return resposta_json({
+        'dados': dados,
+        'total': total,
+        'proximo_cursor': codificar_cursor(linhas[-1][0]) if tem_mais else None
+    }, etag)
+
+
+@app.route('/api/investigacoes/<int:id>')
+def api_investigacao(id):
+    exigir_login_api()
+
+    campos = campos_solicitados()
+
+    modelo, _, _ = modelos_da_investigacao(id)
+    atualizado_em = db.session.query(modelo.atualizado_em).filter(modelo.id == id).scalar()
+
+    etag = calcular_etag(id, atualizado_em)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    linha = db.session.query(*[getattr(modelo, c) for c in campos]).filter(modelo.id == id).one()
+    return resposta_json(dict(zip(campos, linha)), etag)
+
+
+@app.route('/api/investigacoes/<int:id>/historico')
+@replica.somente_leitura
+def api_investigacao_historico(id):
+    exigir_login_api()
+
+    _, modelo, _ = modelos_da_investigacao(id)
+
+    limite = limite_solicitado()
+    cursor = request.args.get('cursor')
+
+    query = db.session.query(modelo).filter(modelo.investigacao_id == id)
+    tipo = request.args.get('tipo')
+    if tipo:
+        query = query.filter(modelo.tipo == tipo)
+
+    total, ultimo_registro = query.with_entities(db.func.count(modelo.id), db.func.max(modelo.id)).one()
+    etag = calcular_etag(total, ultimo_registro)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    # Paginação por cursor (keyset em data/id, na ordem da timeline)
+    registros, proximo_cursor = pagina_historico(id, limite, tipo, cursor, modelo)
+
+    return resposta_json({
+        'dados': [h.to_dict() for h in registros],
+        'total': total,
+        'proximo_cursor': proximo_cursor
+    }, etag)
+
+
+@app.route('/api/investigacoes/<int:id>/anexos')
+def api_investigacao_anexos(id):
+    exigir_login_api()
+
+    _, _, modelo = modelos_da_investigacao(id)
+
+    query = db.session.query(modelo).filter(modelo.investigacao_id == id)
+    total, ultimo_upload, ultimo_id = query.with_entities(
+        db.func.count(modelo.id), db.func.max(modelo.data_upload), db.func.max(modelo.id)
+    ).one()
+    etag = calcular_etag(total, ultimo_upload, ultimo_id)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    dados = []
+    for anexo in query.order_by(modelo.data_upload.desc()).all():
+        item = anexo.to_dict()
+        item.pop('caminho_arquivo')  # Caminho interno do servidor não sai na API
+        item['download_url'] = url_for('download_anexo', id=anexo.id)
+        dados.append(item)
+
+    return resposta_json({'dados': dados, 'total': total}, etag)
+
+
+# ==================== POSSÍVEIS DUPLICIDADES (CADASTRO) ====================
+# Consultada pela tela de nova investigação enquanto o usuário preenche (POST: o
+# objeto pode ser longo demais para a URL). Ver duplicidade.py.
+@app.route('/api/investigacoes/similares', methods=['POST'])
+def api_investigacoes_similares():
+    exigir_login_api()
+
+    inicio = time.perf_counter()
+    encontrados = duplicidade.similares(
+        excluir_id=request.form.get('id', type=int),
+        **{campo: request.form.get(campo) for campo in duplicidade.CAMPOS}
+    )
+    notas = {item['id']: item['similaridade'] for item in encontrados}
+    # Inclui as arquivadas: a mesma denúncia pode ter sido apurada anos atrás
+    modelo = arquivo.com_arquivadas()
+    investigacoes_similares = db.session.query(modelo).filter(modelo.id.in_(notas)).all() if notas else []
+
+    lista = sorted((
+        {
+            'id': inv.id,
+            'similaridade': notas[inv.id],
+            'processo_gdoc': inv.processo_gdoc,
+            'assunto': inv.assunto,
+            'nome_denunciado': inv.nome_denunciado,
+            'canal': inv.canal,
+            'origem': inv.origem,
+            'status': inv.status,
+            'entrada_prfi': inv.entrada_prfi.isoformat() if inv.entrada_prfi else None,
+            'url': url_for('detalhes', id=inv.id),
+        }
+        for inv in investigacoes_similares
+    ), key=lambda item: (-item['similaridade'], -item['id']))
+
+    metricas.incrementar('duplicidade.consultas')
+    return jsonify({'similares': lista, 'tempo_ms': round((time.perf_counter() - inicio) * 1000, 1)})
+
+
+# ==================== EXPLORADOR DE TABELAS CRUZADAS ====================
+# A página monta a tabela no navegador com o JSON da API; o CSV usa os mesmos
+# parâmetros. Os dados vêm do retrato em memória (ver explorador.py).
+@app.route('/relatorios/explorador')
+def relatorio_explorador():
+    if 'usuario' not in session:
+        flash('Você precisa fazer login primeiro!', 'warning')
+        return redirect(url_for('login'))
+
+    return render_template('relatorio_explorador.html',
+                           dimensoes=explorador.DIMENSOES,
+                           medidas=explorador.MEDIDAS)
+
+
+@app.route('/api/explorador')
+def api_explorador():
+    exigir_login_api()
+
+    dimensoes = [d for d in request.args.get('dimensoes', 'responsavel,status').split(',') if d]
+    medida = request.args.get('medida', 'total')
+    # Filtros: filtro.<dimensão>=valor (pode repetir)
+    filtros = {
+        chave.split('.', 1)[1]: request.args.getlist(chave)
+        for chave in request.args if chave.startswith('filtro.')
+    }
+    try:
+        tabela = explorador.cruzar(dimensoes, medida, filtros)
+    except ValueError as e:
+        raise ErroApi(str(e))
+
+    if request.args.get('formato') == 'csv':
+        nome = f"cruzamento_{'_x_'.join(dimensoes)}_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
+        return Response(explorador.para_csv(tabela), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename="{nome}"'})
+
+    metricas.incrementar('explorador.consultas')
+    return resposta_json(explorador.para_json(tabela))
 
 
 # ISSO VAI FORÇAR A CRIAÇÃO DAS TABELAS NO RENDER
 with app.app_context():
     db.create_all()
 
+    # Fecha as conexões usadas na inicialização: com o gunicorn --preload este
+    # módulo roda no processo mestre e os workers não podem herdar conexões abertas
+    for engine in db.engines.values():
+        engine.dispose()
+
+
+# ==================== GRAVAR ÚLTIMOS LOGINS EM LOTE ====================
+# Depois de cada request, fora do login: só grava quando o LOGIN_FLUSH_INTERVAL venceu
+# e uma falha (banco travado etc.) não derruba a resposta.
+@app.after_request
+def gravar_logins_periodicamente(resposta):
+    Usuario.descarregar_logins_pendentes()
+    return resposta
+
+
+# Ao encerrar o processo grava o que restou
+@atexit.register
+def gravar_logins_pendentes():
+    with app.app_context():
+        try:
+            Usuario.descarregar_logins_pendentes(forcar=True)
+        except Exception as e:
+            print(f"⚠️ Erro ao gravar últimos logins: {e}")
+
 
 
 
@@ -0,0 +1,219 @@
+# ==================== ARMAZENAMENTO DOS ARQUIVOS DE ANEXOS ====================
+# As rotas não mexem direto na pasta de uploads; usam o backend configurado:
+#
+#   arquivos = armazenamento.atual()
+#   chave = armazenamento.nova_chave(filename)     # 'ab/cd/20250101120000_1a2b3c4d_oficio.pdf'
+#   arquivos.salvar(chave, file.stream)
+#   return arquivos.resposta(chave, nome_download, mimetype)
+#
+# A chave é o que fica em Anexo.caminho_arquivo.
+#
+# Backends (ARMAZENAMENTO no config.py):
+#   'local'  -> disco, em subpastas pelo hash do nome (evita pastas com milhares de
+#               arquivos). Chaves antigas, sem subpasta, continuam funcionando.
+#   's3'     -> bucket S3 ou compatível (MinIO...). Requer o pacote boto3.
+#   'memoria'-> S3 falso em memória (testes e desenvolvimento).
+#
+# Para mover os arquivos existentes: migrar_armazenamento.py
+import os
+import io
+import uuid
+import shutil
+import hashlib
+import posixpath
+from datetime import datetime, timezone
+from flask import current_app, send_file
+from werkzeug.utils import secure_filename
+
+
+def chave_fragmentada(nome):
+    """'oficio.pdf' -> 'ab/cd/oficio.pdf' (subpastas pelo hash do nome)"""
+    h = hashlib.sha1(nome.encode('utf-8')).hexdigest()
+    return f"{h[:2]}/{h[2:4]}/{nome}"
+
+
+def nova_chave(nome_arquivo):
+    """Chave única para um arquivo novo"""
+    nome = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}_{secure_filename(nome_arquivo)}"
+    return chave_fragmentada(nome)
+
+
+def esta_fragmentada(chave):
+    return chave == chave_fragmentada(posixpath.basename(chave))
+
+
+# ==================== DISCO LOCAL ====================
+class ArmazenamentoLocal:
+    nome = 'local'
+
+    def __init__(self, pasta):
+        self.pasta = os.path.abspath(pasta)
+        os.makedirs(self.pasta, exist_ok=True)
+
+    def caminho(self, chave):
+        caminho = os.path.normpath(os.path.join(self.pasta, *chave.split('/')))
+        if not caminho.startswith(self.pasta + os.sep):
+            raise ValueError(f'Chave inválida: {chave}')
+        return caminho
+
+    def salvar(self, chave, origem):
+        """Grava o conteúdo (objeto com read()) e retorna o tamanho em bytes"""
+        caminho = self.caminho(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = f"{caminho}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temporario, 'wb') as destino:
+            shutil.copyfileobj(origem, destino)
+        os.replace(temporario, caminho)  # Leitores nunca veem o arquivo pela metade
+        return os.path.getsize(caminho)
+
+    def abrir(self, chave):
+        return open(self.caminho(chave), 'rb')
+
+    def existe(self, chave):
+        return os.path.isfile(self.caminho(chave))
+
+    def tamanho(self, chave):
+        try:
+            return os.path.getsize(self.caminho(chave))
+        except OSError:
+            return None
+
+    def remover(self, chave):
+        """Apaga o arquivo (já ter sido apagado não é erro)"""
+        try:
+            os.remove(self.caminho(chave))
+        except FileNotFoundError:
+            pass
+
+    def listar(self):
+        """(chave, tamanho, modificado_em) de todos os arquivos, inclusive os antigos sem subpasta"""
+        for raiz, _, arquivos in os.walk(self.pasta):
+            for nome in arquivos:
+                if nome.endswith('.tmp'):
+                    continue
+                caminho = os.path.join(raiz, nome)
+                info = os.stat(caminho)
+                yield os.path.relpath(caminho, self.pasta).replace(os.sep, '/'), info.st_size, info.st_mtime
+
+    def resposta(self, chave, nome_download, mimetype):
+        return send_file(self.caminho(chave), as_attachment=True, download_name=nome_download, mimetype=mimetype)
+
+
+# ==================== S3 (OU COMPATÍVEL) ====================
+def _nao_encontrado(erro):
+    codigo = getattr(erro, 'response', {}).get('Error', {}).get('Code')
+    return codigo in ('404', 'NoSuchKey', 'NotFound')
+
+
+class ArmazenamentoS3:
+    nome = 's3'
+
+    def __init__(self, bucket, prefixo='', cliente=None, endpoint_url=None):
+        if cliente is None:
+            import boto3  # Dependência opcional: só exigida com ARMAZENAMENTO='s3'
+            cliente = boto3.client('s3', endpoint_url=endpoint_url or None)
+        self.cliente = cliente
+        self.bucket = bucket
+        self.prefixo = prefixo.strip('/') + '/' if prefixo.strip('/') else ''
+
+    def _objeto(self, chave):
+        return self.prefixo + chave
+
+    def salvar(self, chave, origem):
+        conteudo = origem.read()
+        self.cliente.put_object(Bucket=self.bucket, Key=self._objeto(chave), Body=conteudo)
+        return len(conteudo)
+
+    def abrir(self, chave):
+        return self.cliente.get_object(Bucket=self.bucket, Key=self._objeto(chave))['Body']
+
+    def tamanho(self, chave):
+        try:
+            return self.cliente.head_object(Bucket=self.bucket, Key=self._objeto(chave))['ContentLength']
+        except Exception as e:
+            if _nao_encontrado(e):
+                return None
+            raise
+
+    def existe(self, chave):
+        return self.tamanho(chave) is not None
+
+    def remover(self, chave):
+        self.cliente.delete_object(Bucket=self.bucket, Key=self._objeto(chave))
+
+    def listar(self):
+        paginas = self.cliente.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=self.prefixo)
+        for pagina in paginas:
+            for objeto in pagina.get('Contents', []):
+                yield objeto['Key'][len(self.prefixo):], objeto['Size'], objeto['LastModified'].timestamp()
+
+    def resposta(self, chave, nome_download, mimetype):
+        # Passa pelo app (mantém o controle de acesso da rota)
+        return send_file(self.abrir(chave), as_attachment=True, download_name=nome_download, mimetype=mimetype)
+
+
+class ErroS3Memoria(Exception):
+    def __init__(self, codigo):
+        super().__init__(codigo)
+        self.response = {'Error': {'Code': codigo}}
+
+
+class ClienteS3Memoria:
+    """Imitação em memória da parte do cliente boto3 usada acima (testes/desenvolvimento)"""
+
+    def __init__(self):
+        self.objetos = {}
+
+    def put_object(self, Bucket, Key, Body):
+        conteudo = Body.read() if hasattr(Body, 'read') else bytes(Body)
+        self.objetos[(Bucket, Key)] = (conteudo, datetime.now(timezone.utc))
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objetos:
+            raise ErroS3Memoria('NoSuchKey')
+        conteudo = self.objetos[(Bucket, Key)][0]
+        return {'Body': io.BytesIO(conteudo), 'ContentLength': len(conteudo)}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objetos:
+            raise ErroS3Memoria('404')
+        return {'ContentLength': len(self.objetos[(Bucket, Key)][0])}
+
+    def delete_object(self, Bucket, Key):
+        self.objetos.pop((Bucket, Key), None)
+
+    def get_paginator(self, operacao):
+        cliente = self
+
+        class Paginador:
+            def paginate(self, Bucket, Prefix=''):
+                yield {'Contents': [
+                    {'Key': chave, 'Size': len(conteudo), 'LastModified': data}
+                    for (bucket, chave), (conteudo, data) in sorted(cliente.objetos.items())
+                    if bucket == Bucket and chave.startswith(Prefix)
+                ]}
+
+        return Paginador()
+
+
+# ==================== CONFIGURAÇÃO ====================
+def criar(config, tipo=None):
+    """Backend a partir do config (ARMAZENAMENTO, UPLOAD_FOLDER, S3_*)"""
+    tipo = tipo or config.get('ARMAZENAMENTO', 'local')
+    if tipo == 'local':
+        return ArmazenamentoLocal(config['UPLOAD_FOLDER'])
+    if tipo == 's3':
+        return ArmazenamentoS3(config['S3_BUCKET'], config.get('S3_PREFIXO', ''),
+                               endpoint_url=config.get('S3_ENDPOINT_URL'))
+    if tipo == 'memoria':
+        return ArmazenamentoS3('memoria', config.get('S3_PREFIXO', ''), cliente=ClienteS3Memoria())
+    raise ValueError(f'ARMAZENAMENTO desconhecido: {tipo}')
+
+
+def atual():
+    """Backend do app em execução"""
+    return current_app.extensions['armazenamento']
+
+
+def registrar(app):
+    app.extensions['armazenamento'] = criar(app.config)
@@ -0,0 +1,26 @@
+# arquivar.py
+# Move para o arquivo as investigações concluídas há mais de ARQUIVO_IDADE_DIAS
+# (com histórico e anexos), em lotes de ARQUIVO_LOTE. Ver arquivo.py.
+#
+# Uso:
+#   python arquivar.py               -> arquiva
+#   python arquivar.py --simular     -> só conta quantas seriam arquivadas
+#
+# Sugestão de agendamento (cron), semanal:
+#   30 3 * * 0 cd /caminho/do/sistema && python arquivar.py
+import sys
+from app import app
+from models import db, Investigacao
+import arquivo
+
+with app.app_context():
+    limite = arquivo.data_limite()
+    print(f"📦 Arquivando investigações concluídas antes de {limite.strftime('%d/%m/%Y')}...")
+
+    if '--simular' in sys.argv:
+        quantidade = Investigacao.query.filter(
+            Investigacao.status == 'Concluída', Investigacao.data_conclusao < limite).count()
+        print(f"   {quantidade} investigação(ões) seriam arquivadas.")
+    else:
+        arquivadas = arquivo.arquivar(limite=limite)
+        print(f"✅ {arquivadas} investigação(ões) arquivada(s). No arquivo: {arquivo.total_arquivadas()}")
@@ -0,0 +1,192 @@
+# ==================== ARQUIVO DAS INVESTIGAÇÕES CONCLUÍDAS ====================
+# Quase todo o uso diário é de investigações em andamento. As concluídas há mais de
+# ARQUIVO_IDADE_DIAS (e nunca no ano corrente, que conta na carga de trabalho) vão,
+# com histórico e anexos, para as tabelas *_arquivo (models.py), em lotes:
+#
+#   python arquivar.py          (agendar, ex. semanal)
+#
+# Dashboard, alertas, carga e a lista de investigações leem só as tabelas principais.
+# A lista tem a opção "Incluir arquivadas" (com_arquivadas()); os relatórios
+# (gráficos, tendências, explorador, reincidência, histórico do servidor) leem as duas
+# tabelas com uniao().
+#
+# Consultar uma investigação arquivada (detalhes, impressão, PDF, anexos, API) lê as
+# tabelas de arquivo, sem gravar nada: modelos(True) e arquivada(id). Só as rotas que
+# gravam (editar/reabrir, diligência, anexar, excluir) a trazem de volta com
+# restaurar(id). Se continuar concluída, ela volta ao arquivo no próximo arquivamento.
+#
+# Os arquivos dos anexos ficam onde estão. O índice de duplicidades e o resumo mensal
+# não mudam: as assinaturas das arquivadas continuam valendo e o tendencias.py lê as
+# duas tabelas.
+#
+# No SQLite as tabelas principais usam AUTOINCREMENT: um id arquivado nunca vai para
+# uma investigação nova. Bancos criados antes disso: rode o migrar_banco.py.
+from datetime import datetime, date, timedelta
+from flask import current_app
+from sqlalchemy import select, insert, delete, func, union_all, literal, text
+from sqlalchemy.orm import aliased
+from models import db, Investigacao, HistoricoDiligencia, Anexo, \
+    investigacoes_arquivo, historico_arquivo, anexos_arquivo
+from cache_fragmentos import fragmentos
+import cache_fragmentos
+import metricas
+
+MODELOS = (Investigacao, HistoricoDiligencia, Anexo)
+
+# (tabela principal, tabela de arquivo, coluna com o id da investigação), na ordem de MODELOS
+TABELAS = (
+    (Investigacao.__table__, investigacoes_arquivo, 'id'),
+    (HistoricoDiligencia.__table__, historico_arquivo, 'investigacao_id'),
+    (Anexo.__table__, anexos_arquivo, 'investigacao_id'),
+)
+
+TOTAL_TTL = 300
+
+
+# ==================== LEITURA DAS DUAS TABELAS ====================
+def uniao(*campos):
+    """Subquery com os campos (ou todos) das investigações principais e arquivadas"""
+    campos = campos or [c.name for c in Investigacao.__table__.columns]
+    return union_all(
+        select(*[Investigacao.__table__.c[campo] for campo in campos]),
+        select(*[investigacoes_arquivo.c[campo] for campo in campos]),
+    ).subquery('investigacoes_e_arquivo')
+
+
+def com_arquivadas():
+    """Investigacao lida das duas tabelas: query(), filtros e ordenação como de costume"""
+    return aliased(Investigacao, uniao())
+
+
+def total_arquivadas():
+    """Quantidade no arquivo (todas concluídas), guardada até a próxima escrita"""
+    def contar():
+        return db.session.query(func.count()).select_from(investigacoes_arquivo).scalar()
+    return fragmentos.obter_ou_calcular(('investigacoes:arquivadas',), TOTAL_TTL, contar)
+
+
+def arquivadas_entre(ids):
+    """Quais dos ids estão no arquivo"""
+    if not ids:
+        return set()
+    return {id_ for (id_,) in db.session.execute(
+        select(investigacoes_arquivo.c.id).where(investigacoes_arquivo.c.id.in_(ids)))}
+
+
+# ==================== LEITURA DE UMA INVESTIGAÇÃO ARQUIVADA ====================
+def _do_arquivo(modelo, tabela):
+    colunas = [tabela.c[c.name] for c in modelo.__table__.columns]
+    return aliased(modelo, select(*colunas).subquery(), adapt_on_names=True)
+
+
+def modelos(arquivada):
+    """(Investigacao, HistoricoDiligencia, Anexo) lidos das tabelas principais ou, para uma
+    investigação arquivada, das tabelas de arquivo (somente leitura)"""
+    if not arquivada:
+        return MODELOS
+    return tuple(_do_arquivo(modelo, tabela) for modelo, (_, tabela, _) in zip(MODELOS, TABELAS))
+
+
+def _ler_do_arquivo(modelo, id):
+    do_arquivo = modelos(True)[MODELOS.index(modelo)]
+    objeto = db.session.query(do_arquivo).filter(do_arquivo.id == id).first()
+    if objeto is not None:
+        objeto.arquivada = True
+    return objeto
+
+
+def arquivada(id):
+    """A investigação do arquivo (não altere nem grave o objeto), ou None"""
+    return _ler_do_arquivo(Investigacao, id)
+
+
+def anexo_arquivado(id):
+    """O anexo de uma investigação arquivada (somente leitura), ou None"""
+    return _ler_do_arquivo(Anexo, id)
+
+
+# ==================== MOVIMENTAÇÃO ====================
+def _mover(conexao, ids, para_o_arquivo, **extras):
+    """INSERT ... SELECT das linhas das investigações no destino, depois DELETE na origem
+    (investigação antes dos filhos ao inserir; filhos antes da investigação ao apagar)"""
+    for principal, arquivo, coluna in TABELAS:
+        origem, destino = (principal, arquivo) if para_o_arquivo else (arquivo, principal)
+        colunas = [c.name for c in principal.columns]
+        valores = {nome: valor for nome, valor in extras.items() if nome in destino.c}
+        consulta = select(*[origem.c[nome] for nome in colunas],
+                          *[literal(valor, destino.c[nome].type) for nome, valor in valores.items()]) \
+            .where(origem.c[coluna].in_(ids))
+        conexao.execute(insert(destino).from_select([*colunas, *valores], consulta))
+
+    for principal, arquivo, coluna in reversed(TABELAS):
+        origem = principal if para_o_arquivo else arquivo
+        conexao.execute(delete(origem).where(origem.c[coluna].in_(ids)))
+
+
+def data_limite(hoje=None):
+    """Concluídas antes desta data podem ir para o arquivo"""
+    hoje = hoje or date.today()
+    idade = current_app.config.get('ARQUIVO_IDADE_DIAS', 730)
+    return min(hoje - timedelta(days=idade), hoje.replace(month=1, day=1))
+
+
+def _candidatas(conexao, limite, lote):
+    consulta = select(Investigacao.id).where(
+        Investigacao.status == 'Concluída', Investigacao.data_conclusao < limite,
+    ).order_by(Investigacao.id).limit(lote).with_for_update(skip_locked=True)
+    return [id_ for (id_,) in conexao.execute(consulta)]
+
+
+def ids_sem_reaproveitamento(conexao):
+    """No SQLite só com AUTOINCREMENT um id arquivado não volta para uma investigação nova
+    (sem ele, apagar a de maior id libera os ids abaixo). PostgreSQL usa sequências"""
+    if conexao.dialect.name != 'sqlite':
+        return True
+    sql = text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :nome")
+    return all('AUTOINCREMENT' in (conexao.execute(sql, {'nome': principal.name}).scalar() or '').upper()
+               for principal, _, _ in TABELAS)
+
+
+def arquivar(lote=None, limite=None):
+    """Move as concluídas antigas para o arquivo, um commit por lote. Devolve quantas foram"""
+    lote = lote or current_app.config.get('ARQUIVO_LOTE', 500)
+    limite = limite or data_limite()
+    total = 0
+    if not ids_sem_reaproveitamento(db.session.connection()):
+        db.session.rollback()
+        raise RuntimeError('Tabelas sem AUTOINCREMENT: rode python migrar_banco.py antes de arquivar')
+
+    while True:
+        conexao = db.session.connection()
+        ids = _candidatas(conexao, limite, lote)
+        if not ids:
+            break
+        _mover(conexao, ids, para_o_arquivo=True, arquivada_em=datetime.utcnow())
+        db.session.commit()
+        total += len(ids)
+        metricas.incrementar('arquivo.arquivadas', len(ids))
+
+    db.session.rollback()
+    if total:
+        cache_fragmentos.invalidar('investigacoes')
+    return total
+
+
+def restaurar(id):
+    """Traz a investigação arquivada de volta e grava. False se ela não estava no arquivo"""
+    conexao = db.session.connection()
+    encontrada = conexao.execute(
+        select(investigacoes_arquivo.c.id).where(investigacoes_arquivo.c.id == id).with_for_update()
+    ).first()
+    if encontrada is None:
+        return False
+
+    _mover(conexao, [id], para_o_arquivo=False)
+    # Escrita pelo Core: avisa o replica.py (quem restaurou lê do principal em seguida)
+    db.session.info['houve_escrita'] = True
+    db.session.commit()
+
+    metricas.incrementar('arquivo.restauradas')
+    cache_fragmentos.invalidar('investigacoes')
+    return True
+
@@ -0,0 +1,110 @@
+# ==================== ASSETS DO FRONT-END (SEM DEPENDER DE CDN) ====================
+# As bibliotecas ficam versionadas em static/vendor (ver static/vendor/LEIA-ME.txt) e
+# são agrupadas em pacotes com hash no nome em static/dist pelo build_assets.py, que
+# roda offline (o Procfile gera os pacotes antes de subir o gunicorn). Nos templates:
+#
+#   {{ incluir_css('app.css') }}   {{ incluir_js('app.js') }}
+#
+# Pacote não gerado é erro (a página avisa para rodar o build_assets.py). Só com
+# ASSETS_CDN=1 (desenvolvimento com internet) os helpers usam as CDNs no lugar.
+import os
+import json
+import mimetypes
+from flask import url_for, send_file, request, abort, current_app
+from markupsafe import Markup
+from werkzeug.security import safe_join
+
+PASTA_STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+PASTA_VENDOR = os.path.join(PASTA_STATIC, 'vendor')
+PASTA_DIST = os.path.join(PASTA_STATIC, 'dist')
+ARQUIVO_MANIFESTO = os.path.join(PASTA_DIST, 'manifest.json')
+
+# Bibliotecas de terceiros (versões fixas): arquivo em static/vendor -> origem
+BIBLIOTECAS = {
+    'jquery-ui.css': 'https://code.jquery.com/ui/1.13.2/themes/base/jquery-ui.css',
+    'bootstrap.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css',
+    'bootstrap-icons.css': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.css',
+    'jquery.js': 'https://code.jquery.com/jquery-3.6.0.min.js',
+    'jquery-ui.js': 'https://code.jquery.com/ui/1.13.2/jquery-ui.min.js',
+    'bootstrap.bundle.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js',
+    'chart.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js',
+}
+
+# Pacotes gerados em static/dist: nome lógico -> bibliotecas (na ordem de carregamento)
+PACOTES = {
+    'app.css': ['jquery-ui.css', 'bootstrap.css', 'bootstrap-icons.css'],      # base.html
+    'app.js': ['jquery.js', 'jquery-ui.js', 'bootstrap.bundle.js'],            # base.html
+    'bootstrap.css': ['bootstrap.css', 'bootstrap-icons.css'],                 # login / impressão
+    'bootstrap.js': ['bootstrap.bundle.js'],                                   # login / impressão
+    'graficos.js': ['chart.js'],                                               # dashboard / relatórios
+}
+
+# Arquivos com hash no nome nunca mudam: cache de 1 ano
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+
+_manifesto = {}
+
+
+def carregar_manifesto():
+    """Lê o static/dist/manifest.json (nome lógico -> arquivo com hash)"""
+    global _manifesto
+    try:
+        with open(ARQUIVO_MANIFESTO, encoding='utf-8') as f:
+            _manifesto = json.load(f)
+    except (OSError, ValueError):
+        _manifesto = {}
+    return _manifesto
+
+
+def url_asset(nome):
+    """URL do pacote gerado (ou None se ainda não foi gerado)"""
+    arquivo = _manifesto.get(nome)
+    return url_for('asset', arquivo=arquivo) if arquivo else None
+
+
+def _urls(nome):
+    url = url_asset(nome)
+    if url:
+        return [url]
+    if current_app.config.get('ASSETS_CDN'):
+        return [BIBLIOTECAS[b] for b in PACOTES[nome]]
+    raise RuntimeError(f"Pacote '{nome}' não gerado: rode python build_assets.py e reinicie a aplicação")
+
+
+def incluir_css(nome):
+    return Markup(''.join(f'<link rel="stylesheet" href="{u}">' for u in _urls(nome)))
+
+
+def incluir_js(nome):
+    return Markup(''.join(f'<script src="{u}"></script>' for u in _urls(nome)))
+
+
+def servir_asset(arquivo):
+    """Serve static/dist com cache imutável e variante .br/.gz pré-comprimida"""
+    caminho = safe_join(PASTA_DIST, arquivo)
+    if caminho is None or not os.path.isfile(caminho) or arquivo == 'manifest.json':
+        abort(404)
+
+    mimetype = mimetypes.guess_type(caminho)[0] or 'application/octet-stream'
+    codificacao = None
+    for nome_codificacao, extensao in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[nome_codificacao] and os.path.isfile(caminho + extensao):
+            caminho += extensao
+            codificacao = nome_codificacao
+            break
+
+    resposta = send_file(caminho, mimetype=mimetype, conditional=True)
+    if codificacao:
+        resposta.headers['Content-Encoding'] = codificacao
+    resposta.headers['Vary'] = 'Accept-Encoding'
+    resposta.headers['Cache-Control'] = CACHE_IMUTAVEL
+    return resposta
+
+
+def registrar(app):
+    """Registra a rota /assets e os helpers dos templates"""
+    faltando = [nome for nome in PACOTES if nome not in carregar_manifesto()]
+    if faltando and not app.config.get('ASSETS_CDN'):
+        app.logger.error(f"Pacotes de assets não gerados ({', '.join(faltando)}): rode python build_assets.py")
+    app.add_url_rule('/assets/<path:arquivo>', 'asset', servir_asset)
+    app.jinja_env.globals.update(incluir_css=incluir_css, incluir_js=incluir_js)
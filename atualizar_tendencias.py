@@ -0,0 +1,33 @@
+# atualizar_tendencias.py
+# Recalcula no resumo mensal (resumos_mensais) os meses alterados desde a última
+# execução. Ver tendencias.py. A tela de tendências só lê o resumo.
+#
+# Uso:
+#   python atualizar_tendencias.py                -> recalcula os meses pendentes
+#   python atualizar_tendencias.py --reconstruir  -> apaga e recalcula o resumo inteiro
+#
+# Sugestão de agendamento (cron), a cada 10 minutos (uma execução por vez):
+#   */10 * * * * cd /caminho/do/sistema && flock -n /tmp/tendencias.lock python atualizar_tendencias.py
+import sys
+from sqlalchemy.exc import IntegrityError
+from app import app
+from models import db
+import tendencias
+
+with app.app_context():
+    if '--reconstruir' in sys.argv:
+        print("📊 Reconstruindo o resumo mensal...")
+        meses = tendencias.reconstruir()
+        print(f"✅ Resumo reconstruído: {meses} mês(es) calculado(s).")
+        sys.exit(0)
+
+    try:
+        meses = tendencias.atualizar()
+        db.session.commit()
+    except IntegrityError:
+        # Outra execução recalculou os mesmos meses ao mesmo tempo
+        db.session.rollback()
+        print("⚠️ Outra atualização em andamento; os meses pendentes ficam para a próxima execução.")
+        sys.exit(1)
+
+    print(f"✅ {meses} mês(es) recalculado(s) no resumo mensal.")
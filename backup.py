@@ -0,0 +1,320 @@
+# backup.py
+# Backup do banco e dos anexos com o sistema no ar, e restauração verificada.
+#
+# Uso:
+#   python backup.py                                -> novo backup em BACKUP_FOLDER/AAAAMMDD-HHMMSS
+#   python backup.py --verificar [NOME]             -> confere o backup (padrão: o mais recente)
+#   python backup.py --restaurar NOME --confirmar   -> restaura banco e anexos (pare o sistema antes)
+#   python backup.py --listar
+#
+# Banco: SQLite pela API de backup online (cópia em passos de PAGINAS_POR_PASSO páginas,
+# sem travar quem grava); PostgreSQL com pg_dump -Fc, que lê um retrato consistente
+# sem bloquear ninguém.
+#
+# Anexos (pasta de uploads ou bucket): cada backup tem a pasta anexos/ completa, mas só
+# os arquivos novos ou alterados desde o backup anterior são copiados; os demais viram
+# hard links para a cópia do backup anterior e não ocupam espaço. O manifesto.json guarda
+# tamanho, data e sha256 de cada arquivo e do banco. Os anexos são lidos antes e depois
+# do banco: todo anexo registrado no banco copiado está no backup.
+#
+# O backup é montado em NOME.parcial e só ganha o nome final quando termina; ficam os
+# BACKUP_MANTER mais recentes.
+#
+# Sugestão de agendamento (cron), diário:
+#   0 2 * * * cd /caminho/do/sistema && python backup.py && python backup.py --verificar
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import subprocess
+from contextlib import closing
+from datetime import datetime
+from app import app
+from models import db
+import armazenamento
+
+PAGINAS_POR_PASSO = 1024     # Páginas do SQLite copiadas por vez (4 MB com páginas de 4 KB)
+PAUSA_ENTRE_PASSOS = 0.005   # Segundos livres para os outros gravarem entre os passos
+MANIFESTO = 'manifesto.json'
+PASTA_ANEXOS = 'anexos'
+
+
+def _sha256(caminho):
+    resumo = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+class _LeitorComHash:
+    """Calcula o sha256 enquanto o conteúdo é copiado"""
+
+    def __init__(self, origem):
+        self.origem = origem
+        self.resumo = hashlib.sha256()
+
+    def read(self, tamanho=-1):
+        dados = self.origem.read(tamanho)
+        self.resumo.update(dados)
+        return dados
+
+
+def backups(pasta):
+    """Nomes dos backups completos, do mais antigo ao mais recente"""
+    if not os.path.isdir(pasta):
+        return []
+    return sorted(nome for nome in os.listdir(pasta)
+                  if os.path.isfile(os.path.join(pasta, nome, MANIFESTO)))
+
+
+def ler_manifesto(caminho):
+    with open(os.path.join(caminho, MANIFESTO), encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+
+# ==================== BANCO ====================
+def _url_postgres():
+    """URL para pg_dump/pg_restore (sem o driver) e a senha, passada por PGPASSWORD"""
+    url = db.engine.url
+    return url.set(drivername='postgresql', password=None).render_as_string(hide_password=False), url.password
+
+
+def _executar(comando, senha):
+    ambiente = {**os.environ, 'PGPASSWORD': senha} if senha else None
+    return subprocess.run(comando, env=ambiente, capture_output=True, text=True)
+
+
+def copiar_banco(destino):
+    """Retrato consistente do banco em destino/; retorna a entrada do manifesto"""
+    dialeto = db.engine.dialect.name
+    if dialeto == 'sqlite':
+        arquivo = os.path.join(destino, 'banco.db')
+        with closing(sqlite3.connect(db.engine.url.database)) as fonte, closing(sqlite3.connect(arquivo)) as copia:
+            fonte.backup(copia, pages=PAGINAS_POR_PASSO, sleep=PAUSA_ENTRE_PASSOS)
+    elif dialeto == 'postgresql':
+        arquivo = os.path.join(destino, 'banco.dump')
+        url, senha = _url_postgres()
+        resultado = _executar(['pg_dump', '--format=custom', '--no-owner', '--file', arquivo, '--dbname', url], senha)
+        if resultado.returncode != 0:
+            raise RuntimeError(f'pg_dump falhou: {resultado.stderr.strip()}')
+    else:
+        raise RuntimeError(f'Banco sem suporte a backup: {dialeto}')
+
+    return {'tipo': dialeto, 'arquivo': os.path.basename(arquivo),
+            'tamanho': os.path.getsize(arquivo), 'sha256': _sha256(arquivo)}
+
+
+def restaurar_banco(caminho, banco):
+    arquivo = os.path.join(caminho, banco['arquivo'])
+    dialeto = db.engine.dialect.name
+    if dialeto != banco['tipo']:
+        raise RuntimeError(f"O backup é de {banco['tipo']} e o sistema usa {dialeto}")
+
+    db.session.remove()
+    db.engine.dispose()
+    if dialeto == 'sqlite':
+        # A API de backup no sentido inverso substitui o conteúdo com o banco travado
+        with closing(sqlite3.connect(arquivo)) as fonte, closing(sqlite3.connect(db.engine.url.database)) as destino:
+            fonte.backup(destino)
+    else:
+        url, senha = _url_postgres()
+        resultado = _executar(['pg_restore', '--clean', '--if-exists', '--no-owner', '--single-transaction',
+                               '--dbname', url, arquivo], senha)
+        if resultado.returncode != 0:
+            raise RuntimeError(f'pg_restore falhou: {resultado.stderr.strip()}')
+
+
+def _verificar_banco(caminho, banco, problemas):
+    """Confere o arquivo e devolve as chaves de anexos registradas nele (None se não der para ler)"""
+    arquivo = os.path.join(caminho, banco['arquivo'])
+    if not os.path.isfile(arquivo) or _sha256(arquivo) != banco['sha256']:
+        problemas.append(f"Banco: {banco['arquivo']} ausente ou alterado")
+        return None
+
+    if banco['tipo'] == 'postgresql':
+        resultado = subprocess.run(['pg_restore', '--list', arquivo], capture_output=True, text=True)
+        if resultado.returncode != 0:
+            problemas.append(f'Banco: pg_restore --list falhou: {resultado.stderr.strip()}')
+        return None
+
+    with closing(sqlite3.connect(f'file:{arquivo}?mode=ro', uri=True)) as conexao:
+        integridade = conexao.execute('PRAGMA integrity_check').fetchone()[0]
+        if integridade != 'ok':
+            problemas.append(f'Banco: integrity_check -> {integridade}')
+            return None
+        tabelas = {nome for (nome,) in conexao.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        # Anexos das investigações arquivadas também (ver arquivo.py)
+        return {chave for tabela in ('anexos', 'anexos_arquivo') if tabela in tabelas
+                for (chave,) in conexao.execute(f'SELECT caminho_arquivo FROM {tabela}')}
+
+
+# ==================== ANEXOS ====================
+def copiar_anexos(backend, destino, manifesto, anterior=None):
+    """Copia para destino/anexos os arquivos ainda fora do manifesto; iguais aos do backup
+    anterior (mesmo tamanho e data) viram hard links. Retorna (copiados, ligados)"""
+    copia = armazenamento.ArmazenamentoLocal(os.path.join(destino, PASTA_ANEXOS))
+    antigos = ler_manifesto(anterior)['anexos'] if anterior else {}
+    copia_anterior = armazenamento.ArmazenamentoLocal(os.path.join(anterior, PASTA_ANEXOS)) if anterior else None
+    copiados = ligados = 0
+
+    for chave, tamanho, modificado_em in backend.listar():
+        if chave in manifesto:
+            continue
+        antigo = antigos.get(chave)
+        if antigo and antigo['tamanho'] == tamanho and antigo['modificado_em'] == modificado_em:
+            caminho = copia.caminho(chave)
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            try:
+                os.link(copia_anterior.caminho(chave), caminho)
+                manifesto[chave] = antigo
+                ligados += 1
+                continue
+            except FileNotFoundError:
+                pass  # Sumiu do backup anterior: copia de novo
+            except OSError:
+                shutil.copy2(copia_anterior.caminho(chave), caminho)  # Outro disco: sem hard link
+                manifesto[chave] = antigo
+                copiados += 1
+                continue
+
+        try:
+            with closing(backend.abrir(chave)) as conteudo:
+                leitor = _LeitorComHash(conteudo)
+                copia.salvar(chave, leitor)
+        except Exception:
+            if backend.tamanho(chave) is None:
+                continue  # Apagado durante o backup
+            raise
+        manifesto[chave] = {'tamanho': tamanho, 'modificado_em': modificado_em, 'sha256': leitor.resumo.hexdigest()}
+        copiados += 1
+
+    return copiados, ligados
+
+
+def restaurar_anexos(caminho, anexos, backend):
+    """Grava no armazenamento os arquivos do backup que faltam ou têm outro tamanho"""
+    copia = armazenamento.ArmazenamentoLocal(os.path.join(caminho, PASTA_ANEXOS))
+    restaurados = 0
+    for chave, info in sorted(anexos.items()):
+        if backend.tamanho(chave) == info['tamanho']:
+            continue
+        with copia.abrir(chave) as conteudo:
+            backend.salvar(chave, conteudo)
+        restaurados += 1
+    return restaurados
+
+
+# ==================== COMANDOS ====================
+def criar(pasta):
+    nome = datetime.now().strftime('%Y%m%d-%H%M%S')
+    parcial = os.path.join(pasta, nome + '.parcial')
+    for interrompido in os.listdir(pasta) if os.path.isdir(pasta) else []:
+        if interrompido.endswith('.parcial'):
+            shutil.rmtree(os.path.join(pasta, interrompido))  # Sobra de um backup que não terminou
+    os.makedirs(os.path.join(parcial, PASTA_ANEXOS))
+    existentes = backups(pasta)
+    anterior = os.path.join(pasta, existentes[-1]) if existentes else None
+    backend = armazenamento.atual()
+    print(f"💾 Backup {nome}" + (f" (incremental sobre {existentes[-1]})" if anterior else ''))
+
+    anexos = {}
+    copiados, ligados = copiar_anexos(backend, parcial, anexos, anterior)
+    banco = copiar_banco(parcial)
+    print(f"   Banco ({banco['tipo']}): {banco['tamanho'] / 1024 / 1024:.1f} MB")
+    # Anexos gravados enquanto o banco era copiado
+    mais_copiados, mais_ligados = copiar_anexos(backend, parcial, anexos, anterior)
+    print(f"   Anexos: {len(anexos)} arquivo(s), {copiados + mais_copiados} copiado(s), "
+          f"{ligados + mais_ligados} sem alteração (hard link)")
+
+    with open(os.path.join(parcial, MANIFESTO), 'w', encoding='utf-8') as arquivo:
+        json.dump({'criado_em': datetime.now().isoformat(timespec='seconds'), 'armazenamento': backend.nome,
+                   'banco': banco, 'anexos': anexos}, arquivo, ensure_ascii=False, indent=1)
+    os.rename(parcial, os.path.join(pasta, nome))
+
+    # Apagar um backup antigo não afeta os outros (os hard links mantêm os arquivos)
+    manter = app.config.get('BACKUP_MANTER', 14)
+    for antigo in backups(pasta)[:-manter] if manter > 0 else []:
+        shutil.rmtree(os.path.join(pasta, antigo))
+        print(f"   🗑️ Backup antigo removido: {antigo}")
+    return nome
+
+
+def verificar(caminho):
+    """Lista de problemas do backup (vazia = íntegro)"""
+    manifesto = ler_manifesto(caminho)
+    problemas = []
+    registrados = _verificar_banco(caminho, manifesto['banco'], problemas)
+
+    copia = armazenamento.ArmazenamentoLocal(os.path.join(caminho, PASTA_ANEXOS))
+    for chave, info in manifesto['anexos'].items():
+        arquivo = copia.caminho(chave)
+        if not os.path.isfile(arquivo) or os.path.getsize(arquivo) != info['tamanho'] or _sha256(arquivo) != info['sha256']:
+            problemas.append(f'Anexo ausente ou alterado no backup: {chave}')
+
+    for chave in sorted((registrados or set()) - set(manifesto['anexos'])):
+        problemas.append(f'Anexo registrado no banco e fora do backup: {chave}')
+    return problemas
+
+
+def restaurar(caminho):
+    problemas = verificar(caminho)
+    if problemas:
+        raise RuntimeError(f'Backup com {len(problemas)} problema(s); rode --verificar para ver')
+    manifesto = ler_manifesto(caminho)
+
+    restaurar_banco(caminho, manifesto['banco'])
+    print(f"   ✅ Banco restaurado de {manifesto['criado_em']}")
+    restaurados = restaurar_anexos(caminho, manifesto['anexos'], armazenamento.atual())
+    print(f"   ✅ {restaurados} anexo(s) regravado(s), {len(manifesto['anexos']) - restaurados} já estavam iguais")
+    # Conferência do resultado: cada anexo do backup está no armazenamento com o tamanho certo
+    backend = armazenamento.atual()
+    faltando = [chave for chave, info in manifesto['anexos'].items() if backend.tamanho(chave) != info['tamanho']]
+    if faltando:
+        raise RuntimeError(f'{len(faltando)} anexo(s) não ficaram iguais ao backup, ex.: {faltando[0]}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backup e restauração do banco e dos anexos')
+    parser.add_argument('--verificar', nargs='?', const='', metavar='NOME', help='confere um backup (padrão: o mais recente)')
+    parser.add_argument('--restaurar', metavar='NOME', help='restaura o backup NOME (pare o sistema antes)')
+    parser.add_argument('--confirmar', action='store_true', help='obrigatório com --restaurar')
+    parser.add_argument('--listar', action='store_true', help='lista os backups existentes')
+    args = parser.parse_args()
+
+    with app.app_context():
+        pasta = app.config['BACKUP_FOLDER']
+        existentes = backups(pasta)
+
+        if args.listar:
+            for nome in existentes:
+                manifesto = ler_manifesto(os.path.join(pasta, nome))
+                print(f"   {nome}  {manifesto['banco']['tipo']:10}  {len(manifesto['anexos'])} anexo(s)")
+            print(f"📁 {len(existentes)} backup(s) em {pasta}")
+
+        elif args.verificar is not None:
+            nome = args.verificar or (existentes[-1] if existentes else None)
+            if nome not in existentes:
+                sys.exit(f"❌ Backup não encontrado: {nome or '(nenhum)'}")
+            problemas = verificar(os.path.join(pasta, nome))
+            for problema in problemas[:50]:
+                print(f"   ⚠️ {problema}")
+            if problemas:
+                sys.exit(f"❌ Backup {nome}: {len(problemas)} problema(s)")
+            print(f"✅ Backup {nome} íntegro")
+
+        elif args.restaurar:
+            if args.restaurar not in existentes:
+                sys.exit(f"❌ Backup não encontrado: {args.restaurar}")
+            if not args.confirmar:
+                sys.exit("⚠️ A restauração substitui o banco atual. Pare o sistema e rode de novo com --confirmar")
+            print(f"♻️ Restaurando {args.restaurar}...")
+            restaurar(os.path.join(pasta, args.restaurar))
+            print("✅ Restauração concluída. Pode iniciar o sistema.")
+
+        else:
+            nome = criar(pasta)
+            print(f"✅ Backup {nome} concluído em {pasta}")
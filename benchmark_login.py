@@ -0,0 +1,89 @@
+# benchmark_login.py
+# Mede o custo de cada política de hash de senha para escolher o PASSWORD_HASH_METHOD
+#
+# Uso:
+#   python benchmark_login.py                                  -> testa as políticas padrão
+#   python benchmark_login.py scrypt:16384:8:1 pbkdf2:sha256:600000
+#   python benchmark_login.py --logins 200                     -> também mede logins/s de ponta a ponta
+import os
+import sys
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+POLITICAS_PADRAO = [
+    'scrypt:32768:8:1',      # Padrão do werkzeug (32 MB por verificação)
+    'scrypt:16384:8:1',      # 16 MB por verificação
+    'pbkdf2:sha256:600000',  # Recomendação OWASP para PBKDF2-SHA256
+    'pbkdf2:sha256:310000',
+]
+
+SENHA = 'senha-de-teste-123'
+
+
+def memoria_por_verificacao(metodo):
+    """Memória aproximada usada pelo scrypt (128 * n * r bytes)"""
+    partes = metodo.split(':')
+    if partes[0] != 'scrypt':
+        return 0
+    n = int(partes[1]) if len(partes) > 1 else 32768
+    r = int(partes[2]) if len(partes) > 2 else 8
+    return 128 * n * r
+
+
+def medir_politica(metodo, repeticoes=20, threads=4):
+    """Retorna (ms por verificação, verificações/s com N threads)"""
+    senha_hash = generate_password_hash(SENHA, metodo)
+
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        check_password_hash(senha_hash, SENHA)
+    ms_por_verificacao = (time.perf_counter() - inicio) * 1000 / repeticoes
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda _: check_password_hash(senha_hash, SENHA), range(repeticoes * threads)))
+    verificacoes_por_segundo = (repeticoes * threads) / (time.perf_counter() - inicio)
+
+    return ms_por_verificacao, verificacoes_por_segundo
+
+
+def medir_logins(metodo, quantidade):
+    """Mede logins/s de ponta a ponta (rota /login) em um banco SQLite temporário"""
+    pasta = tempfile.mkdtemp(prefix='bench_login_')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(pasta, 'bench.db')
+    os.environ['PASSWORD_HASH_METHOD'] = metodo
+    os.chdir(pasta)
+
+    from app import app
+
+    cliente = app.test_client()
+    inicio = time.perf_counter()
+    for _ in range(quantidade):
+        cliente.post('/login', data={'username': 'lucas', 'password': 'lucas123'})
+        cliente.get('/logout')
+    return quantidade / (time.perf_counter() - inicio)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    logins = 0
+    if '--logins' in args:
+        posicao = args.index('--logins')
+        logins = int(args[posicao + 1])
+        del args[posicao:posicao + 2]
+
+    politicas = args or POLITICAS_PADRAO
+
+    print(f"{'Política':<24} {'ms/verif.':>10} {'verif./s (4 thr)':>17} {'memória':>10}")
+    for metodo in politicas:
+        ms, por_segundo = medir_politica(metodo)
+        memoria = memoria_por_verificacao(metodo)
+        memoria_txt = f"{memoria // (1024 * 1024)} MB" if memoria else '-'
+        print(f"{metodo:<24} {ms:>10.1f} {por_segundo:>17.1f} {memoria_txt:>10}")
+
+    if logins:
+        # O app é importado uma única vez, então mede só a primeira política
+        metodo = politicas[0]
+        print(f"\n🔐 Logins de ponta a ponta com {metodo}: {medir_logins(metodo, logins):.1f} logins/s")
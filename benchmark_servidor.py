@@ -0,0 +1,99 @@
+# benchmark_servidor.py
+# Mede requests/s e latência das principais rotas contra um servidor rodando,
+# para ajustar processos/threads do gunicorn (ver gunicorn.conf.py).
+#
+# Uso:
+#   python benchmark_servidor.py --url http://localhost:8000
+#   python benchmark_servidor.py --url http://localhost:8000 --conexoes 16 --requisicoes 400
+#   python benchmark_servidor.py --rotas /dashboard /api/buscar-servidor?q=silva
+#
+# Usuário/senha: --usuario / --senha (padrão: um dos usuários padrão do config.py)
+import sys
+import time
+import argparse
+import statistics
+import urllib.error
+import urllib.request
+import urllib.parse
+import http.cookiejar
+from concurrent.futures import ThreadPoolExecutor
+
+ROTAS_PADRAO = [
+    '/dashboard',                      # consultas + gráficos
+    '/investigacoes',                  # lista paginada
+    '/relatorios',                     # agregações
+    '/api/investigacoes?limit=50',     # JSON
+    '/api/buscar-servidor?q=silva',    # autocomplete
+]
+
+
+def abrir_sessao(url, usuario, senha):
+    """Faz login e devolve o cookie de sessão (compartilhado pelas threads)"""
+    cookies = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+    dados = urllib.parse.urlencode({'username': usuario, 'password': senha}).encode()
+    opener.open(url + '/login', dados, timeout=30).read()
+    cookie = '; '.join(f'{c.name}={c.value}' for c in cookies)
+    if 'session=' not in cookie:
+        print("❌ Login falhou (confira --usuario e --senha)")
+        sys.exit(1)
+    return cookie
+
+
+def requisitar(endereco, cookie):
+    pedido = urllib.request.Request(endereco, headers={'Cookie': cookie, 'Accept-Encoding': 'gzip'})
+    inicio = time.perf_counter()
+    try:
+        with urllib.request.urlopen(pedido, timeout=120) as resposta:
+            tamanho = len(resposta.read())
+            status = resposta.status
+    except urllib.error.HTTPError as e:
+        tamanho, status = 0, e.code
+    return time.perf_counter() - inicio, status, tamanho
+
+
+def medir_rota(url, rota, cookie, conexoes, requisicoes):
+    """Dispara N requisições com C conexões simultâneas"""
+    endereco = url + rota
+    requisitar(endereco, cookie)  # Aquecimento (caches, primeira conexão)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=conexoes) as executor:
+        resultados = list(executor.map(lambda _: requisitar(endereco, cookie), range(requisicoes)))
+    duracao = time.perf_counter() - inicio
+
+    latencias = sorted(r[0] * 1000 for r in resultados)
+    erros = sum(1 for r in resultados if r[1] != 200)
+    return {
+        'rps': requisicoes / duracao,
+        'p50': statistics.median(latencias),
+        'p95': latencias[int(len(latencias) * 0.95) - 1],
+        'kb': resultados[-1][2] / 1024,
+        'erros': erros,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark das rotas do Sistema PIP')
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--usuario', default='lucas')
+    parser.add_argument('--senha', default='lucas123')
+    parser.add_argument('--conexoes', type=int, default=8)
+    parser.add_argument('--requisicoes', type=int, default=200)
+    parser.add_argument('--rotas', nargs='*', default=ROTAS_PADRAO)
+    args = parser.parse_args()
+
+    url = args.url.rstrip('/')
+    cookie = abrir_sessao(url, args.usuario, args.senha)
+
+    print(f"🔧 {url} - {args.conexoes} conexões simultâneas, {args.requisicoes} requisições por rota\n")
+    print(f"{'Rota':<36} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'KB':>7} {'erros':>6}")
+    for rota in args.rotas:
+        r = medir_rota(url, rota, cookie, args.conexoes, args.requisicoes)
+        print(f"{rota:<36} {r['rps']:>8.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['kb']:>7.1f} {r['erros']:>6}")
+
+    print("\nCompare com outra combinação de WEB_CONCURRENCY / GUNICORN_THREADS (ver gunicorn.conf.py).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+# build_assets.py
+# Gera os pacotes de CSS/JS do front-end em static/dist (nomes com hash do conteúdo,
+# variantes .gz e .br pré-comprimidas e manifest.json usado pelos templates).
+#
+# Uso:
+#   python build_assets.py --baixar   -> baixa as bibliotecas para static/vendor (precisa de internet)
+#   python build_assets.py            -> monta os pacotes a partir de static/vendor (offline)
+#
+# O static/vendor é versionado (origem e versões em static/vendor/LEIA-ME.txt):
+# assim o build roda em rede isolada. Faltando algum pacote, o build falha.
+# Após gerar os pacotes, reinicie a aplicação para ler o novo manifest.json.
+import os
+import re
+import sys
+import json
+import gzip
+import glob
+import hashlib
+import posixpath
+import urllib.request
+from urllib.parse import urljoin, urlsplit
+from assets import BIBLIOTECAS, PACOTES, PASTA_VENDOR, PASTA_DIST, ARQUIVO_MANIFESTO
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PASTA_RECURSOS = os.path.join(PASTA_VENDOR, 'recursos')  # Fontes e imagens referenciadas pelos CSS
+PASTA_TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+RE_URL_CSS = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+RE_ICONE = re.compile(r'\.bi-([a-z0-9-]+)::?before\s*\{[^}]*\}\s*')  # ::before ou :before (CSS minificado)
+RE_SOURCE_MAP = re.compile(r'^//# sourceMappingURL=.*$', re.M)  # Os .map não são versionados
+
+
+# ==================== DOWNLOAD (UMA VEZ, COM INTERNET) ====================
+def baixar(url):
+    with urllib.request.urlopen(url, timeout=60) as resposta:
+        return resposta.read()
+
+
+def baixar_bibliotecas():
+    os.makedirs(PASTA_RECURSOS, exist_ok=True)
+
+    for nome, url in BIBLIOTECAS.items():
+        print(f"⬇️  {nome} <- {url}")
+        conteudo = baixar(url)
+
+        if nome.endswith('.css'):
+            # Baixa fontes/imagens referenciadas e aponta para static/vendor/recursos
+            texto = conteudo.decode('utf-8')
+
+            def trocar(match):
+                referencia = match.group(2)
+                if referencia.startswith('data:'):
+                    return match.group(0)
+                endereco = urljoin(url, referencia)
+                arquivo = posixpath.basename(urlsplit(endereco).path)
+                destino = os.path.join(PASTA_RECURSOS, arquivo)
+                if not os.path.exists(destino):
+                    with open(destino, 'wb') as f:
+                        f.write(baixar(endereco))
+                return f'url("recursos/{arquivo}")'
+
+            conteudo = RE_URL_CSS.sub(trocar, texto).encode('utf-8')
+
+        with open(os.path.join(PASTA_VENDOR, nome), 'wb') as f:
+            f.write(conteudo)
+
+
+# ==================== MONTAGEM DOS PACOTES (OFFLINE) ====================
+def hash_conteudo(conteudo):
+    return hashlib.sha256(conteudo).hexdigest()[:12]
+
+
+def nome_com_hash(nome, conteudo):
+    base, extensao = os.path.splitext(nome)
+    return f"{base}.{hash_conteudo(conteudo)}{extensao}"
+
+
+def minificar_css(texto):
+    """Minificação conservadora: comentários e espaços redundantes"""
+    texto = re.sub(r'/\*.*?\*/', '', texto, flags=re.S)
+    texto = re.sub(r'\s+', ' ', texto)
+    texto = re.sub(r'\s*([{};,>])\s*', r'\1', texto)
+    return texto.replace(';}', '}').strip()
+
+
+def icones_usados():
+    """Ícones bi-* citados nos templates"""
+    usados = set()
+    for caminho in glob.glob(os.path.join(PASTA_TEMPLATES, '*.html')):
+        with open(caminho, encoding='utf-8') as f:
+            usados.update(re.findall(r'\bbi-([a-z0-9-]+)', f.read()))
+    return usados
+
+
+def recortar_icones(texto, usados):
+    """Remove do bootstrap-icons.css as regras dos ícones que nenhum template usa"""
+    return RE_ICONE.sub(lambda m: m.group(0) if m.group(1) in usados else '', texto)
+
+
+# Só vale pré-comprimir texto (woff2/png já são comprimidos)
+EXTENSOES_COMPRIMIVEIS = ('.css', '.js', '.svg', '.ttf', '.eot')
+
+
+def gravar(nome, conteudo):
+    """Grava o arquivo em static/dist com as variantes .gz e .br"""
+    caminho = os.path.join(PASTA_DIST, nome)
+    with open(caminho, 'wb') as f:
+        f.write(conteudo)
+    if not nome.endswith(EXTENSOES_COMPRIMIVEIS):
+        return
+    with open(caminho + '.gz', 'wb') as f:
+        f.write(gzip.compress(conteudo, compresslevel=9, mtime=0))
+    if brotli:
+        with open(caminho + '.br', 'wb') as f:
+            f.write(brotli.compress(conteudo, quality=11))
+
+
+def publicar_recursos_css(texto):
+    """Copia fontes/imagens para static/dist com hash e reescreve os url() do CSS"""
+    def trocar(match):
+        referencia = match.group(2)
+        if not referencia.startswith('recursos/'):
+            return match.group(0)
+        arquivo = referencia.split('?')[0].split('#')[0]
+        with open(os.path.join(PASTA_VENDOR, arquivo), 'rb') as f:
+            conteudo = f.read()
+        destino = nome_com_hash(posixpath.basename(arquivo), conteudo)
+        if not os.path.exists(os.path.join(PASTA_DIST, destino)):
+            gravar(destino, conteudo)
+        return f'url("{destino}")'
+
+    return RE_URL_CSS.sub(trocar, texto)
+
+
+def montar_pacotes():
+    faltando = [nome for nome in BIBLIOTECAS if not os.path.exists(os.path.join(PASTA_VENDOR, nome))]
+    if faltando:
+        print(f"❌ Bibliotecas ausentes em static/vendor: {', '.join(faltando)}")
+        print("   Rode 'python build_assets.py --baixar' em uma máquina com internet.")
+        sys.exit(1)
+
+    os.makedirs(PASTA_DIST, exist_ok=True)
+    for antigo in glob.glob(os.path.join(PASTA_DIST, '*')):
+        os.remove(antigo)
+
+    usados = icones_usados()
+    manifesto = {}
+
+    for pacote, bibliotecas in PACOTES.items():
+        partes = []
+        for biblioteca in bibliotecas:
+            with open(os.path.join(PASTA_VENDOR, biblioteca), encoding='utf-8') as f:
+                texto = f.read()
+            if biblioteca == 'bootstrap-icons.css':
+                texto = recortar_icones(texto, usados)
+            if pacote.endswith('.css'):
+                texto = minificar_css(publicar_recursos_css(texto))
+            else:
+                texto = RE_SOURCE_MAP.sub('', texto)
+            partes.append(texto)
+
+        # ';' evita que dois scripts minificados se juntem numa só expressão
+        separador = '\n' if pacote.endswith('.css') else '\n;\n'
+        conteudo = separador.join(partes).encode('utf-8')
+
+        nome = nome_com_hash(pacote, conteudo)
+        gravar(nome, conteudo)
+        manifesto[pacote] = nome
+
+        tamanho_gz = os.path.getsize(os.path.join(PASTA_DIST, nome + '.gz'))
+        print(f"📦 {pacote:<15} -> {nome:<28} {len(conteudo) // 1024:>5} KB ({tamanho_gz // 1024} KB gzip)")
+
+    with open(ARQUIVO_MANIFESTO, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, indent=2)
+
+    if not brotli:
+        print("⚠️ Pacote 'brotli' não instalado: apenas variantes .gz foram geradas.")
+    print(f"✅ Manifesto gravado em {ARQUIVO_MANIFESTO}")
+
+
+if __name__ == '__main__':
+    if '--baixar' in sys.argv:
+        baixar_bibliotecas()
+    montar_pacotes()
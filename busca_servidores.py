@@ -0,0 +1,159 @@
+# ==================== CACHE DO AUTOCOMPLETE DE SERVIDORES ====================
+# O autocomplete chama /api/buscar-servidor a cada tecla a partir da 3ª letra.
+# Os resultados ficam num LRU por termo normalizado ('  JOÃO ' -> 'joão'):
+#
+#   busca_servidores.buscar('joao')  -> [{'nome': ..., 'matricula': ..., 'cargo': ..., 'lotacao': ...}]
+#
+# Se o banco devolveu TODAS as correspondências de um termo (até LIMITE_COMPLETO),
+# um termo mais longo que o contém ('joa' -> 'joao') é filtrado em memória a partir
+# delas, sem nova consulta. Buscas iguais simultâneas esperam a mesma consulta.
+#
+# O cache é limpo após o commit de qualquer alteração em Servidor (importação do
+# RH incluída). Como é por processo, nos outros workers vale até CACHE_TTL.
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import event, select
+from models import db, Servidor
+import metricas
+
+TAMANHO_MINIMO = 3
+LIMITE_RESULTADOS = 10
+LIMITE_COMPLETO = 500  # Até quantas correspondências guardar para refinar em memória
+MAXIMO_ENTRADAS = 256
+CACHE_TTL = 600
+ESPERA_MAXIMA = 10  # Segundos esperando a consulta igual de outra thread
+
+CAMPOS = ('nome', 'matricula', 'cargo', 'lotacao')
+
+_entradas = OrderedDict()  # termo -> (expira_em, completa, linhas)
+_em_andamento = {}         # termo -> threading.Event da consulta em curso
+_geracao = 0               # Muda a cada invalidação: resultado de consulta antiga não é guardado
+_lock = threading.Lock()
+
+
+def normalizar(termo):
+    return ' '.join((termo or '').split()).casefold()
+
+
+def _obter(chave):
+    """(completa, linhas) do termo, se estiver no cache e válido"""
+    entrada = _entradas.get(chave)
+    if entrada is None:
+        return None
+    if entrada[0] < time.monotonic():
+        del _entradas[chave]
+        return None
+    _entradas.move_to_end(chave)
+    return entrada[1:]
+
+
+def _guardar(chave, completa, linhas, geracao):
+    with _lock:
+        if geracao != _geracao:
+            return
+        _entradas[chave] = (time.monotonic() + CACHE_TTL, completa, linhas)
+        _entradas.move_to_end(chave)
+        while len(_entradas) > MAXIMO_ENTRADAS:
+            _entradas.popitem(last=False)
+
+
+def _refinar(chave):
+    """Filtra em memória o resultado completo de um prefixo já buscado (do mais longo ao mais curto)"""
+    for tamanho in range(len(chave) - 1, TAMANHO_MINIMO - 1, -1):
+        encontrada = _obter(chave[:tamanho])
+        if encontrada and encontrada[0]:
+            return [linha for linha in encontrada[1] if chave in normalizar(linha['nome'])]
+    return None
+
+
+def _consultar(chave):
+    """Correspondências no banco, em ordem de nome (uma a mais para saber se veio tudo)"""
+    linhas = db.session.execute(
+        select(*[getattr(Servidor, campo) for campo in CAMPOS])
+        .where(Servidor.nome.icontains(chave, autoescape=True))
+        .order_by(Servidor.nome, Servidor.id)
+        .limit(LIMITE_COMPLETO + 1)
+    ).all()
+    completa = len(linhas) <= LIMITE_COMPLETO
+    linhas = [dict(zip(CAMPOS, linha)) for linha in (linhas if completa else linhas[:LIMITE_RESULTADOS])]
+    return completa, linhas
+
+
+def buscar(termo):
+    """Até LIMITE_RESULTADOS servidores cujo nome contém o termo"""
+    chave = normalizar(termo)
+    if len(chave) < TAMANHO_MINIMO:
+        return []
+
+    with _lock:
+        encontrada = _obter(chave)
+        if encontrada is None:
+            refinada = _refinar(chave)
+        geracao = _geracao
+    if encontrada is not None:
+        metricas.incrementar('autocomplete.acertos')
+        return encontrada[1][:LIMITE_RESULTADOS]
+    if refinada is not None:
+        metricas.incrementar('autocomplete.refinamentos')
+        _guardar(chave, True, refinada, geracao)
+        return refinada[:LIMITE_RESULTADOS]
+
+    # Consulta única por termo: quem chega depois espera a que já está em curso
+    with _lock:
+        evento = _em_andamento.get(chave)
+        primeira = evento is None
+        if primeira:
+            evento = _em_andamento[chave] = threading.Event()
+    if not primeira:
+        metricas.incrementar('autocomplete.coalescidas')
+        evento.wait(ESPERA_MAXIMA)
+        with _lock:
+            encontrada = _obter(chave)
+        if encontrada is not None:
+            return encontrada[1][:LIMITE_RESULTADOS]
+        return _consultar(chave)[1][:LIMITE_RESULTADOS]  # A outra falhou ou foi invalidada
+
+    try:
+        metricas.incrementar('autocomplete.consultas')
+        completa, linhas = _consultar(chave)
+        _guardar(chave, completa, linhas, geracao)
+    finally:
+        with _lock:
+            _em_andamento.pop(chave, None)
+        evento.set()
+    return linhas[:LIMITE_RESULTADOS]
+
+
+def invalidar():
+    global _geracao
+    with _lock:
+        _entradas.clear()
+        _geracao += 1
+    metricas.incrementar('autocomplete.invalidacoes')
+
+
+def taxa_acerto():
+    """Fração das buscas respondidas sem consultar o banco"""
+    sem_banco = metricas.valor('autocomplete.acertos') + metricas.valor('autocomplete.refinamentos') \
+        + metricas.valor('autocomplete.coalescidas')
+    total = sem_banco + metricas.valor('autocomplete.consultas')
+    return round(sem_banco / total, 3) if total else None
+
+
+# ==================== INVALIDAÇÃO APÓS COMMIT ====================
+@event.listens_for(db.session, 'before_flush')
+def _marcar(session, flush_context, instances):
+    if any(isinstance(obj, Servidor) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['servidores_alterados'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidar_apos_commit(session):
+    if session.info.pop('servidores_alterados', False):
+        invalidar()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _descartar(session):
+    session.info.pop('servidores_alterados', None)
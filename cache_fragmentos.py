@@ -0,0 +1,134 @@
+# ==================== CACHE DE FRAGMENTOS DOS TEMPLATES ====================
+# Trechos de template renderizados uma vez e reaproveitados:
+#
+#   {% cache 'investigacoes:graficos_dashboard', 300, em_andamento, concluidas %}
+#       ... HTML que só depende dos dados das investigações ...
+#   {% endcache %}
+#
+# Argumentos: nome ('grupo:fragmento'), validade em segundos e, opcionalmente,
+# valores que fazem parte da chave (uma cópia para cada combinação).
+# O corpo do bloco só é avaliado quando não está no cache, então a rota pode
+# passar funções (calculadas só nesse caso) em vez dos dados prontos.
+#
+# Gravações de investigações/usuários pela sessão do ORM limpam o grupo
+# correspondente depois do commit. O cache é por processo: nos outros workers
+# o fragmento vale até expirar (por isso validades curtas).
+# Atualizações em massa (UPDATE/INSERT diretos) devem chamar invalidar().
+import time
+import threading
+from collections import OrderedDict
+from jinja2 import nodes
+from jinja2.ext import Extension
+from sqlalchemy import event
+import metricas
+
+MAXIMO_ENTRADAS = 500
+
+# Modelo alterado -> grupo de fragmentos que deixa de valer
+GRUPOS_POR_MODELO = {
+    'Investigacao': 'investigacoes',
+    'HistoricoDiligencia': 'investigacoes',
+    'Anexo': 'investigacoes',
+    'Usuario': 'usuarios',
+}
+
+
+class CacheLRU:
+    """Dicionário limitado (descarta o menos usado) com validade por entrada"""
+
+    def __init__(self, maximo=MAXIMO_ENTRADAS):
+        self.maximo = maximo
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            entrada = self._dados.get(chave)
+            if entrada is None or entrada[0] < time.monotonic():
+                self._dados.pop(chave, None)
+                metricas.incrementar('fragmentos.falhas')
+                return None
+            self._dados.move_to_end(chave)
+        metricas.incrementar('fragmentos.acertos')
+        return entrada[1]
+
+    def guardar(self, chave, valor, ttl):
+        with self._lock:
+            self._dados[chave] = (time.monotonic() + ttl, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.maximo:
+                self._dados.popitem(last=False)
+
+    def obter_ou_calcular(self, chave, ttl, funcao):
+        valor = self.obter(chave)
+        if valor is None:
+            valor = funcao()
+            self.guardar(chave, valor, ttl)
+        return valor
+
+    def invalidar(self, grupo=None):
+        """Remove as entradas do grupo ('investigacoes', 'usuarios'...) ou tudo"""
+        with self._lock:
+            if grupo is None:
+                self._dados.clear()
+                return
+            prefixo = grupo + ':'
+            for chave in [c for c in self._dados if c[0].startswith(prefixo)]:
+                del self._dados[chave]
+        metricas.incrementar(f'fragmentos.invalidacoes_{grupo}')
+
+    def __len__(self):
+        return len(self._dados)
+
+
+fragmentos = CacheLRU()
+
+
+def invalidar(grupo=None):
+    fragmentos.invalidar(grupo)
+
+
+# ==================== TAG {% cache %} DO JINJA ====================
+class CacheFragmentos(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        argumentos = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            argumentos.append(parser.parse_expression())
+        corpo = parser.parse_statements(['name:endcache'], drop_needle=True)
+        chamada = self.call_method('_renderizar', [nodes.List(argumentos)])
+        return nodes.CallBlock(chamada, [], [], corpo).set_lineno(lineno)
+
+    def _renderizar(self, argumentos, caller):
+        nome, ttl, *partes = argumentos
+        return fragmentos.obter_ou_calcular((nome, *partes), ttl, caller)
+
+
+# ==================== INVALIDAÇÃO APÓS COMMIT ====================
+def registrar_eventos(session):
+    """Liga a invalidação por grupo às escritas da sessão do ORM"""
+
+    @event.listens_for(session, 'before_flush')
+    def _marcar_grupos(sessao, flush_context, instances):
+        grupos = sessao.info.setdefault('fragmentos_invalidar', set())
+        for obj in (*sessao.new, *sessao.dirty, *sessao.deleted):
+            grupo = GRUPOS_POR_MODELO.get(type(obj).__name__)
+            if grupo:
+                grupos.add(grupo)
+
+    @event.listens_for(session, 'after_commit')
+    def _invalidar_grupos(sessao):
+        for grupo in sessao.info.pop('fragmentos_invalidar', ()):
+            invalidar(grupo)
+
+    @event.listens_for(session, 'after_rollback')
+    def _descartar_grupos(sessao):
+        sessao.info.pop('fragmentos_invalidar', None)
+
+
+def registrar(app, session):
+    """Registra a tag {% cache %} e a invalidação automática"""
+    app.jinja_env.add_extension(CacheFragmentos)
+    registrar_eventos(session)
@@ -0,0 +1,79 @@
+# ==================== RESPOSTAS CONDICIONAIS (ETAG / LAST-MODIFIED) ====================
+# Uso nas rotas somente leitura:
+#
+#   @app.route('/investigacoes/<int:id>')
+#   @resposta_condicional(validador_investigacao)
+#   def detalhes(id): ...
+#
+# O validador recebe os mesmos argumentos da rota e devolve uma lista com o que
+# identifica a versão da página (datas de alteração, quantidades...), ou None
+# para renderizar normalmente (ex.: registro inexistente -> a rota dá o 404).
+# Quando o navegador já tem essa versão, a resposta é 304 sem renderizar nada.
+import hashlib
+from datetime import datetime, date
+from functools import wraps
+from flask import request, session, make_response, current_app
+
+# Partes comuns a todas as páginas (usuário logado, badge de alertas do menu...)
+_validadores_layout = []
+
+
+def validador_layout(funcao):
+    """Registra uma função cujas partes entram no validador de todas as páginas"""
+    _validadores_layout.append(funcao)
+    return funcao
+
+
+def calcular_etag(*partes):
+    """ETag a partir das partes informadas (+ URL e dia, pois os prazos mudam a cada dia)"""
+    base = '|'.join(str(p) for p in (request.full_path, date.today(), *partes))
+    return hashlib.sha1(base.encode('utf-8')).hexdigest()
+
+
+def _preparar(resposta, etag, ultima_alteracao=None):
+    resposta.set_etag(etag)
+    if ultima_alteracao:
+        resposta.last_modified = ultima_alteracao
+    # Sempre revalida com o servidor (conteúdo depende do usuário logado)
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+
+def nao_modificado(etag, ultima_alteracao=None):
+    """Resposta 304 se o cliente já tem essa versão, senão None"""
+    # Comparação fraca: a versão comprimida da resposta volta com W/"..."
+    if request.if_none_match.contains_weak(etag):
+        return _preparar(current_app.response_class(status=304), etag, ultima_alteracao)
+    return None
+
+
+def resposta_condicional(validador):
+    """Decorator: responde 304 sem executar a rota quando a versão não mudou"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Sem login (a rota redireciona) ou com mensagens flash pendentes: renderiza sempre
+            if 'usuario' not in session or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            partes = validador(*args, **kwargs)
+            if partes is None:
+                return view(*args, **kwargs)
+
+            for funcao in _validadores_layout:
+                partes = list(partes) + list(funcao())
+
+            etag = calcular_etag(*partes)
+            ultima_alteracao = max((p for p in partes if isinstance(p, datetime)), default=None)
+
+            resposta_304 = nao_modificado(etag, ultima_alteracao)
+            if resposta_304:
+                return resposta_304
+
+            resposta = make_response(view(*args, **kwargs))
+            if resposta.status_code == 200:
+                _preparar(resposta, etag, ultima_alteracao)
+            return resposta
+
+        return wrapper
+    return decorator
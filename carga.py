@@ -0,0 +1,198 @@
+# ==================== CARGA DE TRABALHO POR RESPONSÁVEL ====================
+# A tabela carga_responsaveis é atualizada na mesma transação de cada escrita em
+# Investigacao (eventos do SQLAlchemy abaixo): só os contadores dos responsáveis
+# afetados são somados/subtraídos, sem varrer a tabela de investigações.
+#
+# Os contadores de prazo dependem do dia de hoje, então o job noturno
+# (reconciliar_carga.py) recalcula tudo para corrigir a virada do dia/ano
+# e qualquer divergência.
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, update, insert, delete, func, case, and_, inspect
+from models import db, Investigacao, CargaResponsavel
+
+CONTADORES = ('abertas', 'atrasadas', 'proximas_prazo', 'concluidas_ano')
+CAMPOS_MONITORADOS = ('responsavel', 'status', 'previsao_conclusao', 'data_conclusao')
+
+
+def contribuicao(status, previsao_conclusao, data_conclusao, hoje=None):
+    """Quanto uma investigação soma em cada contador (mesmas regras das propriedades do modelo)"""
+    hoje = hoje or datetime.now().date()
+    em_andamento = status == 'Em Andamento'
+    limite_alerta = hoje + timedelta(days=Investigacao.DIAS_ALERTA_PRAZO)
+
+    return {
+        'abertas': int(status != 'Concluída'),
+        'atrasadas': int(em_andamento and previsao_conclusao is not None and previsao_conclusao < hoje),
+        'proximas_prazo': int(em_andamento and previsao_conclusao is not None
+                              and hoje <= previsao_conclusao <= limite_alerta),
+        'concluidas_ano': int(status == 'Concluída' and data_conclusao is not None
+                              and data_conclusao.year == hoje.year),
+    }
+
+
+def _colunas_contadores(hoje):
+    """Os mesmos contadores como agregações SQL"""
+    def soma(condicao):
+        return func.coalesce(func.sum(case((condicao, 1), else_=0)), 0)
+
+    return [
+        soma(func.coalesce(Investigacao.status, '') != 'Concluída').label('abertas'),
+        soma(Investigacao.esta_atrasado).label('atrasadas'),
+        soma(Investigacao.alerta_prazo).label('proximas_prazo'),
+        soma(and_(
+            Investigacao.status == 'Concluída',
+            Investigacao.data_conclusao.between(hoje.replace(month=1, day=1), hoje.replace(month=12, day=31))
+        )).label('concluidas_ano'),
+    ]
+
+
+def _calcular(conexao, responsaveis=None):
+    """Contadores calculados direto das investigações (todos ou só dos responsáveis informados)"""
+    hoje = datetime.now().date()
+    consulta = select(Investigacao.responsavel, *_colunas_contadores(hoje)).group_by(Investigacao.responsavel)
+    if responsaveis is not None:
+        consulta = consulta.where(Investigacao.responsavel.in_(responsaveis))
+
+    return {linha.responsavel: {c: getattr(linha, c) for c in CONTADORES} for linha in conexao.execute(consulta)}
+
+
+def recalcular(responsaveis, conexao=None):
+    """Recalcula do zero as linhas dos responsáveis informados (usado por operações em massa).
+    Com responsaveis=None, a tabela inteira (sem commit, ao contrário de reconciliar())"""
+    if responsaveis is not None:
+        responsaveis = [r for r in set(responsaveis) if r]
+        if not responsaveis:
+            return
+
+    conexao = conexao if conexao is not None else db.session.connection()
+    calculado = _calcular(conexao, responsaveis)
+    agora = datetime.utcnow()
+
+    remocao = delete(CargaResponsavel)
+    if responsaveis is not None:
+        remocao = remocao.where(CargaResponsavel.responsavel.in_(responsaveis))
+    conexao.execute(remocao)
+    if calculado:
+        conexao.execute(insert(CargaResponsavel), [
+            dict(responsavel=responsavel, atualizado_em=agora, **contadores)
+            for responsavel, contadores in calculado.items()
+        ])
+
+
+def reconciliar():
+    """Recalcula a tabela inteira (job noturno). Retorna quantos responsáveis estavam divergentes."""
+    conexao = db.session.connection()
+    calculado = _calcular(conexao)
+    gravado = {
+        linha.responsavel: {c: getattr(linha, c) for c in CONTADORES}
+        for linha in conexao.execute(select(CargaResponsavel))
+    }
+    divergentes = sum(
+        1 for responsavel in set(calculado) | set(gravado)
+        if calculado.get(responsavel) != gravado.get(responsavel)
+    )
+
+    agora = datetime.utcnow()
+    conexao.execute(delete(CargaResponsavel))
+    if calculado:
+        conexao.execute(insert(CargaResponsavel), [
+            dict(responsavel=responsavel, atualizado_em=agora, reconciliado_em=agora, **contadores)
+            for responsavel, contadores in calculado.items()
+        ])
+    db.session.commit()
+
+    return divergentes
+
+
+# ==================== EVENTOS: ATUALIZAÇÃO INCREMENTAL ====================
+def _alterou_campos_monitorados(obj):
+    estado = inspect(obj)
+    return any(estado.attrs[campo].history.has_changes() for campo in CAMPOS_MONITORADOS)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _guardar_estado_anterior(session, flush_context, instances):
+    """Lê do banco (ainda sem o flush) o estado anterior das investigações alteradas/excluídas"""
+    ids = [
+        obj.id for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, Investigacao) and obj.id is not None
+        and (obj in session.deleted or _alterou_campos_monitorados(obj))
+    ]
+
+    anteriores = {}
+    if ids:
+        with session.no_autoflush:
+            linhas = session.execute(
+                select(Investigacao.id, Investigacao.responsavel, Investigacao.status,
+                       Investigacao.previsao_conclusao, Investigacao.data_conclusao)
+                .where(Investigacao.id.in_(ids))
+            ).all()
+        anteriores = {linha.id: tuple(linha)[1:] for linha in linhas}
+
+    session.info['carga_anterior'] = anteriores
+
+
+@event.listens_for(db.session, 'after_flush')
+def _aplicar_deltas(session, flush_context):
+    """Soma/subtrai a contribuição de cada investigação criada, alterada ou excluída"""
+    anteriores = session.info.pop('carga_anterior', {})
+    hoje = datetime.now().date()
+    deltas = defaultdict(lambda: dict.fromkeys(CONTADORES, 0))
+
+    def somar(responsavel, status, previsao_conclusao, data_conclusao, sinal):
+        for contador, valor in contribuicao(status, previsao_conclusao, data_conclusao, hoje).items():
+            deltas[responsavel][contador] += sinal * valor
+
+    for obj in session.new:
+        if isinstance(obj, Investigacao):
+            somar(obj.responsavel, obj.status, obj.previsao_conclusao, obj.data_conclusao, +1)
+
+    for obj in session.dirty:
+        if isinstance(obj, Investigacao) and obj.id in anteriores:
+            somar(*anteriores[obj.id], -1)
+            somar(obj.responsavel, obj.status, obj.previsao_conclusao, obj.data_conclusao, +1)
+
+    for obj in session.deleted:
+        if isinstance(obj, Investigacao) and obj.id in anteriores:
+            somar(*anteriores[obj.id], -1)
+
+    if not deltas:
+        return
+
+    conexao = session.connection()
+    agora = datetime.utcnow()
+    sem_linha = []
+    perderam_casos = []
+
+    for responsavel, delta in deltas.items():
+        if not responsavel or not any(delta.values()):
+            continue
+
+        resultado = conexao.execute(
+            update(CargaResponsavel)
+            .where(CargaResponsavel.responsavel == responsavel)
+            .values(atualizado_em=agora, **{
+                contador: getattr(CargaResponsavel, contador) + valor
+                for contador, valor in delta.items() if valor
+            })
+        )
+        if resultado.rowcount == 0:
+            sem_linha.append(responsavel)
+        elif delta['abertas'] < 0 or delta['concluidas_ano'] < 0:
+            perderam_casos.append(responsavel)
+
+    # Responsável ainda sem linha no resumo: calcula a partir das investigações.
+    # Resumo ainda vazio (banco recém-atualizado): monta o completo, senão a tabela
+    # deixaria de estar vazia com só este responsável e a carga ficaria incompleta
+    if sem_linha:
+        vazio = conexao.execute(select(CargaResponsavel.responsavel).limit(1)).first() is None
+        recalcular(None if vazio else sem_linha, conexao)
+
+    # Responsável que ficou sem nenhuma investigação sai do resumo
+    if perderam_casos:
+        conexao.execute(
+            delete(CargaResponsavel)
+            .where(CargaResponsavel.responsavel.in_(perderam_casos))
+            .where(~select(Investigacao.id).where(Investigacao.responsavel == CargaResponsavel.responsavel).exists())
+        )
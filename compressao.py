@@ -0,0 +1,88 @@
+# ==================== COMPRESSÃO DAS RESPOSTAS DINÂMICAS ====================
+# Comprime HTML/JSON/CSV gerados pelas rotas (br ou gzip, conforme o Accept-Encoding).
+# Ficam de fora:
+#   - send_file (anexos, PDFs, /assets já pré-comprimidos) -> direct_passthrough
+#   - respostas em streaming, já codificadas ou de tipos já comprimidos
+#   - corpos menores que COMPRESS_MIN_SIZE (o cabeçalho gzip não compensa)
+#
+# Níveis moderados de propósito: gzip 6 / brotli 4 comprimem quase tanto quanto
+# os máximos com uma fração do custo de CPU (a resposta é comprimida a cada request).
+import gzip
+from flask import request
+import metricas
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TIPOS_COMPRIMIVEIS = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+
+
+def escolher_codificacao():
+    """'br', 'gzip' ou None, pela preferência do cliente (brotli ganha no empate)"""
+    aceitas = request.accept_encodings
+    opcoes = [('br', aceitas['br']), ('gzip', aceitas['gzip'])] if brotli else [('gzip', aceitas['gzip'])]
+    codificacao, qualidade = max(opcoes, key=lambda opcao: opcao[1])
+    return codificacao if qualidade > 0 else None
+
+
+def comprimir(conteudo, codificacao, config):
+    if codificacao == 'br':
+        return brotli.compress(conteudo, quality=config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(conteudo, compresslevel=config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+
+def _pode_comprimir(resposta):
+    return (request.method != 'HEAD'
+            and resposta.status_code == 200
+            and not resposta.direct_passthrough
+            and not resposta.is_streamed
+            and 'Content-Encoding' not in resposta.headers
+            and resposta.mimetype in TIPOS_COMPRIMIVEIS)
+
+
+def registrar(app):
+    """Registra o after_request que comprime as respostas"""
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BROTLI_QUALITY', 4)
+
+    @app.after_request
+    def comprimir_resposta(resposta):
+        if not _pode_comprimir(resposta):
+            return resposta
+
+        # A representação depende do Accept-Encoding, mesmo quando não comprime
+        resposta.vary.add('Accept-Encoding')
+
+        conteudo = resposta.get_data()
+        if len(conteudo) < app.config['COMPRESS_MIN_SIZE']:
+            metricas.incrementar('compressao.ignoradas_pequenas')
+            return resposta
+
+        codificacao = escolher_codificacao()
+        if not codificacao:
+            metricas.incrementar('compressao.sem_suporte_cliente')
+            return resposta
+
+        comprimido = comprimir(conteudo, codificacao, app.config)
+        if len(comprimido) >= len(conteudo):
+            return resposta
+
+        resposta.set_data(comprimido)
+        resposta.headers['Content-Encoding'] = codificacao
+
+        # Outra representação do mesmo conteúdo: o ETag passa a ser fraco
+        etag, fraco = resposta.get_etag()
+        if etag and not fraco:
+            resposta.set_etag(etag, weak=True)
+
+        metricas.incrementar(f'compressao.respostas_{codificacao}')
+        metricas.incrementar('compressao.bytes_originais', len(conteudo))
+        metricas.incrementar('compressao.bytes_enviados', len(comprimido))
+        metricas.incrementar('compressao.bytes_economizados', len(conteudo) - len(comprimido))
+        return resposta
@@ -0,0 +1,142 @@
+# ==================== COMPRESSÃO DOS ANEXOS NO ARMAZENAMENTO ====================
+# Tipos que comprimem bem (txt, doc, xls, digitalizações sem compressão) são guardados
+# comprimidos; pdf, docx/xlsx, jpg e png já são comprimidos e ficam como enviados.
+#
+#   codificacao, tamanho, armazenado = compressao_anexos.salvar(arquivos, chave, file.stream, mimetype)
+#   return compressao_anexos.resposta(arquivos, anexo, mimetype)
+#
+# Anexo.codificacao diz como o arquivo está guardado ('zstd', 'gzip' ou None).
+# No download, se o navegador aceita a mesma codificação o arquivo vai como está
+# (Content-Encoding); senão é descomprimido em streaming.
+#
+# zstd requer o pacote zstandard (opcional); sem ele usa gzip. ANEXOS_COMPRESSAO no
+# config.py: 'auto', 'zstd', 'gzip' ou 'nenhuma'.
+import gzip
+import shutil
+import tempfile
+from flask import request, current_app, send_file
+from sqlalchemy import func
+from models import db, Anexo
+import metricas
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+TIPOS_COMPRIMIVEIS = {
+    'text/plain', 'text/csv', 'application/rtf',
+    'application/msword',        # .doc
+    'application/vnd.ms-excel',  # .xls
+    'image/bmp', 'image/tiff',   # digitalizações sem compressão
+}
+
+ECONOMIA_MINIMA = 0.1  # Só guarda comprimido se economizar pelo menos 10%
+NIVEL_GZIP = 6
+NIVEL_ZSTD = 10  # Comprime uma vez e lê muitas: compensa um nível mais alto
+BLOCO = 64 * 1024
+
+
+def codificacao_padrao(config):
+    """'zstd', 'gzip' ou None conforme ANEXOS_COMPRESSAO"""
+    escolhida = config.get('ANEXOS_COMPRESSAO', 'auto')
+    if escolhida == 'auto':
+        return 'zstd' if zstandard else 'gzip'
+    if escolhida == 'zstd' and not zstandard:
+        raise RuntimeError("ANEXOS_COMPRESSAO='zstd' requer o pacote zstandard")
+    return escolhida if escolhida in ('zstd', 'gzip') else None
+
+
+def comprimir(origem, destino, codificacao):
+    """Comprime o conteúdo de origem para destino, em blocos"""
+    if codificacao == 'zstd':
+        zstandard.ZstdCompressor(level=NIVEL_ZSTD).copy_stream(origem, destino, read_size=BLOCO)
+    else:
+        with gzip.GzipFile(fileobj=destino, mode='wb', compresslevel=NIVEL_GZIP, mtime=0) as comprimido:
+            shutil.copyfileobj(origem, comprimido, BLOCO)
+
+
+def descomprimir(bruto, codificacao):
+    """Objeto de leitura com o conteúdo original (descomprime conforme lê)"""
+    if codificacao is None:
+        return bruto
+    if codificacao == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('Anexo comprimido com zstd: instale o pacote zstandard')
+        return zstandard.ZstdDecompressor().stream_reader(bruto, read_size=BLOCO, closefd=True)
+    return gzip.GzipFile(fileobj=bruto, mode='rb')
+
+
+def salvar(arquivos, chave, origem, mimetype):
+    """Grava no armazenamento, comprimindo quando o tipo e a economia justificam.
+    A origem precisa permitir seek (o upload do Flask permite).
+    Retorna (codificacao, tamanho_original, tamanho_armazenado)."""
+    codificacao = codificacao_padrao(current_app.config) if mimetype in TIPOS_COMPRIMIVEIS else None
+    if codificacao:
+        inicio = origem.tell()
+        original = origem.seek(0, 2) - inicio
+        origem.seek(inicio)
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as temporario:
+            comprimir(origem, temporario, codificacao)
+            armazenado = temporario.tell()
+            if armazenado <= original * (1 - ECONOMIA_MINIMA):
+                temporario.seek(0)
+                arquivos.salvar(chave, temporario)
+                metricas.incrementar(f'anexos.comprimidos_{codificacao}')
+                metricas.incrementar('anexos.bytes_economizados', original - armazenado)
+                return codificacao, original, armazenado
+        # Não compensou (conteúdo já comprimido ou aleatório): guarda como veio
+        metricas.incrementar('anexos.compressao_descartada')
+        origem.seek(inicio)
+
+    tamanho = arquivos.salvar(chave, origem)
+    return None, tamanho, tamanho
+
+
+def abrir(arquivos, anexo):
+    """Conteúdo original do anexo, qualquer que seja a codificação guardada"""
+    return descomprimir(arquivos.abrir(anexo.caminho_arquivo), anexo.codificacao)
+
+
+def resposta(arquivos, anexo, mimetype):
+    """Resposta de download: repassa o comprimido se o cliente aceita, senão descomprime"""
+    if not anexo.codificacao:
+        return arquivos.resposta(anexo.caminho_arquivo, anexo.nome_arquivo, mimetype)
+
+    if request.accept_encodings[anexo.codificacao] > 0:
+        saida = arquivos.resposta(anexo.caminho_arquivo, anexo.nome_arquivo, mimetype)
+        saida.headers['Content-Encoding'] = anexo.codificacao
+        metricas.incrementar('anexos.downloads_comprimidos')
+    else:
+        saida = send_file(abrir(arquivos, anexo), as_attachment=True,
+                          download_name=anexo.nome_arquivo, mimetype=mimetype)
+        if anexo.tamanho_bytes is not None:
+            saida.content_length = anexo.tamanho_bytes
+        metricas.incrementar('anexos.downloads_descomprimidos')
+
+    saida.vary.add('Accept-Encoding')
+    return saida
+
+
+def economia():
+    """Espaço ocupado pelos anexos, por codificação, e o total economizado"""
+    linhas = db.session.query(
+        Anexo.codificacao,
+        func.count(Anexo.id),
+        func.coalesce(func.sum(Anexo.tamanho_bytes), 0),
+        func.coalesce(func.sum(func.coalesce(Anexo.tamanho_armazenado, Anexo.tamanho_bytes)), 0),
+    ).group_by(Anexo.codificacao).all()
+
+    por_codificacao = {
+        codificacao or 'nenhuma': {'anexos': qtd, 'bytes_originais': int(originais), 'bytes_armazenados': int(armazenados)}
+        for codificacao, qtd, originais, armazenados in linhas
+    }
+    originais = sum(d['bytes_originais'] for d in por_codificacao.values())
+    armazenados = sum(d['bytes_armazenados'] for d in por_codificacao.values())
+    return {
+        'por_codificacao': por_codificacao,
+        'bytes_originais': originais,
+        'bytes_armazenados': armazenados,
+        'bytes_economizados': originais - armazenados,
+        'taxa': round(1 - armazenados / originais, 3) if originais else None,
+    }
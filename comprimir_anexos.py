@@ -0,0 +1,84 @@
+# comprimir_anexos.py
+# Relatório do espaço ocupado pelos anexos e compressão dos que foram enviados antes
+# da compressão no armazenamento (ver compressao_anexos.py).
+#
+# Uso:
+#   python comprimir_anexos.py               -> só relatório
+#   python comprimir_anexos.py --comprimir   -> comprime os anexos antigos de tipos comprimíveis
+#
+# Cada anexo é regravado comprimido com uma chave nova; o caminho_arquivo só é trocado
+# se o anexo não mudou nesse meio tempo, e o arquivo antigo vai para a fila de exclusão
+# no mesmo commit (como no migrar_armazenamento.py). Pode rodar com o sistema no ar.
+import sys
+import shutil
+import tempfile
+import mimetypes
+from contextlib import closing
+from sqlalchemy import update
+from app import app
+from models import db, Anexo
+import armazenamento
+import compressao_anexos
+import exclusao_arquivos
+
+
+def formatar(bytes_):
+    return f"{bytes_ / 1024 / 1024:.1f} MB"
+
+
+def relatorio():
+    dados = compressao_anexos.economia()
+    print("\n📊 Espaço ocupado pelos anexos:")
+    for codificacao, d in sorted(dados['por_codificacao'].items()):
+        print(f"   {codificacao:8} {d['anexos']:6} anexo(s)  {formatar(d['bytes_originais']):>10} -> {formatar(d['bytes_armazenados']):>10}")
+    taxa = f" ({dados['taxa']:.0%})" if dados['taxa'] is not None else ''
+    print(f"   Total: {formatar(dados['bytes_originais'])} -> {formatar(dados['bytes_armazenados'])}, "
+          f"economia de {formatar(dados['bytes_economizados'])}{taxa}")
+
+
+def comprimir_existentes():
+    arquivos = armazenamento.atual()
+    candidatos = [
+        (id_, chave, nome, tipo) for id_, chave, nome, tipo in
+        db.session.query(Anexo.id, Anexo.caminho_arquivo, Anexo.nome_arquivo, Anexo.tipo_mime)
+        .filter(Anexo.codificacao.is_(None)).order_by(Anexo.id)
+        if (tipo or mimetypes.guess_type(nome)[0]) in compressao_anexos.TIPOS_COMPRIMIVEIS
+    ]
+    print(f"📦 {len(candidatos)} anexo(s) de tipos comprimíveis guardados sem compressão")
+
+    comprimidos, nao_compensou, sem_arquivo = 0, 0, 0
+    for id_, chave, nome, tipo in candidatos:
+        if not arquivos.existe(chave):
+            sem_arquivo += 1
+            continue
+        nova = armazenamento.nova_chave(nome)
+        # Cópia local com seek (o corpo vindo do S3 não permite)
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as original, \
+                closing(arquivos.abrir(chave)) as conteudo:
+            shutil.copyfileobj(conteudo, original)
+            original.seek(0)
+            codificacao, tamanho, armazenado = compressao_anexos.salvar(
+                arquivos, nova, original, tipo or mimetypes.guess_type(nome)[0])
+
+        if codificacao is None:
+            arquivos.remover(nova)
+            nao_compensou += 1
+            continue
+
+        trocou = db.session.execute(
+            update(Anexo).where(Anexo.id == id_, Anexo.caminho_arquivo == chave)
+            .values(caminho_arquivo=nova, codificacao=codificacao,
+                    tamanho_bytes=tamanho, tamanho_armazenado=armazenado)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        exclusao_arquivos.agendar([chave if trocou else nova])
+        db.session.commit()
+        comprimidos += trocou
+
+    print(f"✅ {comprimidos} comprimido(s), {nao_compensou} sem ganho, {sem_arquivo} sem arquivo")
+
+
+with app.app_context():
+    if '--comprimir' in sys.argv:
+        comprimir_existentes()
+    relatorio()
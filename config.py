@@ -18,11 +18,57 @@ class Config:
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Réplica somente leitura para relatórios e listas (opcional, ver replica.py)
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url and replica_url.startswith("postgres://"):
+        replica_url = replica_url.replace("postgres://", "postgresql://", 1)
+    SQLALCHEMY_BINDS = {'replica': replica_url} if replica_url else {}
+
+    # Segundos em que quem acabou de gravar continua lendo do principal
+    REPLICA_JANELA_ESCRITA = int(os.environ.get('REPLICA_JANELA_ESCRITA', 15))
+    # Atraso máximo (segundos) aceito numa réplica PostgreSQL antes de voltar ao principal
+    REPLICA_ATRASO_MAXIMO = int(os.environ.get('REPLICA_ATRASO_MAXIMO', 30))
+
+    # Arquivo: concluídas há mais de N dias vão para as tabelas *_arquivo (ver arquivo.py)
+    ARQUIVO_IDADE_DIAS = int(os.environ.get('ARQUIVO_IDADE_DIAS', 730))
+    ARQUIVO_LOTE = int(os.environ.get('ARQUIVO_LOTE', 500))
+
+    # Backups do banco e dos anexos (ver backup.py): pasta e quantos manter
+    BACKUP_FOLDER = os.environ.get('BACKUP_FOLDER') or os.path.join(BASE_DIR, 'backups')
+    BACKUP_MANTER = int(os.environ.get('BACKUP_MANTER', 14))
+
     # Sessão permanente (7 dias)
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
 
+    # Política de hash de senhas (algoritmo e custo, no formato do werkzeug)
+    # Ex.: 'scrypt:32768:8:1' (padrão), 'scrypt:16384:8:1', 'pbkdf2:sha256:600000'
+    # Use o benchmark_login.py para escolher o custo adequado a cada ambiente.
+    # Senhas gravadas com outra política são refeitas no próximo login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+
+    # Intervalo (segundos) para gravar em lote o último login dos usuários
+    LOGIN_FLUSH_INTERVAL = int(os.environ.get('LOGIN_FLUSH_INTERVAL', 30))
+
+    # Compressão das respostas dinâmicas (HTML/JSON): tamanho mínimo em bytes e
+    # níveis moderados (custo de CPU por request). Brotli só se o pacote estiver instalado.
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+
+    # Só para desenvolvimento com internet: sem os pacotes do build_assets.py, usa as CDNs
+    ASSETS_CDN = os.environ.get('ASSETS_CDN') == '1'
+
     # Upload de arquivos
-    UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(BASE_DIR, 'uploads')
+
+    # Onde ficam os anexos: 'local' (UPLOAD_FOLDER) ou 's3' (ver armazenamento.py)
+    ARMAZENAMENTO = os.environ.get('ARMAZENAMENTO', 'local')
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIXO = os.environ.get('S3_PREFIXO', 'anexos')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # MinIO e outros compatíveis
+
+    # Compressão dos anexos guardados: 'auto' (zstd se instalado, senão gzip), 'zstd', 'gzip' ou 'nenhuma'
+    ANEXOS_COMPRESSAO = os.environ.get('ANEXOS_COMPRESSAO', 'auto')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx', 'xls', 'xlsx'}
 
@@ -0,0 +1,121 @@
+# detectar_duplicadas.py
+# Procura grupos de investigações possivelmente duplicadas em toda a base
+# (mesmo índice MinHash/LSH usado no cadastro, ver duplicidade.py).
+#
+# Uso:
+#   python detectar_duplicadas.py                      -> relatório dos grupos
+#   python detectar_duplicadas.py --reindexar          -> recalcula o índice de todas antes (1ª vez / após importações antigas)
+#   python detectar_duplicadas.py --limiar 0.7 --csv duplicadas.csv
+#
+# Inclui as arquivadas (ver arquivo.py), marcadas no relatório e no CSV.
+# Só são comparados os pares que caem na mesma faixa; faixas com mais de
+# MAXIMO_POR_FAIXA investigações (texto padrão repetido) são ignoradas.
+import csv
+import argparse
+import numpy as np
+from sqlalchemy import select, func
+from app import app
+from models import db, AssinaturaSimilaridade, BandaSimilaridade
+import arquivo
+import duplicidade
+
+MAXIMO_POR_FAIXA = 200
+
+
+def reindexar():
+    todas = arquivo.uniao('id')
+    ids = db.session.execute(select(todas.c.id).order_by(todas.c.id)).scalars().all()
+    for inicio in range(0, len(ids), 1000):
+        duplicidade.indexar(ids[inicio:inicio + 1000])
+        db.session.commit()
+        print(f"   ... {min(inicio + 1000, len(ids))}/{len(ids)}")
+    print(f"🔄 Índice recalculado para {len(ids)} investigação(ões)")
+
+
+def grupos(limiar):
+    """Listas de (id, semelhança com o primeiro) das investigações parecidas entre si"""
+    repetidas = select(BandaSimilaridade.banda, BandaSimilaridade.valor) \
+        .group_by(BandaSimilaridade.banda, BandaSimilaridade.valor) \
+        .having(func.count() > 1).having(func.count() <= MAXIMO_POR_FAIXA).subquery()
+    linhas = db.session.execute(
+        select(BandaSimilaridade.banda, BandaSimilaridade.valor, BandaSimilaridade.investigacao_id)
+        .join(repetidas, (repetidas.c.banda == BandaSimilaridade.banda) & (repetidas.c.valor == BandaSimilaridade.valor))
+        .order_by(BandaSimilaridade.banda, BandaSimilaridade.valor)
+    ).all()
+
+    faixas = {}
+    for banda, valor, id_ in linhas:
+        faixas.setdefault((banda, valor), []).append(id_)
+    pares = {(a, b) for membros in faixas.values() for i, a in enumerate(membros) for b in membros[i + 1:]}
+    if not pares:
+        return []
+
+    envolvidos = sorted({id_ for par in pares for id_ in par})
+    assinaturas = {
+        id_: duplicidade.de_bytes(dados) for id_, dados in db.session.execute(
+            select(AssinaturaSimilaridade.investigacao_id, AssinaturaSimilaridade.assinatura)
+            .where(AssinaturaSimilaridade.investigacao_id.in_(envolvidos))
+        )
+    }
+
+    # União dos pares confirmados (semelhança estimada acima do limiar)
+    pai = {id_: id_ for id_ in envolvidos}
+
+    def raiz(id_):
+        while pai[id_] != id_:
+            pai[id_] = pai[pai[id_]]
+            id_ = pai[id_]
+        return id_
+
+    for a, b in pares:
+        if float(np.mean(assinaturas[a] == assinaturas[b])) >= limiar:
+            pai[raiz(max(a, b))] = raiz(min(a, b))
+
+    resultado = {}
+    for id_ in envolvidos:
+        resultado.setdefault(raiz(id_), []).append(id_)
+
+    return [
+        [(id_, round(float(np.mean(assinaturas[id_] == assinaturas[membros[0]])), 2)) for id_ in membros]
+        for membros in resultado.values() if len(membros) > 1
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Grupos de investigações possivelmente duplicadas')
+    parser.add_argument('--reindexar', action='store_true', help='recalcula o índice de todas as investigações')
+    parser.add_argument('--limiar', type=float, default=duplicidade.LIMIAR, help='semelhança mínima (0 a 1)')
+    parser.add_argument('--csv', help='grava os grupos neste arquivo CSV')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.reindexar:
+            reindexar()
+
+        encontrados = sorted(grupos(args.limiar), key=lambda g: (-len(g), g[0][0]))
+        ids = [id_ for grupo in encontrados for id_, _ in grupo]
+        modelo = arquivo.com_arquivadas()
+        dados = {inv.id: inv for inv in db.session.query(modelo).filter(modelo.id.in_(ids))} if ids else {}
+        arquivadas = arquivo.arquivadas_entre(ids)
+
+        print(f"\n📊 {len(encontrados)} grupo(s) de possíveis duplicadas ({len(ids)} investigações)")
+        for numero, grupo in enumerate(encontrados, start=1):
+            print(f"\n   Grupo {numero}:")
+            for id_, nota in grupo:
+                inv = dados[id_]
+                print(f"     #{id_} {nota:.0%} | {inv.processo_gdoc or '-'} | {inv.canal or inv.origem or '-'} | "
+                      f"{inv.assunto or '-'} | {inv.nome_denunciado or '-'} | {inv.status}"
+                      f"{' (arquivada)' if id_ in arquivadas else ''}")
+
+        if args.csv:
+            with open(args.csv, 'w', newline='', encoding='utf-8-sig') as arquivo:
+                escritor = csv.writer(arquivo, delimiter=';')
+                escritor.writerow(['grupo', 'id', 'semelhanca', 'processo_gdoc', 'canal', 'origem', 'assunto',
+                                   'nome_denunciado', 'matricula_denunciado', 'status', 'arquivada'])
+                for numero, grupo in enumerate(encontrados, start=1):
+                    for id_, nota in grupo:
+                        inv = dados[id_]
+                        escritor.writerow([numero, id_, nota, inv.processo_gdoc, inv.canal, inv.origem, inv.assunto,
+                                           inv.nome_denunciado, inv.matricula_denunciado, inv.status,
+                                           'Sim' if id_ in arquivadas else 'Não'])
+            print(f"\n✅ Grupos gravados em {args.csv}")
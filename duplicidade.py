@@ -0,0 +1,177 @@
+# ==================== POSSÍVEIS DUPLICIDADES (MINHASH + LSH) ====================
+# A mesma denúncia chega por canais/origens diferentes e acaba cadastrada duas vezes.
+# Cada investigação tem uma assinatura MinHash do texto (assunto + objeto, em trechos
+# de 5 letras) e do denunciado (nome e matrícula normalizada). A assinatura é cortada
+# em BANDAS faixas; investigações parecidas coincidem em pelo menos uma faixa, e a
+# busca é só um SELECT indexado por (banda, valor), sem comparar com a base inteira:
+#
+#   duplicidade.similares(objeto_especificacao=..., assunto=..., nome_denunciado=..., matricula_denunciado=...)
+#   -> [{'id': 12, 'similaridade': 0.81}, ...]
+#
+# As tabelas assinaturas_similaridade/bandas_similaridade são atualizadas na mesma
+# transação de cada escrita em Investigacao (eventos abaixo). Operações em massa
+# chamam indexar(ids). Para montar o índice do zero: python detectar_duplicadas.py --reindexar
+import re
+import zlib
+import hashlib
+import unicodedata
+from datetime import datetime
+import numpy as np
+from sqlalchemy import event, select, delete, insert, and_, or_, inspect
+from models import db, Investigacao, AssinaturaSimilaridade, BandaSimilaridade, normalizar_matricula
+import arquivo
+
+NUM_HASHES = 64
+BANDAS = 16
+LINHAS_POR_BANDA = NUM_HASHES // BANDAS  # 16 x 4: coincide numa faixa a partir de ~50% de semelhança
+LIMIAR = 0.5
+TAMANHO_TRECHO = 5
+PESO_MATRICULA = 8  # Mesma matrícula pesa como vários trechos de texto em comum
+
+CAMPOS = ('objeto_especificacao', 'assunto', 'nome_denunciado', 'matricula_denunciado')
+
+# Permutações fixas: as assinaturas precisam ser iguais em todos os processos
+_PRIMO = (1 << 31) - 1
+_sorteio = np.random.RandomState(20240501)
+_A = _sorteio.randint(1, _PRIMO, NUM_HASHES).astype(np.uint64)
+_B = _sorteio.randint(0, _PRIMO, NUM_HASHES).astype(np.uint64)
+
+
+def _normalizar_texto(valor):
+    texto = unicodedata.normalize('NFKD', str(valor or '')).encode('ascii', 'ignore').decode().lower()
+    return ' '.join(re.findall(r'[a-z0-9]+', texto))
+
+
+def elementos(objeto_especificacao=None, assunto=None, nome_denunciado=None, matricula_denunciado=None):
+    """Conjunto comparado: trechos do texto + palavras do nome + matrícula"""
+    texto = _normalizar_texto(f"{assunto or ''} {objeto_especificacao or ''}")
+    conjunto = {texto[i:i + TAMANHO_TRECHO] for i in range(max(len(texto) - TAMANHO_TRECHO + 1, 0))}
+    if 0 < len(texto) < TAMANHO_TRECHO:
+        conjunto.add(texto)
+    conjunto.update(f"n:{palavra}" for palavra in _normalizar_texto(nome_denunciado).split() if len(palavra) > 2)
+    matricula = normalizar_matricula(matricula_denunciado)
+    if matricula:
+        conjunto.update(f"m:{matricula}:{i}" for i in range(PESO_MATRICULA))
+    return conjunto
+
+
+def assinatura(conjunto):
+    """MinHash: para cada permutação, o menor hash dos elementos (None se vazio)"""
+    if not conjunto:
+        return None
+    valores = np.fromiter((zlib.crc32(e.encode()) for e in conjunto), dtype=np.uint64, count=len(conjunto)) % _PRIMO
+    return ((np.outer(valores, _A) + _B) % _PRIMO).min(axis=0).astype(np.uint32)
+
+
+def bandas(assin):
+    """Valor (inteiro de 64 bits) de cada faixa da assinatura"""
+    return [
+        int.from_bytes(hashlib.blake2b(faixa.tobytes(), digest_size=8).digest(), 'big', signed=True)
+        for faixa in assin.reshape(BANDAS, LINHAS_POR_BANDA)
+    ]
+
+
+def semelhanca(assin, outras):
+    """Semelhança estimada (fração de posições iguais) entre assin e cada linha de outras"""
+    return (outras == assin).mean(axis=1)
+
+
+def de_bytes(dados):
+    return np.frombuffer(dados, dtype=np.uint32)
+
+
+# ==================== CONSULTA ====================
+def similares(excluir_id=None, limite=5, limiar=LIMIAR, **campos):
+    """Investigações parecidas com os campos informados, da mais para a menos semelhante"""
+    assin = assinatura(elementos(**campos))
+    if assin is None:
+        return []
+
+    candidatos = select(BandaSimilaridade.investigacao_id).where(or_(*[
+        and_(BandaSimilaridade.banda == banda, BandaSimilaridade.valor == valor)
+        for banda, valor in enumerate(bandas(assin))
+    ])).distinct()
+    if excluir_id is not None:
+        candidatos = candidatos.where(BandaSimilaridade.investigacao_id != excluir_id)
+
+    linhas = db.session.execute(
+        select(AssinaturaSimilaridade.investigacao_id, AssinaturaSimilaridade.assinatura)
+        .where(AssinaturaSimilaridade.investigacao_id.in_(candidatos))
+    ).all()
+    if not linhas:
+        return []
+
+    notas = semelhanca(assin, np.stack([de_bytes(dados) for _, dados in linhas]))
+    resultado = sorted(
+        ({'id': id_, 'similaridade': round(float(nota), 2)} for (id_, _), nota in zip(linhas, notas) if nota >= limiar),
+        key=lambda item: (-item['similaridade'], -item['id']),
+    )
+    return resultado[:limite]
+
+
+# ==================== MANUTENÇÃO DO ÍNDICE ====================
+def _gravar(conexao, registros):
+    """Substitui assinatura e faixas. registros: [(id, objeto, assunto, nome, matricula)]"""
+    ids = [registro[0] for registro in registros]
+    conexao.execute(delete(BandaSimilaridade).where(BandaSimilaridade.investigacao_id.in_(ids)))
+    conexao.execute(delete(AssinaturaSimilaridade).where(AssinaturaSimilaridade.investigacao_id.in_(ids)))
+
+    agora = datetime.utcnow()
+    assinaturas, faixas = [], []
+    for id_, *valores in registros:
+        assin = assinatura(elementos(**dict(zip(CAMPOS, valores))))
+        if assin is None:
+            continue
+        assinaturas.append({'investigacao_id': id_, 'assinatura': assin.tobytes(), 'atualizado_em': agora})
+        faixas += [{'investigacao_id': id_, 'banda': banda, 'valor': valor} for banda, valor in enumerate(bandas(assin))]
+
+    if assinaturas:
+        conexao.execute(insert(AssinaturaSimilaridade), assinaturas)
+        conexao.execute(insert(BandaSimilaridade), faixas)
+
+
+def indexar(ids, conexao=None):
+    """(Re)calcula o índice das investigações informadas, lendo do banco (operações em massa).
+    Lê também as arquivadas: só os ids que não existem em nenhuma das tabelas saem do índice."""
+    ids = list(ids)
+    if not ids:
+        return
+    conexao = conexao if conexao is not None else db.session.connection()
+    todas = arquivo.uniao('id', *CAMPOS)
+    for inicio in range(0, len(ids), 500):
+        lote = ids[inicio:inicio + 500]
+        registros = conexao.execute(
+            select(todas.c.id, *[todas.c[campo] for campo in CAMPOS]).where(todas.c.id.in_(lote))
+        ).all()
+        encontrados = {registro[0] for registro in registros}
+        remover(conexao, [id_ for id_ in lote if id_ not in encontrados])
+        if registros:
+            _gravar(conexao, registros)
+
+
+def remover(conexao, ids):
+    if ids:
+        conexao.execute(delete(BandaSimilaridade).where(BandaSimilaridade.investigacao_id.in_(ids)))
+        conexao.execute(delete(AssinaturaSimilaridade).where(AssinaturaSimilaridade.investigacao_id.in_(ids)))
+
+
+# ==================== EVENTOS: ATUALIZAÇÃO NA MESMA TRANSAÇÃO ====================
+def _alterou_campos(obj):
+    estado = inspect(obj)
+    return any(estado.attrs[campo].history.has_changes() for campo in CAMPOS)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _atualizar_indice(session, flush_context):
+    alteradas = [
+        obj for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, Investigacao) and (obj in session.new or _alterou_campos(obj))
+    ]
+    excluidas = [obj.id for obj in session.deleted if isinstance(obj, Investigacao)]
+    if not alteradas and not excluidas:
+        return
+
+    conexao = session.connection()
+    remover(conexao, excluidas)
+    if alteradas:
+        _gravar(conexao, [(obj.id, *[getattr(obj, campo) for campo in CAMPOS]) for obj in alteradas])
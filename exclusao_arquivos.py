@@ -0,0 +1,106 @@
+# ==================== EXCLUSÃO DE ARQUIVOS EM SEGUNDO PLANO ====================
+# As rotas não apagam arquivos durante o request. Elas registram o caminho na fila
+# (tabela exclusoes_pendentes) na MESMA transação em que apagam o Anexo:
+#
+#   exclusao_arquivos.agendar([anexo.caminho_arquivo])
+#   db.session.delete(anexo)
+#   db.session.commit()
+#
+# Se o commit falhar, nada é apagado. Depois do commit uma thread do próprio processo
+# remove os arquivos e limpa a fila; falhas ficam na fila para nova tentativa.
+# O varrer_uploads.py também processa a fila e reconcilia a pasta com a tabela anexos.
+import threading
+from sqlalchemy import event, delete, update
+from models import db, ExclusaoPendente
+import armazenamento
+
+MAXIMO_TENTATIVAS = 5
+INTERVALO_REPETICAO = 300  # Segundos entre novas tentativas das que falharam
+
+_app = None
+_acordar = threading.Event()
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def agendar(caminhos):
+    """Põe os arquivos na fila de exclusão (gravada no próximo commit)"""
+    caminhos = [c for c in caminhos if c]
+    if not caminhos:
+        return
+    db.session.add_all([ExclusaoPendente(caminho_arquivo=caminho) for caminho in caminhos])
+    db.session.info['exclusoes_agendadas'] = True
+
+
+def remover_arquivo(caminho):
+    """Apaga o arquivo do armazenamento (já ter sido apagado não é erro)"""
+    armazenamento.atual().remover(caminho)
+
+
+def processar(limite=500):
+    """Apaga os arquivos da fila. Retorna (removidos, falhas)."""
+    pendentes = db.session.query(ExclusaoPendente.id, ExclusaoPendente.caminho_arquivo) \
+        .filter(ExclusaoPendente.tentativas < MAXIMO_TENTATIVAS) \
+        .order_by(ExclusaoPendente.id).limit(limite).all()
+
+    concluidos, falhas = [], {}
+    for id_, caminho in pendentes:
+        try:
+            remover_arquivo(caminho)
+            concluidos.append(id_)
+        except Exception as e:
+            falhas[id_] = str(e)
+
+    if concluidos:
+        db.session.execute(delete(ExclusaoPendente).where(ExclusaoPendente.id.in_(concluidos)))
+    for id_, erro in falhas.items():
+        db.session.execute(update(ExclusaoPendente).where(ExclusaoPendente.id == id_)
+                           .values(tentativas=ExclusaoPendente.tentativas + 1, ultimo_erro=erro))
+    db.session.commit()
+
+    for erro in set(falhas.values()):
+        print(f"⚠️ Erro ao excluir arquivo de anexo: {erro}")
+    return len(concluidos), len(falhas)
+
+
+# ==================== THREAD DE SEGUNDO PLANO ====================
+def _executar():
+    while True:
+        _acordar.wait(INTERVALO_REPETICAO)
+        _acordar.clear()
+        try:
+            with _app.app_context():
+                # Fila grande: continua até esvaziar
+                while processar()[0] == 500:
+                    pass
+        except Exception as e:
+            print(f"❌ Erro na fila de exclusão de arquivos: {e}")
+
+
+def acordar():
+    """Inicia a thread na primeira vez (nunca no mestre do gunicorn, antes do fork)"""
+    global _thread
+    if _app is None:
+        return
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_executar, name='exclusao-arquivos', daemon=True)
+            _thread.start()
+    _acordar.set()
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apos_commit(session):
+    if session.info.pop('exclusoes_agendadas', False):
+        acordar()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _apos_rollback(session):
+    session.info.pop('exclusoes_agendadas', None)
+
+
+def registrar(app):
+    """Guarda o app usado pela thread (que roda fora de qualquer request)"""
+    global _app
+    _app = app
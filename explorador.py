@@ -0,0 +1,193 @@
+# ==================== EXPLORADOR DE TABELAS CRUZADAS ====================
+# Tabelas cruzadas livres (responsável x status x ano, classificação x diretoria...)
+# calculadas sobre um retrato em memória das colunas categóricas de Investigacao,
+# sem consultar o banco a cada pedido:
+#
+#   tabela = explorador.cruzar(['responsavel', 'status'], medida='total', filtros={'ano': '2024'})
+#
+# O retrato é um DataFrame com dtype category (códigos inteiros + lista de valores).
+# Fica no cache de fragmentos no grupo 'investigacoes': é descartado após cada escrita
+# (como os fragmentos) e, nos outros workers, vale até RETRATO_TTL segundos.
+# O cruzamento é um np.bincount sobre o índice combinado dos códigos.
+import io
+import csv
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from models import db
+from cache_fragmentos import fragmentos
+import arquivo
+import metricas
+
+RETRATO_TTL = 300
+NAO_INFORMADO = '(não informado)'
+MAXIMO_DIMENSOES = 3
+MAXIMO_CELULAS = 200000  # Evita cruzar três colunas com milhares de valores cada
+
+DIMENSOES = {
+    'responsavel': 'Responsável',
+    'status': 'Status',
+    'ano': 'Ano',
+    'classificacao': 'Classificação',
+    'assunto': 'Assunto',
+    'diretoria': 'Diretoria',
+    'setor': 'Setor',
+    'unidade_origem': 'Unidade de Origem',
+    'origem': 'Origem',
+    'canal': 'Canal',
+    'admitida_ou_inadmitida': 'Admitida/Inadmitida',
+    'complexidade': 'Complexidade',
+    'vinculo': 'Vínculo',
+    'resultado_final': 'Resultado Final',
+}
+
+MEDIDAS = {
+    'total': 'Total',
+    'abertas': 'Em aberto',
+    'concluidas': 'Concluídas',
+    'atrasadas': 'Atrasadas',
+}
+
+
+# ==================== RETRATO EM MEMÓRIA ====================
+def _carregar():
+    inicio = time.perf_counter()
+    # Inclui as arquivadas (ver arquivo.py)
+    investigacoes = arquivo.uniao(*DIMENSOES, 'previsao_conclusao')
+    linhas = db.session.execute(select(investigacoes)).all()
+    df = pd.DataFrame(linhas, columns=[*DIMENSOES, 'previsao_conclusao'])
+
+    retrato = {}
+    for nome in DIMENSOES:
+        coluna = df[nome]
+        if nome == 'ano':
+            # Ordem numérica, guardado como texto ('2024')
+            coluna = pd.to_numeric(coluna, errors='coerce').astype('Int64').astype('string')
+            valores = sorted(coluna.dropna().unique(), key=int)
+        else:
+            coluna = coluna.astype('string').str.strip().replace('', pd.NA)
+            valores = sorted(coluna.dropna().unique(), key=str.lower)
+        retrato[nome] = pd.Categorical(coluna.fillna(NAO_INFORMADO), categories=[*valores, NAO_INFORMADO])
+
+    retrato = pd.DataFrame(retrato)
+    retrato['previsao_conclusao'] = pd.to_datetime(df['previsao_conclusao']).to_numpy(dtype='datetime64[D]')
+
+    metricas.incrementar('explorador.retratos_carregados')
+    return {'dados': retrato, 'gerado_em': datetime.now(),
+            'carga_ms': round((time.perf_counter() - inicio) * 1000, 1)}
+
+
+def retrato():
+    """Retrato atual (recarregado do banco após escritas ou ao expirar)"""
+    return fragmentos.obter_ou_calcular(('investigacoes:explorador',), RETRATO_TTL, _carregar)
+
+
+# ==================== CRUZAMENTO ====================
+def _pesos(dados, medida):
+    status = dados['status']
+    if medida == 'abertas':
+        return (status != 'Concluída').to_numpy()
+    if medida == 'concluidas':
+        return (status == 'Concluída').to_numpy()
+    if medida == 'atrasadas':
+        hoje = np.datetime64(datetime.now().date(), 'D')
+        return (status == 'Em Andamento').to_numpy() & (dados['previsao_conclusao'].to_numpy() < hoje)
+    return None
+
+
+def validar(dimensoes, medida, filtros):
+    """ValueError com a mensagem para o usuário"""
+    if not dimensoes:
+        raise ValueError('Escolha ao menos uma dimensão')
+    if len(dimensoes) > MAXIMO_DIMENSOES:
+        raise ValueError(f'No máximo {MAXIMO_DIMENSOES} dimensões')
+    if len(set(dimensoes)) != len(dimensoes):
+        raise ValueError('Dimensões repetidas')
+    invalidas = [d for d in [*dimensoes, *filtros] if d not in DIMENSOES]
+    if invalidas:
+        raise ValueError(f"Dimensão inválida: {', '.join(invalidas)}")
+    if medida not in MEDIDAS:
+        raise ValueError('Medida inválida')
+
+
+def cruzar(dimensoes, medida='total', filtros=None):
+    """Contagens por combinação das dimensões (2 ou 3 viram linhas x colunas [x camadas])"""
+    filtros = filtros or {}
+    validar(dimensoes, medida, filtros)
+    atual = retrato()
+    dados = atual['dados']
+
+    # Filtros: igualdade em qualquer dimensão (vários valores = qualquer um deles)
+    selecionadas = np.ones(len(dados), dtype=bool)
+    for nome, valores in filtros.items():
+        selecionadas &= dados[nome].isin(valores).to_numpy()
+
+    categorias = [dados[nome].cat.categories for nome in dimensoes]
+    formato = tuple(len(c) for c in categorias)
+    if int(np.prod(formato)) > MAXIMO_CELULAS:
+        raise ValueError('Combinação com valores demais: use filtros ou menos dimensões')
+
+    codigos = [dados[nome].cat.codes.to_numpy()[selecionadas] for nome in dimensoes]
+    pesos = _pesos(dados, medida)
+    indice = np.ravel_multi_index(codigos, formato) if codigos[0].size else np.zeros(0, dtype=np.intp)
+    contagens = np.bincount(
+        indice, weights=pesos[selecionadas] if pesos is not None else None, minlength=int(np.prod(formato)),
+    ).astype(np.int64).reshape(formato)
+
+    # Sem linhas/colunas/camadas vazias
+    eixos = []
+    for eixo in range(len(formato)):
+        outros = tuple(i for i in range(len(formato)) if i != eixo)
+        usados = contagens.sum(axis=outros) > 0 if outros else contagens > 0
+        eixos.append(np.flatnonzero(usados))
+    contagens = contagens[np.ix_(*eixos)]
+    rotulos = [[str(categorias[i][j]) for j in eixos[i]] for i in range(len(formato))]
+
+    return {
+        'dimensoes': list(dimensoes),
+        'titulos': [DIMENSOES[nome] for nome in dimensoes],
+        'medida': medida,
+        'rotulos': rotulos,
+        'valores': contagens,
+        'total': int(contagens.sum()),
+        'investigacoes': int(selecionadas.sum()),
+        'gerado_em': atual['gerado_em'],
+    }
+
+
+def para_json(tabela):
+    """Valores por camada: [[linha x coluna]] (uma camada só com 1 ou 2 dimensões)"""
+    valores = tabela['valores']
+    if valores.ndim == 1:
+        valores = valores[:, np.newaxis]
+    camadas = [valores] if valores.ndim == 2 else [valores[:, :, k] for k in range(valores.shape[2])]
+    return {
+        'dimensoes': tabela['dimensoes'],
+        'titulos': tabela['titulos'],
+        'medida': tabela['medida'],
+        'linhas': tabela['rotulos'][0],
+        'colunas': tabela['rotulos'][1] if len(tabela['rotulos']) > 1 else [MEDIDAS[tabela['medida']]],
+        'camadas': tabela['rotulos'][2] if len(tabela['rotulos']) > 2 else [],
+        'valores': [camada.tolist() for camada in camadas],
+        'total': tabela['total'],
+        'investigacoes': tabela['investigacoes'],
+        'gerado_em': tabela['gerado_em'].isoformat(timespec='seconds'),
+    }
+
+
+def para_csv(tabela):
+    """CSV em formato largo: [camada;] linha; uma coluna por valor da 2ª dimensão; Total"""
+    dados = para_json(tabela)
+    saida = io.StringIO()
+    escritor = csv.writer(saida, delimiter=';')
+    com_camadas = bool(dados['camadas'])
+
+    escritor.writerow([*dados['titulos'][2:3], dados['titulos'][0], *dados['colunas'], 'Total'])
+    for k, camada in enumerate(dados['valores']):
+        prefixo = [dados['camadas'][k]] if com_camadas else []
+        for rotulo, linha in zip(dados['linhas'], camada):
+            escritor.writerow([*prefixo, rotulo, *linha, sum(linha)])
+        escritor.writerow([*prefixo, 'Total', *[sum(coluna) for coluna in zip(*camada)], sum(map(sum, camada))])
+    return saida.getvalue().encode('utf-8-sig')
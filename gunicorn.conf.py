@@ -0,0 +1,68 @@
+# gunicorn.conf.py
+# Configuração do servidor em produção (Procfile: gunicorn -c gunicorn.conf.py app:app)
+#
+# preload_app: o app.py (pandas, reportlab, modelos, criação das tabelas) é importado
+# uma vez no processo mestre e os workers nascem por fork, compartilhando essa memória.
+# Para isso ser seguro nenhuma conexão com o banco pode atravessar o fork:
+#   - o app.py descarta o pool do engine ao final da inicialização (db.engine.dispose())
+#   - post_fork() abaixo descarta de novo no worker, sem fechar as conexões do mestre
+#
+# Ajuste (variáveis de ambiente, sem mexer neste arquivo):
+#   WEB_CONCURRENCY         -> processos (padrão 2). Rotas que gastam CPU (relatórios,
+#                              PDF, importação com pandas) escalam com processos.
+#   GUNICORN_THREADS        -> threads por processo no gthread (padrão 4). Rotas que
+#                              esperam I/O (download de anexos, autocomplete, banco)
+#                              escalam com threads, gastando bem menos memória.
+#   GUNICORN_WORKER_CLASS   -> 'gthread' (padrão) ou 'sync' (1 request por processo)
+#   GUNICORN_MAX_REQUESTS   -> reinicia o worker após N requests (padrão 1000), limitando
+#                              o crescimento de memória do pandas/reportlab
+#
+# Os padrões (2 processos x 4 threads) são um ponto de partida, não números medidos
+# neste sistema: ainda não há medições do servidor de produção registradas aqui.
+# Ao ajustar, anote neste comentário a máquina, a configuração e o resultado do benchmark.
+#
+# Como escolher os números: rode o benchmark_servidor.py contra o servidor com a
+# configuração atual e com a candidata, ex.:
+#   python benchmark_servidor.py --url http://localhost:8000 --conexoes 8
+# - requests/s param de subir ao aumentar threads e a CPU está em 100%  -> aumente processos
+# - a CPU sobra mas a latência de /download ou /api/buscar-servidor sobe -> aumente threads
+# - a memória do container é o limite: cada processo extra custa ~150 MB (pandas) e
+#   cada login simultâneo usa a memória do hash de senha (32 MB no scrypt padrão)
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+preload_app = True
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4)) if worker_class == 'gthread' else 1
+
+# PDFs e importação de planilhas podem levar dezenas de segundos
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Reciclagem dos workers (o jitter evita que todos reiniciem juntos)
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+# Heartbeat dos workers em memória (disco lento no container trava os workers)
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Cada worker abre o próprio pool de conexões"""
+    from app import app
+    from models import db
+
+    with app.app_context():
+        # close=False: não encerra as conexões que (eventualmente) pertencem ao mestre
+        for engine in db.engines.values():  # Principal e réplica (se configurada)
+            engine.dispose(close=False)
+
+    server.log.info(f"Worker {worker.pid} pronto ({worker_class}, {threads} thread(s))")
@@ -0,0 +1,257 @@
+# ==================== IMPORTAÇÃO DE INVESTIGAÇÕES POR PLANILHA ====================
+# Passivo antigo e extrações da Ouvidoria (CSV/Excel com milhares de linhas).
+#
+#   df = ler_planilha(arquivo)
+#   resultado = importar(df, usuario=session['nome'])
+#
+# Validação feita por coluna inteira com pandas (datas, números e listas de valores);
+# as linhas com problema entram no relatório de erros e as demais são gravadas em
+# lotes (INSERT ... RETURNING id + histórico de criação), um commit por lote.
+import re
+import unicodedata
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import insert, select
+from models import db, Investigacao, HistoricoDiligencia, Servidor, normalizar_matricula
+import carga
+import cache_fragmentos
+import duplicidade
+import tendencias
+
+TAMANHO_LOTE = 500
+
+# Campo do modelo -> nomes aceitos no cabeçalho (comparados sem acento/maiúsculas)
+COLUNAS = {
+    'responsavel': ['responsavel', 'responsável'],
+    'origem': ['origem'],
+    'canal': ['canal'],
+    'protocolo_origem': ['protocolo_origem', 'protocolo', 'protocolo de origem'],
+    'admitida_ou_inadmitida': ['admitida_ou_inadmitida', 'admitida/inadmitida', 'admissibilidade'],
+    'unidade_origem': ['unidade_origem', 'unidade de origem'],
+    'classificacao': ['classificacao', 'classificação'],
+    'assunto': ['assunto'],
+    'processo_gdoc': ['processo_gdoc', 'processo gdoc', 'processo', 'gdoc'],
+    'ano': ['ano'],
+    'denunciante': ['denunciante'],
+    'matricula_denunciado': ['matricula_denunciado', 'matrícula do denunciado', 'matricula', 'matrícula'],
+    'nome_denunciado': ['nome_denunciado', 'nome do denunciado', 'denunciado'],
+    'setor': ['setor'],
+    'diretoria': ['diretoria'],
+    'vinculo': ['vinculo', 'vínculo'],
+    'objeto_especificacao': ['objeto_especificacao', 'objeto', 'especificação', 'objeto/especificação'],
+    'diligencias': ['diligencias', 'diligências'],
+    'complexidade': ['complexidade'],
+    'entrada_prfi': ['entrada_prfi', 'entrada prfi', 'data de entrada'],
+    'previsao_conclusao': ['previsao_conclusao', 'previsão de conclusão', 'prazo'],
+    'data_conclusao': ['data_conclusao', 'data de conclusão', 'conclusão'],
+    'status': ['status', 'situação'],
+    'resultado_final': ['resultado_final', 'resultado final', 'resultado'],
+    'justificativa': ['justificativa'],
+}
+
+CAMPOS_DATA = ['entrada_prfi', 'previsao_conclusao', 'data_conclusao']
+CAMPOS_OBRIGATORIOS = ['responsavel']
+
+# Mesmas opções dos formulários (nova_investigacao.html)
+VALORES_PERMITIDOS = {
+    'status': ['Em Fila', 'Em Andamento', 'Concluída'],
+    'origem': ['Interno', 'Externo'],
+    'canal': ['CGDF', 'TCDF', 'GDOC', 'E-mail', 'Ouvidoria', 'PRF', 'Outros'],
+    'admitida_ou_inadmitida': ['Admitida', 'Inadmitida'],
+    'classificacao': ['Transgressão Disciplinar', 'Licitações e Contratos', 'Dano ao Erário',
+                      'Infração Ambiental', 'Práticas Operacionais e Comerciais'],
+    'complexidade': ['Baixa', 'Média', 'Alta'],
+    'vinculo': ['Efetivo', 'Comissionado', 'Terceirizado', 'Estagiário', 'Jovem Aprendiz', 'Outros'],
+}
+
+
+def normalizar(texto):
+    """'Matrícula do Denunciado ' -> 'matricula do denunciado'"""
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'\s+', ' ', texto).strip().lower()
+
+
+_APELIDOS = {normalizar(apelido): campo for campo, apelidos in COLUNAS.items() for apelido in apelidos}
+
+
+def ler_planilha(arquivo):
+    """DataFrame de texto (dtype=str mantém zeros à esquerda das matrículas)"""
+    if arquivo.filename.lower().endswith('.csv'):
+        return pd.read_csv(arquivo, dtype=str, sep=None, engine='python')
+    return pd.read_excel(arquivo, dtype=str)
+
+
+def mapear_colunas(df):
+    """Renomeia as colunas reconhecidas para os campos do modelo e descarta o resto"""
+    renomear = {}
+    for coluna in df.columns:
+        campo = _APELIDOS.get(normalizar(coluna))
+        if campo and campo not in renomear.values():
+            renomear[coluna] = campo
+    df = df[list(renomear)].rename(columns=renomear)
+
+    faltando = [campo for campo in CAMPOS_OBRIGATORIOS if campo not in df.columns]
+    if faltando:
+        raise ValueError(f"Coluna obrigatória ausente: {', '.join(faltando)}")
+    return df
+
+
+def converter_datas(serie):
+    """Aceita AAAA-MM-DD (também o que vem do Excel) e DD/MM/AAAA"""
+    iso = serie.str.match(r'^\d{4}-\d{2}-\d{2}', na=False)
+    datas_iso = pd.to_datetime(serie.where(iso), format='ISO8601', errors='coerce')
+    datas_br = pd.to_datetime(serie.where(~iso), format='%d/%m/%Y', errors='coerce')
+    return datas_iso.fillna(datas_br)
+
+
+def validar(df):
+    """Limpa, converte e valida as colunas. Retorna (df convertido, Series de erros por linha)"""
+    df = df.apply(lambda coluna: coluna.str.strip()).replace('', None)
+    erros = pd.Series('', index=df.index)
+
+    def marcar(mascara, mensagem):
+        nonlocal erros
+        erros = erros.mask(mascara, erros + mensagem + '; ')
+
+    for campo in CAMPOS_OBRIGATORIOS:
+        marcar(df[campo].isna(), f'{campo} não informado')
+
+    for campo in CAMPOS_DATA:
+        if campo in df.columns:
+            convertidas = converter_datas(df[campo])
+            marcar(df[campo].notna() & convertidas.isna(), f'{campo} com data inválida: ' + df[campo])
+            df[campo] = convertidas
+
+    if 'ano' in df.columns:
+        anos = pd.to_numeric(df['ano'], errors='coerce')
+        marcar(df['ano'].notna() & (anos.isna() | (anos < 1990) | (anos > 2100)), 'ano inválido: ' + df['ano'])
+        df['ano'] = anos
+
+    # Listas de valores: aceita variações de acento/maiúsculas e grava o valor oficial
+    for campo, permitidos in VALORES_PERMITIDOS.items():
+        if campo not in df.columns:
+            continue
+        oficiais = {normalizar(valor): valor for valor in permitidos}
+        convertidos = df[campo].map(lambda valor: oficiais.get(normalizar(valor)) if isinstance(valor, str) else None)
+        marcar(df[campo].notna() & convertidos.isna(), f'{campo} fora da lista: ' + df[campo])
+        df[campo] = convertidos
+
+    return df, erros.str.rstrip('; ')
+
+
+def completar(df):
+    """Valores padrão iguais aos do cadastro manual"""
+    for campo in COLUNAS:
+        if campo not in df.columns:
+            # Texto em object: pd.Series(None) seria float64 e recusaria os nomes do enriquecimento
+            df[campo] = pd.Series(pd.NaT, index=df.index) if campo in CAMPOS_DATA \
+                else pd.Series(None, index=df.index, dtype=object)
+
+    df['status'] = df['status'].fillna('Em Andamento')
+    # O INSERT em massa não passa pelo Investigacao.__init__: entrada hoje e
+    # previsão 120 dias após a entrada, como no cadastro (alertas e filtros de prazo)
+    df['entrada_prfi'] = df['entrada_prfi'].fillna(pd.Timestamp(datetime.now().date()))
+    df['previsao_conclusao'] = df['previsao_conclusao'].fillna(df['entrada_prfi'] + pd.Timedelta(days=120))
+    # Ano: da entrada na PRFI ou o ano corrente
+    df['ano'] = df['ano'].fillna(df['entrada_prfi'].dt.year).fillna(datetime.now().year)
+    # Data de conclusão só vale para as concluídas (sem a data, fica em branco)
+    df.loc[df['status'] != 'Concluída', 'data_conclusao'] = pd.NaT
+    return df
+
+
+def enriquecer_denunciados(df):
+    """Preenche nome_denunciado pelo cadastro de servidores (uma consulta + merge)"""
+    df['matricula_chave'] = df['matricula_denunciado'].map(normalizar_matricula, na_action='ignore')
+    chaves = df.loc[df['nome_denunciado'].isna(), 'matricula_chave'].dropna().unique().tolist()
+    if not chaves:
+        return df, 0
+
+    servidores = pd.DataFrame(
+        db.session.execute(
+            select(Servidor.matricula_chave, Servidor.nome).where(Servidor.matricula_chave.in_(chaves))
+        ).all(),
+        columns=['matricula_chave', 'nome_servidor'],
+    ).drop_duplicates('matricula_chave')
+    df = df.merge(servidores, on='matricula_chave', how='left').set_axis(df.index)
+    preencher = df['nome_denunciado'].isna() & df['nome_servidor'].notna()
+    df.loc[preencher, 'nome_denunciado'] = df.loc[preencher, 'nome_servidor']
+    return df.drop(columns='nome_servidor'), int(preencher.sum())
+
+
+def _registros(df):
+    """Linhas do DataFrame -> dicts prontos para o INSERT (NaN/NaT viram None)"""
+    df = df[list(COLUNAS) + ['matricula_chave']].copy()
+    for campo in CAMPOS_DATA:
+        df[campo] = df[campo].dt.date
+    df['ano'] = df['ano'].astype(int)
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict('records')
+
+
+def _gravar_lote(registros, usuario, origem):
+    """INSERT em lote das investigações e do histórico de criação (sem commit)"""
+    ids = db.session.execute(
+        insert(Investigacao).returning(Investigacao.id, sort_by_parameter_order=True),
+        registros,
+    ).scalars().all()
+
+    agora = datetime.utcnow()
+    db.session.execute(insert(HistoricoDiligencia), [
+        {'investigacao_id': id_, 'data': agora, 'usuario': usuario, 'tipo': 'criacao',
+         'descricao': f"Investigação criada por {usuario} (importação da planilha {origem})"}
+        for id_ in ids
+    ])
+    # INSERT em massa não passa pelos eventos do ORM
+    duplicidade.indexar(ids)
+    tendencias.marcar_investigacoes(Investigacao.id.in_(ids))
+    return ids
+
+
+def importar(df, usuario, origem='', tamanho_lote=TAMANHO_LOTE):
+    """Valida e grava a planilha. Erros de uma linha não impedem as outras."""
+    df = mapear_colunas(df).reset_index(drop=True)
+    df.index = df.index + 2  # Número da linha na planilha (linha 1 = cabeçalho)
+
+    df, erros = validar(df)
+    df = completar(df)
+    df, enriquecidas = enriquecer_denunciados(df)
+
+    relatorio = [{'linha': int(linha), 'mensagem': mensagem} for linha, mensagem in erros[erros != ''].items()]
+    validas = df[erros == '']
+
+    importadas = []
+    linhas = validas.index.tolist()
+    registros = _registros(validas)
+
+    for inicio in range(0, len(registros), tamanho_lote):
+        lote = list(zip(linhas[inicio:inicio + tamanho_lote], registros[inicio:inicio + tamanho_lote]))
+        try:
+            ids = _gravar_lote([registro for _, registro in lote], usuario, origem)
+            db.session.commit()
+            importadas += ids
+        except Exception:
+            db.session.rollback()
+            # Lote recusado pelo banco: grava linha a linha para apontar qual falhou
+            for linha, registro in lote:
+                try:
+                    ids = _gravar_lote([registro], usuario, origem)
+                    db.session.commit()
+                    importadas += ids
+                except Exception as e:
+                    db.session.rollback()
+                    relatorio.append({'linha': int(linha), 'mensagem': f'erro ao gravar: {e.__class__.__name__}'})
+
+    # INSERTs em massa não passam pelos eventos do ORM
+    if importadas:
+        carga.recalcular(validas['responsavel'].unique().tolist())
+        db.session.commit()
+        cache_fragmentos.invalidar('investigacoes')
+
+    relatorio.sort(key=lambda erro: erro['linha'])
+    return {
+        'total': len(df),
+        'importadas': len(importadas),
+        'ids': importadas,
+        'enriquecidas': enriquecidas,
+        'erros': relatorio,
+    }
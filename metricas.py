@@ -0,0 +1,42 @@
+# ==================== MÉTRICAS EM MEMÓRIA ====================
+# Contadores simples, por processo (cada worker do gunicorn tem os seus).
+# Uso:
+#
+#   metricas.incrementar('compressao.bytes_economizados', 1234)
+#   metricas.instantaneo()  -> {'compressao.bytes_economizados': 1234, ...}
+#
+# Consultados pelos administradores em /admin/metricas.
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+_contadores = defaultdict(int)
+_lock = threading.Lock()
+_inicio = datetime.utcnow()
+
+
+def incrementar(nome, valor=1):
+    with _lock:
+        _contadores[nome] += valor
+
+
+def valor(nome):
+    with _lock:
+        return _contadores.get(nome, 0)
+
+
+def instantaneo():
+    """Cópia dos contadores (ordenados pelo nome)"""
+    with _lock:
+        contadores = dict(sorted(_contadores.items()))
+    return {
+        'pid': os.getpid(),
+        'desde': _inicio.isoformat(),
+        'contadores': contadores,
+    }
+
+
+def zerar():
+    with _lock:
+        _contadores.clear()
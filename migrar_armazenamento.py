@@ -0,0 +1,112 @@
+# migrar_armazenamento.py
+# Move os arquivos de anexos existentes, sem tirar o sistema do ar.
+#
+# Uso:
+#   python migrar_armazenamento.py                    -> pasta local antiga (sem subpastas) para subpastas
+#   python migrar_armazenamento.py --destino s3       -> copia do backend atual para o S3 (mesmas chaves)
+#   python migrar_armazenamento.py --simular          -> só mostra o que seria feito
+#
+# Mesmo backend: copia cada arquivo para a chave com subpastas e troca o caminho_arquivo
+# do anexo no mesmo commit em que agenda a exclusão do arquivo antigo (exclusao_arquivos).
+# Enquanto isso as rotas continuam servindo pela chave antiga.
+#
+# Outro backend: copia com a mesma chave, sem alterar o banco (as que já existem no destino
+# são puladas). Depois é só trocar ARMAZENAMENTO no ambiente e rodar de novo, para
+# pegar os uploads feitos no meio tempo.
+import sys
+import argparse
+from contextlib import closing
+from sqlalchemy import update
+from app import app
+from models import db, Anexo, anexos_arquivo
+import armazenamento
+import exclusao_arquivos
+
+TAMANHO_LOTE = 200
+
+
+def copiar(origem, destino, chave_origem, chave_destino):
+    with closing(origem.abrir(chave_origem)) as conteudo:
+        return destino.salvar(chave_destino, conteudo)
+
+
+def fragmentar(backend, simular):
+    """Chaves antigas (sem subpasta) -> chaves com subpastas, no mesmo backend"""
+    pendentes = [(id_, chave) for id_, chave in db.session.query(Anexo.id, Anexo.caminho_arquivo).order_by(Anexo.id)
+                 if not armazenamento.esta_fragmentada(chave)]
+    print(f"📦 {len(pendentes)} anexo(s) com chave antiga")
+
+    movidos, sem_arquivo = 0, []
+    for inicio in range(0, len(pendentes), TAMANHO_LOTE):
+        lote = pendentes[inicio:inicio + TAMANHO_LOTE]
+        antigas = []
+        for id_, chave in lote:
+            if not backend.existe(chave):
+                sem_arquivo.append((id_, chave))
+                continue
+            nova = armazenamento.chave_fragmentada(chave.rsplit('/', 1)[-1])
+            if simular:
+                print(f"   {chave} -> {nova}")
+                movidos += 1
+                continue
+            copiar(backend, backend, chave, nova)
+            # Só troca se ninguém mudou o anexo enquanto copiávamos
+            trocou = db.session.execute(
+                update(Anexo).where(Anexo.id == id_, Anexo.caminho_arquivo == chave)
+                .values(caminho_arquivo=nova).execution_options(synchronize_session=False)
+            ).rowcount
+            antigas.append(chave if trocou else nova)
+            movidos += trocou
+        if antigas:
+            exclusao_arquivos.agendar(antigas)
+        db.session.commit()
+        print(f"   ... {min(inicio + TAMANHO_LOTE, len(pendentes))}/{len(pendentes)}")
+
+    return movidos, sem_arquivo
+
+
+def copiar_para(origem, destino, simular):
+    """Copia todos os anexos para outro backend com as mesmas chaves"""
+    chaves = [chave for (chave,) in db.session.query(Anexo.caminho_arquivo).order_by(Anexo.id)]
+    # Os anexos das investigações arquivadas também (ver arquivo.py)
+    chaves += [chave for (chave,) in db.session.query(anexos_arquivo.c.caminho_arquivo).order_by(anexos_arquivo.c.id)]
+    print(f"📦 {len(chaves)} anexo(s) no banco")
+
+    copiados, ja_existiam, sem_arquivo = 0, 0, []
+    for chave in chaves:
+        if destino.existe(chave):
+            ja_existiam += 1
+        elif not origem.existe(chave):
+            sem_arquivo.append((None, chave))
+        elif simular:
+            print(f"   {chave}")
+            copiados += 1
+        else:
+            copiar(origem, destino, chave, chave)
+            copiados += 1
+    print(f"   {ja_existiam} já estavam no destino")
+    return copiados, sem_arquivo
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migração dos arquivos de anexos')
+    parser.add_argument('--destino', choices=['local', 's3'], help='backend de destino (padrão: o atual)')
+    parser.add_argument('--simular', action='store_true', help='não copia nem altera nada')
+    args = parser.parse_args()
+
+    with app.app_context():
+        origem = armazenamento.atual()
+        print(f"🔧 Origem: {origem.nome}" + (f" -> destino: {args.destino}" if args.destino else ''))
+
+        if args.destino and args.destino != origem.nome:
+            destino = armazenamento.criar(app.config, args.destino)
+            feitos, sem_arquivo = copiar_para(origem, destino, args.simular)
+        else:
+            feitos, sem_arquivo = fragmentar(origem, args.simular)
+
+        print(f"\n✅ {feitos} arquivo(s) {'a migrar' if args.simular else 'migrado(s)'}")
+        if sem_arquivo:
+            print(f"⚠️ {len(sem_arquivo)} anexo(s) sem arquivo (ver varrer_uploads.py):")
+            for _, chave in sem_arquivo[:50]:
+                print(f"     - {chave}")
+            sys.exit(1)
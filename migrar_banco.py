@@ -1,17 +1,124 @@
 from app import app, db
-from sqlalchemy import text
+from models import normalizar_matricula, Investigacao, HistoricoDiligencia, Anexo, \
+    investigacoes_arquivo, historico_arquivo, anexos_arquivo
+from sqlalchemy import text, select, func, union_all
+from sqlalchemy.schema import CreateTable
+
+# Cada passo é (descrição, SQL). Os passos podem ser rodados várias vezes:
+# colunas/índices que já existem são apenas informados.
+MIGRACOES = [
+    ("Coluna 'data_conclusao'",
+     'ALTER TABLE investigacoes ADD COLUMN data_conclusao DATE'),
+    ("Índice 'ix_investigacoes_status_previsao'",
+     'CREATE INDEX IF NOT EXISTS ix_investigacoes_status_previsao ON investigacoes (status, previsao_conclusao)'),
+    ("Índice 'ix_investigacoes_responsavel'",
+     'CREATE INDEX IF NOT EXISTS ix_investigacoes_responsavel ON investigacoes (responsavel)'),
+    ("Coluna 'anexos.codificacao'",
+     'ALTER TABLE anexos ADD COLUMN codificacao VARCHAR(10)'),
+    ("Coluna 'anexos.tamanho_armazenado'",
+     'ALTER TABLE anexos ADD COLUMN tamanho_armazenado INTEGER'),
+    ("Coluna 'investigacoes.matricula_chave'",
+     'ALTER TABLE investigacoes ADD COLUMN matricula_chave VARCHAR(50)'),
+    ("Índice 'ix_investigacoes_matricula_chave'",
+     'CREATE INDEX IF NOT EXISTS ix_investigacoes_matricula_chave ON investigacoes (matricula_chave, entrada_prfi)'),
+    ("Coluna 'servidor.matricula_chave'",
+     'ALTER TABLE servidor ADD COLUMN matricula_chave VARCHAR(50)'),
+    ("Índice 'ix_servidor_matricula_chave'",
+     'CREATE INDEX IF NOT EXISTS ix_servidor_matricula_chave ON servidor (matricula_chave)'),
+    ("Índice 'ix_historico_investigacao_data'",
+     'CREATE INDEX IF NOT EXISTS ix_historico_investigacao_data ON historico_diligencias (investigacao_id, data)'),
+]
+
+# Colunas preenchidas a partir de outra (normalização em Python, a mesma usada nas escritas)
+PREENCHIMENTOS = [
+    ('investigacoes', 'matricula_denunciado'),
+    ('servidor', 'matricula'),
+]
+
+# SQLite: tabelas que precisam de AUTOINCREMENT para um id arquivado (arquivo.py) nunca
+# ir para uma investigação nova. Não dá para incluir com ALTER TABLE: a tabela é
+# recriada e a sequência começa acima do maior id da tabela e do arquivo.
+AUTOINCREMENTO = [
+    (Investigacao.__table__, investigacoes_arquivo),
+    (HistoricoDiligencia.__table__, historico_arquivo),
+    (Anexo.__table__, anexos_arquivo),
+]
+
+
+def recriar_com_autoincremento(conn, tabela, arquivo):
+    """Recria a tabela (nova, cópia, DROP, RENAME, índices), com as chaves estrangeiras desligadas"""
+    nova = f'{tabela.name}_nova'
+    criacao = str(CreateTable(tabela).compile(dialect=conn.dialect))
+    conn.execute(text(criacao.replace(f'CREATE TABLE {tabela.name} (', f'CREATE TABLE {nova} (', 1)))
+    colunas = ', '.join(c.name for c in tabela.columns)
+    conn.execute(text(f'INSERT INTO {nova} ({colunas}) SELECT {colunas} FROM {tabela.name}'))
+    conn.execute(text(f'DROP TABLE {tabela.name}'))
+    conn.execute(text(f'ALTER TABLE {nova} RENAME TO {tabela.name}'))
+    for indice in tabela.indexes:
+        indice.create(conn)
+
+    ids = union_all(select(tabela.c.id), select(arquivo.c.id)).subquery()
+    maior = conn.execute(select(func.max(ids.c.id))).scalar() or 0
+    conn.execute(text('DELETE FROM sqlite_sequence WHERE name = :nome'), {'nome': tabela.name})
+    conn.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:nome, :maior)'),
+                 {'nome': tabela.name, 'maior': maior})
 
 with app.app_context():
-    try:
-        # Tentar adicionar a coluna data_conclusao
-        with db.engine.connect() as conn:
-            conn.execute(text('ALTER TABLE investigacoes ADD COLUMN data_conclusao DATE'))
-            conn.commit()
-
-        print("✅ Coluna 'data_conclusao' adicionada com sucesso!")
-
-    except Exception as e:
-        if "duplicate column name" in str(e).lower():
-            print("⚠️ Coluna 'data_conclusao' já existe!")
-        else:
-            print(f"❌ Erro ao adicionar coluna: {e}")
+    for descricao, sql in MIGRACOES:
+        try:
+            with db.engine.connect() as conn:
+                conn.execute(text(sql))
+                conn.commit()
+
+            print(f"✅ {descricao} aplicado com sucesso!")
+
+        except Exception as e:
+            erro = str(e).lower()
+            if "duplicate column" in erro or "already exists" in erro:
+                print(f"⚠️ {descricao} já existe!")
+            else:
+                print(f"❌ Erro em {descricao}: {e}")
+
+    for tabela, origem in PREENCHIMENTOS:
+        try:
+            with db.engine.begin() as conn:
+                linhas = conn.execute(text(
+                    f'SELECT id, {origem} FROM {tabela} WHERE {origem} IS NOT NULL AND matricula_chave IS NULL'
+                )).all()
+                valores = [{'id': id_, 'chave': normalizar_matricula(valor)} for id_, valor in linhas]
+                valores = [v for v in valores if v['chave']]
+                if valores:
+                    conn.execute(text(f'UPDATE {tabela} SET matricula_chave = :chave WHERE id = :id'), valores)
+
+            print(f"✅ '{tabela}.matricula_chave' preenchida em {len(valores)} linha(s)")
+
+        except Exception as e:
+            print(f"❌ Erro ao preencher '{tabela}.matricula_chave': {e}")
+
+    if db.engine.dialect.name == 'sqlite':
+        for tabela, arquivo in AUTOINCREMENTO:
+            descricao = f"AUTOINCREMENT em '{tabela.name}'"
+            try:
+                # AUTOCOMMIT + BEGIN explícito: o pysqlite não poria o DDL na transação
+                with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                    criacao = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :nome"),
+                                           {'nome': tabela.name}).scalar() or ''
+                    if 'AUTOINCREMENT' in criacao.upper():
+                        print(f"⚠️ {descricao} já existe!")
+                        continue
+                    chaves_estrangeiras = conn.execute(text('PRAGMA foreign_keys')).scalar()
+                    conn.execute(text('PRAGMA foreign_keys = OFF'))  # Só vale fora de transação
+                    try:
+                        conn.execute(text('BEGIN'))
+                        recriar_com_autoincremento(conn, tabela, arquivo)
+                        conn.execute(text('COMMIT'))
+                    except Exception:
+                        conn.execute(text('ROLLBACK'))
+                        raise
+                    finally:
+                        conn.execute(text(f'PRAGMA foreign_keys = {chaves_estrangeiras}'))
+
+                print(f"✅ {descricao} aplicado com sucesso!")
+
+            except Exception as e:
+                print(f"❌ Erro em {descricao}: {e}")
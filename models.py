@@ -1,8 +1,109 @@
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import update, bindparam, and_, case, literal, null, Integer
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import validates
+from sqlalchemy.sql.expression import FunctionElement
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
+import re
+import threading
+import time
+from replica import SessaoRoteada
 
-db = SQLAlchemy()
+# SELECTs das rotas somente leitura podem ir para a réplica (ver replica.py)
+db = SQLAlchemy(session_options={'class_': SessaoRoteada})
+
+
+# ==================== POLÍTICA DE HASH DE SENHAS ====================
+METODO_HASH_PADRAO = 'scrypt:32768:8:1'
+_prefixos_hash = {}
+
+
+def metodo_hash_senha():
+    """Método de hash configurado (PASSWORD_HASH_METHOD)"""
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_METHOD') or METODO_HASH_PADRAO
+    return METODO_HASH_PADRAO
+
+
+def prefixo_hash(metodo):
+    """Prefixo que o werkzeug grava para o método (ex.: 'scrypt' vira 'scrypt:32768:8:1')"""
+    if metodo not in _prefixos_hash:
+        _prefixos_hash[metodo] = generate_password_hash('', metodo).split('$', 1)[0]
+    return _prefixos_hash[metodo]
+
+
+# ==================== FUNÇÕES SQL DE DATA (SQLITE / POSTGRESQL) ====================
+class dias_entre(FunctionElement):
+    """Diferença em dias (final - inicial) calculada no banco"""
+    type = Integer()
+    name = 'dias_entre'
+    inherit_cache = True
+
+
+@compiles(dias_entre)
+def _dias_entre_padrao(element, compiler, **kw):
+    final, inicial = list(element.clauses)
+    # PostgreSQL: date - date já retorna o número de dias
+    return f"({compiler.process(final, **kw)} - {compiler.process(inicial, **kw)})"
+
+
+@compiles(dias_entre, 'sqlite')
+def _dias_entre_sqlite(element, compiler, **kw):
+    final, inicial = list(element.clauses)
+    return f"CAST(julianday({compiler.process(final, **kw)}) - julianday({compiler.process(inicial, **kw)}) AS INTEGER)"
+
+
+class somar_dias(FunctionElement):
+    """Data + N dias calculada no banco"""
+    type = db.Date()
+    name = 'somar_dias'
+    inherit_cache = True
+
+
+@compiles(somar_dias)
+def _somar_dias_padrao(element, compiler, **kw):
+    data, dias = list(element.clauses)
+    # PostgreSQL: date + integer já retorna date
+    return f"({compiler.process(data, **kw)} + {compiler.process(dias, **kw)})"
+
+
+@compiles(somar_dias, 'sqlite')
+def _somar_dias_sqlite(element, compiler, **kw):
+    data, dias = list(element.clauses)
+    return f"date({compiler.process(data, **kw)}, ({compiler.process(dias, **kw)}) || ' days')"
+
+
+class inicio_do_mes(FunctionElement):
+    """Primeiro dia do mês da data, calculado no banco"""
+    type = db.Date()
+    name = 'inicio_do_mes'
+    inherit_cache = True
+
+
+@compiles(inicio_do_mes)
+def _inicio_do_mes_padrao(element, compiler, **kw):
+    data, = list(element.clauses)
+    return f"CAST(date_trunc('month', {compiler.process(data, **kw)}) AS DATE)"
+
+
+@compiles(inicio_do_mes, 'sqlite')
+def _inicio_do_mes_sqlite(element, compiler, **kw):
+    data, = list(element.clauses)
+    return f"date({compiler.process(data, **kw)}, 'start of month')"
+
+
+def hoje_sql():
+    """Data de hoje (do servidor da aplicação) como parâmetro SQL"""
+    return literal(datetime.now().date(), db.Date)
+
+
+# Últimos logins aguardando gravação em lote {usuario_id: datetime}
+_logins_pendentes = {}
+_logins_lock = threading.Lock()
+_ultima_gravacao_logins = time.monotonic()
 
 
 # ==================== MODELO DE USUÁRIO ====================
@@ -26,17 +127,65 @@ class Usuario(db.Model):
         self.ativo = ativo
 
     def set_senha(self, senha):
-        """Criptografa a senha"""
-        self.senha_hash = generate_password_hash(senha)
+        """Criptografa a senha com a política configurada"""
+        self.senha_hash = generate_password_hash(senha, metodo_hash_senha())
 
     def check_senha(self, senha):
-        """Verifica se a senha está correta"""
-        return check_password_hash(self.senha_hash, senha)
+        """Verifica se a senha está correta (e refaz o hash se a política mudou)"""
+        if not check_password_hash(self.senha_hash, senha):
+            return False
+
+        if self.precisa_rehash:
+            self.set_senha(senha)  # Gravado no próximo commit
+
+        return True
+
+    @property
+    def precisa_rehash(self):
+        """Verifica se o hash gravado foi feito com outra política"""
+        return self.senha_hash.split('$', 1)[0] != prefixo_hash(metodo_hash_senha())
 
     def registrar_login(self):
-        """Atualiza o último login"""
-        self.ultimo_login = datetime.utcnow()
-        db.session.commit()
+        """Agenda a atualização do último login (gravada em lote)"""
+        with _logins_lock:
+            _logins_pendentes[self.id] = datetime.utcnow()
+
+    @classmethod
+    def descarregar_logins_pendentes(cls, forcar=False):
+        """Grava em um único UPDATE os últimos logins acumulados, numa transação própria
+        (não mexe na sessão do request). Erro de gravação só é propagado com forcar=True;
+        no caminho normal é registrado e os logins voltam para a fila."""
+        global _ultima_gravacao_logins
+
+        intervalo = current_app.config.get('LOGIN_FLUSH_INTERVAL', 30)
+        with _logins_lock:
+            if not _logins_pendentes:
+                return 0
+            if not forcar and time.monotonic() - _ultima_gravacao_logins < intervalo:
+                return 0
+            pendentes = dict(_logins_pendentes)
+            _logins_pendentes.clear()
+            _ultima_gravacao_logins = time.monotonic()
+
+        tabela = cls.__table__
+        try:
+            with db.engine.begin() as conexao:
+                conexao.execute(
+                    update(tabela).where(tabela.c.id == bindparam('usuario_id'))
+                    .values(ultimo_login=bindparam('data')),
+                    [{'usuario_id': usuario_id, 'data': data} for usuario_id, data in pendentes.items()]
+                )
+        except Exception as e:
+            # Devolve para a fila sem sobrescrever logins mais novos
+            with _logins_lock:
+                for usuario_id, data in pendentes.items():
+                    _logins_pendentes.setdefault(usuario_id, data)
+            if forcar:
+                raise
+            print(f"⚠️ Erro ao gravar últimos logins (nova tentativa no próximo intervalo): {e}")
+            return 0
+
+        return len(pendentes)
 
     @property
     def eh_admin(self):
@@ -68,6 +217,44 @@ class Usuario(db.Model):
         return f'<Usuario {self.username} ({self.nivel})>'
 
 
+# ==================== MODELO DE SERVIDOR (CADASTRO DO RH) ====================
+def normalizar_matricula(valor):
+    """Chave de comparação da matrícula: '012.345-6' e '123456' viram '123456'"""
+    if valor is None:
+        return None
+    chave = re.sub(r'[^0-9A-Za-z]', '', str(valor)).upper().lstrip('0')
+    return chave or None
+
+
+class Servidor(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(150), nullable=False)
+    matricula = db.Column(db.String(50), nullable=True, unique=True) # Matrícula única
+    matricula_chave = db.Column(db.String(50), index=True)  # normalizar_matricula(matricula), preenchida sozinha
+    cargo = db.Column(db.String(100), nullable=True)
+    lotacao = db.Column(db.String(100), nullable=True)
+
+    # Investigações em que o servidor é o denunciado (pela matrícula normalizada)
+    investigacoes = db.relationship(
+        'Investigacao', viewonly=True, lazy='dynamic',
+        primaryjoin='Servidor.matricula_chave == foreign(Investigacao.matricula_chave)',
+    )
+
+    @validates('matricula')
+    def _atualizar_chave(self, campo, valor):
+        self.matricula_chave = normalizar_matricula(valor)
+        return valor
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'nome': self.nome,
+            'matricula': self.matricula,
+            'cargo': self.cargo,
+            'lotacao': self.lotacao
+        }
+
+
 # ==================== MODELO DE INVESTIGAÇÃO ====================
 class Investigacao(db.Model):
     __tablename__ = 'investigacoes'
@@ -85,6 +272,7 @@ class Investigacao(db.Model):
     ano = db.Column(db.Integer)
     denunciante = db.Column(db.String(200))
     matricula_denunciado = db.Column(db.String(50))
+    matricula_chave = db.Column(db.String(50))  # normalizar_matricula(matricula_denunciado), preenchida sozinha
     nome_denunciado = db.Column(db.String(200))
     setor = db.Column(db.String(100))
     diretoria = db.Column(db.String(100))
@@ -111,6 +299,25 @@ class Investigacao(db.Model):
     # Relacionamento com diligências
     historico = db.relationship('HistoricoDiligencia', backref='investigacao', lazy=True, cascade='all, delete-orphan')
 
+    # Denunciado no cadastro de servidores (None se a matrícula não estiver lá)
+    servidor = db.relationship(
+        'Servidor', viewonly=True, uselist=False, lazy='select',
+        primaryjoin='foreign(Investigacao.matricula_chave) == Servidor.matricula_chave',
+    )
+
+    __table_args__ = (
+        # Alertas de prazo (badge do menu, dashboard, relatórios)
+        db.Index('ix_investigacoes_status_previsao', 'status', 'previsao_conclusao'),
+        # Recalcular a carga de um responsável (carga.py)
+        db.Index('ix_investigacoes_responsavel', 'responsavel'),
+        # Histórico do servidor e relatório de reincidência
+        db.Index('ix_investigacoes_matricula_chave', 'matricula_chave', 'entrada_prfi'),
+        # SQLite: ids de investigações arquivadas nunca são reaproveitados (ver arquivo.py)
+        {'sqlite_autoincrement': True},
+    )
+
+    arquivada = False  # True quando lida das tabelas de arquivo (ver arquivo.py)
+
     def __init__(self, **kwargs):
         super(Investigacao, self).__init__(**kwargs)
         if not self.ano:
@@ -121,7 +328,24 @@ class Investigacao(db.Model):
             # 120 dias após entrada
             self.previsao_conclusao = (datetime.now() + timedelta(days=120)).date()
 
-    @property
+    @validates('matricula_denunciado')
+    def _atualizar_matricula_chave(self, campo, valor):
+        self.matricula_chave = normalizar_matricula(valor)
+        return valor
+
+    # Janela (em dias) do alerta de prazo próximo
+    DIAS_ALERTA_PRAZO = 15
+
+    # Faixas de prazo usadas nos filtros da listagem
+    FAIXAS_PRAZO = {
+        'atrasadas': 'Atrasadas',
+        'atrasadas_30': 'Atrasadas há mais de 30 dias',
+        'proximas': 'Vencem em até 15 dias',
+        'no_prazo': 'No prazo (mais de 15 dias)',
+        'sem_prazo': 'Sem previsão de conclusão',
+    }
+
+    @hybrid_property
     def dias_restantes(self):
         """Calcula dias restantes APENAS se NÃO estiver concluída"""
         if self.status == 'Concluída':
@@ -132,7 +356,15 @@ class Investigacao(db.Model):
             return delta.days
         return None
 
-    @property
+    @dias_restantes.expression
+    def dias_restantes(cls):
+        """Mesma regra em SQL (permite filter() e order_by())"""
+        return case(
+            (cls.status == 'Concluída', null()),
+            else_=dias_entre(cls.previsao_conclusao, hoje_sql())
+        )
+
+    @hybrid_property
     def esta_atrasado(self):
         """Verifica se está atrasado APENAS se estiver em andamento"""
         if self.status != 'Em Andamento':
@@ -140,13 +372,45 @@ class Investigacao(db.Model):
 
         return self.dias_restantes is not None and self.dias_restantes < 0
 
-    @property
+    @esta_atrasado.expression
+    def esta_atrasado(cls):
+        # Compara a própria data (usa o índice status/previsão)
+        return and_(cls.status == 'Em Andamento', cls.previsao_conclusao < hoje_sql())
+
+    @hybrid_property
     def alerta_prazo(self):
         """Alerta de prazo APENAS para investigações em andamento"""
         if self.status != 'Em Andamento':
             return False  # ✅ CONCLUÍDAS NÃO TÊM ALERTA!
 
-        return self.dias_restantes is not None and 0 <= self.dias_restantes <= 15
+        return self.dias_restantes is not None and 0 <= self.dias_restantes <= self.DIAS_ALERTA_PRAZO
+
+    @alerta_prazo.expression
+    def alerta_prazo(cls):
+        hoje = datetime.now().date()
+        return and_(
+            cls.status == 'Em Andamento',
+            cls.previsao_conclusao >= hoje,
+            cls.previsao_conclusao <= hoje + timedelta(days=cls.DIAS_ALERTA_PRAZO)
+        )
+
+    @classmethod
+    def filtro_faixa_prazo(cls, faixa):
+        """Condição SQL para uma das FAIXAS_PRAZO (None se a faixa for desconhecida)"""
+        hoje = datetime.now().date()
+        em_andamento = cls.status == 'Em Andamento'
+
+        if faixa == 'atrasadas':
+            return cls.esta_atrasado
+        if faixa == 'atrasadas_30':
+            return and_(em_andamento, cls.previsao_conclusao < hoje - timedelta(days=30))
+        if faixa == 'proximas':
+            return cls.alerta_prazo
+        if faixa == 'no_prazo':
+            return and_(em_andamento, cls.previsao_conclusao > hoje + timedelta(days=cls.DIAS_ALERTA_PRAZO))
+        if faixa == 'sem_prazo':
+            return and_(em_andamento, cls.previsao_conclusao.is_(None))
+        return None
 
     def to_dict(self):
         return {
@@ -160,6 +424,31 @@ class Investigacao(db.Model):
         }
 
 
+# ==================== MODELO DE CARGA DE TRABALHO ====================
+class CargaResponsavel(db.Model):
+    """Resumo por responsável, mantido incrementalmente (ver carga.py)"""
+    __tablename__ = 'carga_responsaveis'
+
+    responsavel = db.Column(db.String(100), primary_key=True)
+    abertas = db.Column(db.Integer, nullable=False, default=0)          # Status diferente de 'Concluída'
+    atrasadas = db.Column(db.Integer, nullable=False, default=0)        # Em andamento com prazo vencido
+    proximas_prazo = db.Column(db.Integer, nullable=False, default=0)   # Em andamento, vence em até 15 dias
+    concluidas_ano = db.Column(db.Integer, nullable=False, default=0)   # Concluídas no ano corrente
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    reconciliado_em = db.Column(db.DateTime)  # Última reconciliação completa (job noturno)
+
+    def to_dict(self):
+        return {
+            'responsavel': self.responsavel,
+            'abertas': self.abertas,
+            'atrasadas': self.atrasadas,
+            'proximas_prazo': self.proximas_prazo,
+            'concluidas_ano': self.concluidas_ano,
+            'atualizado_em': self.atualizado_em.isoformat() if self.atualizado_em else None,
+            'reconciliado_em': self.reconciliado_em.isoformat() if self.reconciliado_em else None
+        }
+
+
 # ==================== MODELO DE HISTÓRICO ====================
 class HistoricoDiligencia(db.Model):
     __tablename__ = 'historico_diligencias'
@@ -171,6 +460,12 @@ class HistoricoDiligencia(db.Model):
     descricao = db.Column(db.Text, nullable=False)
     tipo = db.Column(db.String(50))  # 'diligencia', 'edicao', 'status'
 
+    __table_args__ = (
+        # Timeline da investigação, do mais recente ao mais antigo (paginada por data/id)
+        db.Index('ix_historico_investigacao_data', 'investigacao_id', 'data'),
+        {'sqlite_autoincrement': True},
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -191,9 +486,15 @@ class Anexo(db.Model):
     caminho_arquivo = db.Column(db.String(255), nullable=False)  # Caminho onde o arquivo está salvo no servidor
     tipo_mime = db.Column(db.String(100))  # Tipo MIME do arquivo (ex: application/pdf, image/jpeg)
     tamanho_bytes = db.Column(db.Integer)  # Tamanho do arquivo em bytes
+    codificacao = db.Column(db.String(10))  # 'gzip'/'zstd' se guardado comprimido (ver compressao_anexos.py); None = como enviado
+    tamanho_armazenado = db.Column(db.Integer)  # Bytes ocupados no armazenamento (menor que tamanho_bytes se comprimido)
     data_upload = db.Column(db.DateTime, default=datetime.utcnow)
     usuario_upload = db.Column(db.String(100))  # Quem fez o upload
 
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    arquivada = False  # True quando lido das tabelas de arquivo (ver arquivo.py)
+
     # Relacionamento com Investigacao
     investigacao = db.relationship('Investigacao', backref='anexos', lazy=True)
 
@@ -208,3 +509,87 @@ class Anexo(db.Model):
             'data_upload': self.data_upload.isoformat() if self.data_upload else None,
             'usuario_upload': self.usuario_upload
         }
+
+
+# ==================== FILA DE EXCLUSÃO DE ARQUIVOS ====================
+class ExclusaoPendente(db.Model):
+    """Arquivo de anexo a apagar do disco depois do commit (ver exclusao_arquivos.py)"""
+    __tablename__ = 'exclusoes_pendentes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    caminho_arquivo = db.Column(db.String(255), nullable=False)  # Mesmo valor de Anexo.caminho_arquivo
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    ultimo_erro = db.Column(db.Text)
+
+
+# ==================== ÍNDICE DE SIMILARIDADE (POSSÍVEIS DUPLICIDADES) ====================
+class AssinaturaSimilaridade(db.Model):
+    """Assinatura MinHash do texto de cada investigação (mantida pelo duplicidade.py)"""
+    __tablename__ = 'assinaturas_similaridade'
+
+    investigacao_id = db.Column(db.Integer, primary_key=True)  # Sem FK: limpa pelos eventos ao excluir
+    assinatura = db.Column(db.LargeBinary, nullable=False)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class BandaSimilaridade(db.Model):
+    """Faixas da assinatura (LSH): investigações parecidas coincidem em pelo menos uma"""
+    __tablename__ = 'bandas_similaridade'
+
+    banda = db.Column(db.SmallInteger, primary_key=True)
+    valor = db.Column(db.BigInteger, primary_key=True)
+    investigacao_id = db.Column(db.Integer, primary_key=True, index=True)
+
+
+# ==================== TENDÊNCIAS MENSAIS (ROLLUP) ====================
+class ResumoMensal(db.Model):
+    """Entradas, conclusões e tempo até a conclusão por mês (mantido pelo tendencias.py).
+    classificacao/responsavel: '' = não informado, '*' = todos"""
+    __tablename__ = 'resumos_mensais'
+
+    mes = db.Column(db.Date, primary_key=True)  # Primeiro dia do mês
+    classificacao = db.Column(db.String(100), primary_key=True)
+    responsavel = db.Column(db.String(100), primary_key=True)
+    entradas = db.Column(db.Integer, nullable=False, default=0)      # Pela entrada_prfi
+    conclusoes = db.Column(db.Integer, nullable=False, default=0)    # Pela data_conclusao
+    soma_dias = db.Column(db.Integer, nullable=False, default=0)     # Dias da entrada à conclusão (para a média)
+    concluidas_com_prazo = db.Column(db.Integer, nullable=False, default=0)  # Conclusões com os dias calculáveis
+    dias_p50 = db.Column(db.Integer)
+    dias_p90 = db.Column(db.Integer)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class MesPendente(db.Model):
+    """Mês com investigações alteradas, a recalcular no ResumoMensal"""
+    __tablename__ = 'meses_pendentes'
+
+    id = db.Column(db.Integer, primary_key=True)  # Sem unicidade: o mesmo mês pode entrar várias vezes
+    mes = db.Column(db.Date, nullable=False)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# ==================== ARQUIVO (CONCLUÍDAS HÁ MAIS TEMPO) ====================
+# Mesmas colunas das tabelas principais, com os mesmos ids e sem chaves estrangeiras.
+# As linhas são movidas para cá e de volta pelo arquivo.py.
+def _tabela_de_arquivo(tabela, nome, *extras):
+    colunas = [db.Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable, autoincrement=False)
+               for c in tabela.columns]
+    return db.Table(nome, *colunas, *extras)
+
+
+investigacoes_arquivo = _tabela_de_arquivo(
+    Investigacao.__table__, 'investigacoes_arquivo',
+    db.Column('arquivada_em', db.DateTime),
+    db.Index('ix_investigacoes_arquivo_matricula_chave', 'matricula_chave'),
+)
+
+historico_arquivo = _tabela_de_arquivo(
+    HistoricoDiligencia.__table__, 'historico_diligencias_arquivo',
+    db.Index('ix_historico_arquivo_investigacao', 'investigacao_id'),
+)
+
+anexos_arquivo = _tabela_de_arquivo(
+    Anexo.__table__, 'anexos_arquivo',
+    db.Index('ix_anexos_arquivo_investigacao', 'investigacao_id'),
+)
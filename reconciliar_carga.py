@@ -0,0 +1,18 @@
+# reconciliar_carga.py
+# Job noturno: recalcula a tabela de carga de trabalho por responsável.
+# Corrige a virada do dia (atrasadas / vencem em 15 dias), a virada do ano
+# (concluídas no ano) e qualquer divergência das atualizações incrementais.
+#
+# Agendar uma vez por dia logo após a meia-noite, ex. (cron):
+#   5 0 * * * cd /caminho/do/sistema && python reconciliar_carga.py
+from app import app
+import carga
+
+with app.app_context():
+    print("Reconciliando carga de trabalho por responsável...")
+    divergentes = carga.reconciliar()
+
+    if divergentes:
+        print(f"⚠️ {divergentes} responsável(is) estavam divergentes e foram corrigidos.")
+    else:
+        print("✅ Nenhuma divergência encontrada.")
@@ -0,0 +1,153 @@
+# ==================== LEITURAS NA RÉPLICA ====================
+# Rotas somente leitura (relatórios, dashboard, listas, exportações) podem ler de
+# uma réplica do banco, configurada em DATABASE_REPLICA_URL. Na rota:
+#
+#   @app.route('/relatorios')
+#   @replica.somente_leitura
+#   def relatorios(): ...
+#
+# Dentro dessas rotas, os SELECTs da sessão vão para a réplica. Continuam no principal:
+#   - qualquer escrita (flush, UPDATE/INSERT/DELETE) e db.session.connection();
+#     depois da primeira escrita, o resto da requisição também lê do principal
+#   - o usuário que gravou algo nos últimos REPLICA_JANELA_ESCRITA segundos
+#     (ele precisa ver o que acabou de salvar, mesmo com a réplica atrasada)
+#   - todas as requisições enquanto a réplica estiver fora do ar ou atrasada demais
+#
+# Dados guardados em cache e limpos a cada escrita (gráficos, retrato do explorador)
+# são lidos do principal: lidos de uma réplica atrasada, o dado antigo voltaria ao cache.
+#
+# Sem DATABASE_REPLICA_URL tudo vai para o principal. Para testar localmente com
+# dois arquivos SQLite: copie instance/database.db para instance/replica.db e rode
+# com DATABASE_REPLICA_URL=sqlite:///<caminho>/instance/replica.db
+import time
+import threading
+from functools import wraps
+from flask import g, session, has_request_context, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql import Select
+import metricas
+
+CHAVE = 'replica'  # Nome do bind em SQLALCHEMY_BINDS
+INTERVALO_VERIFICACAO = 10  # Segundos entre verificações da réplica
+
+_estado = {'disponivel': True, 'verificado_em': 0.0}
+_lock = threading.Lock()
+
+# Atraso da réplica PostgreSQL em segundos (0 se já aplicou tudo o que recebeu)
+SQL_ATRASO_POSTGRES = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def somente_leitura(view):
+    """Decorator: os SELECTs da rota podem ir para a réplica"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.ler_da_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _marcar_indisponivel():
+    with _lock:
+        _estado.update(disponivel=False, verificado_em=time.monotonic())
+    metricas.incrementar('replica.falhas')
+
+
+def disponivel(engine):
+    """A réplica responde e não está atrasada demais (verificada a cada INTERVALO_VERIFICACAO)"""
+    agora = time.monotonic()
+    with _lock:
+        if agora - _estado['verificado_em'] < INTERVALO_VERIFICACAO:
+            return _estado['disponivel']
+        _estado['verificado_em'] = agora  # As outras threads seguem com o estado anterior
+
+    try:
+        with engine.connect() as conexao:
+            if engine.dialect.name == 'postgresql':
+                atraso = conexao.execute(SQL_ATRASO_POSTGRES).scalar() or 0
+                ok = atraso <= current_app.config.get('REPLICA_ATRASO_MAXIMO', 30)
+                if not ok:
+                    metricas.incrementar('replica.atrasada')
+            else:
+                conexao.execute(text('SELECT 1'))
+                ok = True
+    except SQLAlchemyError:
+        ok = False
+        metricas.incrementar('replica.falhas')
+
+    with _lock:
+        _estado['disponivel'] = ok
+    return ok
+
+
+def _escreveu_recentemente():
+    return session.get('primario_ate', 0) > time.time()
+
+
+class SessaoRoteada(Session):
+    """Sessão do Flask-SQLAlchemy que manda os SELECTs das rotas somente leitura à réplica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        principal = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not has_request_context() or not g.get('ler_da_replica'):
+            return principal
+
+        replica = self._db.engines.get(CHAVE)
+        if replica is None:
+            return principal
+
+        # Escrita, flush ou connection(): principal até o fim da requisição
+        if self._flushing or not isinstance(clause, Select) or self.info.get('houve_escrita'):
+            g.ler_da_replica = False
+            return principal
+
+        if _escreveu_recentemente() or not disponivel(replica):
+            metricas.incrementar('replica.leituras_no_principal')
+            return principal
+
+        metricas.incrementar('replica.leituras')
+        return replica
+
+
+# ==================== LER O QUE ACABOU DE GRAVAR ====================
+def registrar_eventos(sessao):
+    """Anota as escritas da sessão e abre a janela de leitura no principal após o commit"""
+
+    @event.listens_for(sessao, 'after_flush')
+    def _anotar_flush(session_, flush_context):
+        session_.info['houve_escrita'] = True
+
+    @event.listens_for(sessao, 'do_orm_execute')
+    def _anotar_dml(execucao):
+        if execucao.is_update or execucao.is_delete or execucao.is_insert:
+            execucao.session.info['houve_escrita'] = True
+
+    @event.listens_for(sessao, 'after_commit')
+    def _abrir_janela(session_):
+        if session_.info.pop('houve_escrita', False) and has_request_context() and 'usuario' in session:
+            janela = current_app.config.get('REPLICA_JANELA_ESCRITA', 15)
+            session['primario_ate'] = time.time() + janela
+
+    @event.listens_for(sessao, 'after_rollback')
+    def _descartar(session_):
+        session_.info.pop('houve_escrita', None)
+
+
+def registrar(app, db):
+    """Eventos da sessão e, se houver réplica configurada, a detecção de falhas dela"""
+    registrar_eventos(db.session)
+    if CHAVE not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+
+    with app.app_context():
+        engine = db.engines[CHAVE]
+
+    # Conexão perdida no meio de uma consulta: próximas requisições vão para o principal
+    @event.listens_for(engine, 'handle_error')
+    def _erro_na_replica(contexto):
+        if contexto.is_disconnect or contexto.connection is None:
+            _marcar_indisponivel()
@@ -32,6 +32,6 @@ with app.app_context():
             print("🎉 A tabela 'servidor' existe no banco de dados!")
         else:
             print("❌ A tabela 'servidor' AINDA NÃO existe no banco de dados.")
-            print("Por favor, verifique se o modelo 'Servidor' está corretamente definido em app.py.")
+            print("Por favor, verifique se o modelo 'Servidor' está corretamente definido em models.py.")
 
 print("Configuração do banco de dados finalizada.")
@@ -0,0 +1,287 @@
+# ==================== TENDÊNCIAS MENSAIS (ENTRADAS, CONCLUSÕES, ESTOQUE) ====================
+# A tabela resumos_mensais guarda, por mês, classificação e responsável:
+#   - entradas (pela entrada_prfi) e conclusões (pela data_conclusao)
+#   - soma e percentis 50/90 dos dias da entrada até a conclusão
+# O estoque em aberto no fim de cada mês é a soma acumulada de entradas - conclusões,
+# calculada na leitura com SUM() OVER (...) sobre o próprio resumo.
+#
+# Cada escrita em Investigacao anota na mesma transação os meses afetados (valores
+# antigos e novos das datas) em meses_pendentes; atualizar() recalcula só esses meses.
+# Operações em massa chamam marcar_investigacoes(condicao) / marcar_meses(datas).
+# O recálculo lê também as investigações arquivadas (arquivo.uniao): arquivar ou
+# restaurar não muda o resumo.
+#
+# O recálculo roda fora das requisições, num único processo agendado
+# (python atualizar_tendencias.py); a tela só lê o resumo e pode usar a réplica.
+#
+#   tendencias.atualizar(); db.session.commit()
+#   serie = tendencias.serie(classificacao='*', responsavel='*', desde=date(2020, 1, 1))
+from datetime import datetime, date
+from sqlalchemy import event, select, insert, delete, func, case, literal, union, inspect, true
+from models import db, Investigacao, ResumoMensal, MesPendente, dias_entre, inicio_do_mes
+import arquivo
+
+TODOS = '*'  # Linha que soma todas as classificações/responsáveis
+CAMPOS_MONITORADOS = ('entrada_prfi', 'data_conclusao', 'status', 'classificacao', 'responsavel')
+
+# Combinações gravadas para cada mês: (classificação, responsável) de cada célula e os totais
+NIVEIS = (('classificacao', 'responsavel'), ('classificacao',), ('responsavel',), ())
+
+MESES_POR_LOTE = 120
+
+
+def mes_de(valor):
+    """Primeiro dia do mês de uma data (None se vazia)"""
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        valor = valor.date()
+    return valor.replace(day=1)
+
+
+# ==================== MARCAÇÃO DOS MESES ALTERADOS ====================
+def marcar_meses(datas, conexao=None):
+    """Anota os meses das datas informadas para recálculo"""
+    meses = {mes_de(d) for d in datas} - {None}
+    if not meses:
+        return
+    conexao = conexao if conexao is not None else db.session.connection()
+    agora = datetime.utcnow()
+    conexao.execute(insert(MesPendente), [{'mes': mes, 'criado_em': agora} for mes in sorted(meses)])
+
+
+def marcar_investigacoes(condicao=None, conexao=None):
+    """Anota os meses de entrada e conclusão das investigações da condição (INSERT ... SELECT).
+    Sem condição: todas, inclusive as arquivadas"""
+    inv = Investigacao if condicao is not None else arquivo.uniao('entrada_prfi', 'data_conclusao').c
+    condicao = condicao if condicao is not None else true()
+    conexao = conexao if conexao is not None else db.session.connection()
+    meses = union(
+        select(inicio_do_mes(inv.entrada_prfi).label('mes'))
+        .where(condicao, inv.entrada_prfi.isnot(None)),
+        select(inicio_do_mes(inv.data_conclusao).label('mes'))
+        .where(condicao, inv.data_conclusao.isnot(None)),
+    ).subquery()
+    conexao.execute(insert(MesPendente).from_select(
+        ['mes', 'criado_em'], select(meses.c.mes, literal(datetime.utcnow(), db.DateTime))))
+
+
+# ==================== RECÁLCULO ====================
+def _chaves(inv, nivel):
+    """Colunas de agrupamento do nível (vazio vira '')"""
+    return [func.coalesce(getattr(inv, campo), '').label(campo) for campo in nivel]
+
+
+def _entradas(conexao, meses, nivel):
+    inv = arquivo.uniao(*CAMPOS_MONITORADOS).c
+    mes = inicio_do_mes(inv.entrada_prfi)
+    chaves = _chaves(inv, nivel)
+    consulta = select(mes.label('mes'), *chaves, func.count().label('entradas')) \
+        .where(inv.entrada_prfi.isnot(None), mes.in_(meses)) \
+        .group_by(mes, *[c.element for c in chaves])
+    return conexao.execute(consulta).all()
+
+
+def _conclusoes(conexao, meses, nivel):
+    """Conclusões do mês e percentis dos dias (posição na ordem, por ROW_NUMBER() OVER)"""
+    inv = arquivo.uniao(*CAMPOS_MONITORADOS).c
+    mes = inicio_do_mes(inv.data_conclusao)
+    chaves = _chaves(inv, nivel)
+    particao = [mes, *[c.element for c in chaves]]
+    dias = case(
+        (inv.data_conclusao >= inv.entrada_prfi,
+         dias_entre(inv.data_conclusao, inv.entrada_prfi)),
+        else_=None,
+    )
+    ordenadas = select(
+        mes.label('mes'), *chaves, dias.label('dias'),
+        func.row_number().over(partition_by=particao, order_by=dias.asc().nulls_last()).label('posicao'),
+        func.count(dias).over(partition_by=particao).label('com_dias'),
+    ).where(
+        inv.status == 'Concluída', inv.data_conclusao.isnot(None), mes.in_(meses),
+    ).subquery()
+
+    o = ordenadas.c
+    # Percentil pela posição mais próxima: ceil(p * n) em aritmética inteira
+    p50 = func.max(case((o.posicao == (o.com_dias + 1) // 2, o.dias)))
+    p90 = func.max(case((o.posicao == (9 * o.com_dias + 9) // 10, o.dias)))
+    colunas = [o.mes, *[o[campo] for campo in nivel]]
+    consulta = select(
+        *colunas, func.count().label('conclusoes'), func.coalesce(func.sum(o.dias), 0).label('soma_dias'),
+        func.count(o.dias).label('concluidas_com_prazo'), p50.label('dias_p50'), p90.label('dias_p90'),
+    ).group_by(*colunas)
+    return conexao.execute(consulta).all()
+
+
+def _calcular(conexao, meses):
+    """Linhas do resumo dos meses informados, em todos os níveis"""
+    linhas = {}
+
+    def linha(registro, nivel):
+        classificacao = registro.classificacao if 'classificacao' in nivel else TODOS
+        responsavel = registro.responsavel if 'responsavel' in nivel else TODOS
+        chave = (registro.mes, classificacao, responsavel)
+        if chave not in linhas:
+            linhas[chave] = {
+                'mes': registro.mes, 'classificacao': classificacao, 'responsavel': responsavel,
+                'entradas': 0, 'conclusoes': 0, 'soma_dias': 0, 'concluidas_com_prazo': 0,
+                'dias_p50': None, 'dias_p90': None,
+            }
+        return linhas[chave]
+
+    for nivel in NIVEIS:
+        for registro in _entradas(conexao, meses, nivel):
+            linha(registro, nivel)['entradas'] = registro.entradas
+        for registro in _conclusoes(conexao, meses, nivel):
+            linha(registro, nivel).update(
+                conclusoes=registro.conclusoes, soma_dias=int(registro.soma_dias),
+                concluidas_com_prazo=registro.concluidas_com_prazo,
+                dias_p50=registro.dias_p50, dias_p90=registro.dias_p90,
+            )
+    return list(linhas.values())
+
+
+def recalcular_meses(meses, conexao=None):
+    """Regrava do zero as linhas do resumo dos meses informados"""
+    meses = sorted({mes_de(m) for m in meses} - {None})
+    conexao = conexao if conexao is not None else db.session.connection()
+    agora = datetime.utcnow()
+    for inicio in range(0, len(meses), MESES_POR_LOTE):
+        lote = meses[inicio:inicio + MESES_POR_LOTE]
+        linhas = _calcular(conexao, lote)
+        conexao.execute(delete(ResumoMensal).where(ResumoMensal.mes.in_(lote)))
+        if linhas:
+            conexao.execute(insert(ResumoMensal), [dict(linha, atualizado_em=agora) for linha in linhas])
+
+
+def atualizar(conexao=None):
+    """Recalcula os meses pendentes (sem commit). Retorna quantos meses foram recalculados."""
+    conexao = conexao if conexao is not None else db.session.connection()
+
+    # Resumo ainda vazio (primeira vez): marca todos os meses com investigações
+    if conexao.execute(select(ResumoMensal.mes).limit(1)).first() is None \
+            and conexao.execute(select(MesPendente.id).limit(1)).first() is None:
+        marcar_investigacoes(conexao=conexao)
+
+    pendentes = conexao.execute(select(MesPendente.id, MesPendente.mes)).all()
+    if not pendentes:
+        return 0
+
+    meses = {mes for _, mes in pendentes}
+    recalcular_meses(meses, conexao)
+    # Só os lidos: os anotados por outras transações nesse meio tempo ficam para a próxima
+    conexao.execute(delete(MesPendente).where(MesPendente.id <= max(id_ for id_, _ in pendentes)))
+    return len(meses)
+
+
+def reconstruir():
+    """Apaga e recalcula o resumo inteiro"""
+    conexao = db.session.connection()
+    conexao.execute(delete(ResumoMensal))
+    conexao.execute(delete(MesPendente))
+    marcar_investigacoes(conexao=conexao)
+    meses = atualizar(conexao)
+    db.session.commit()
+    return meses
+
+
+# ==================== LEITURA (SÓ DO RESUMO) ====================
+def serie(classificacao=TODOS, responsavel=TODOS, desde=None):
+    """Série mensal com estoque em aberto no fim de cada mês (soma acumulada desde o início)"""
+    r = ResumoMensal
+    acumulada = select(
+        r.mes, r.entradas, r.conclusoes, r.soma_dias, r.concluidas_com_prazo, r.dias_p50, r.dias_p90,
+        func.sum(r.entradas - r.conclusoes).over(
+            partition_by=(r.classificacao, r.responsavel), order_by=r.mes).label('estoque'),
+    ).where(r.classificacao == classificacao, r.responsavel == responsavel).subquery()
+
+    consulta = select(acumulada).order_by(acumulada.c.mes)
+    if desde is not None:
+        consulta = consulta.where(acumulada.c.mes >= mes_de(desde))
+
+    resultado, anterior = [], None
+    for linha in db.session.execute(consulta):
+        # Meses sem movimento não têm linha: repete o estoque do mês anterior
+        if anterior is not None:
+            for mes in _meses_entre(anterior['mes'], linha.mes):
+                resultado.append(_mes_vazio(mes, anterior['estoque']))
+        atual = {
+            'mes': linha.mes, 'entradas': linha.entradas, 'conclusoes': linha.conclusoes,
+            'estoque': int(linha.estoque),
+            'dias_media': round(linha.soma_dias / linha.concluidas_com_prazo, 1) if linha.concluidas_com_prazo else None,
+            'dias_p50': linha.dias_p50, 'dias_p90': linha.dias_p90,
+        }
+        resultado.append(atual)
+        anterior = atual
+    return resultado
+
+
+def _meses_entre(inicio, fim):
+    """Meses estritamente entre inicio e fim"""
+    ano, mes = inicio.year, inicio.month
+    while True:
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+        atual = date(ano, mes, 1)
+        if atual >= fim:
+            return
+        yield atual
+
+
+def _mes_vazio(mes, estoque):
+    return {'mes': mes, 'entradas': 0, 'conclusoes': 0, 'estoque': estoque,
+            'dias_media': None, 'dias_p50': None, 'dias_p90': None}
+
+
+def situacao():
+    """(último recálculo do resumo, meses aguardando o próximo atualizar())"""
+    atualizado_em = db.session.execute(select(func.max(ResumoMensal.atualizado_em))).scalar()
+    pendentes = db.session.execute(select(func.count(func.distinct(MesPendente.mes)))).scalar()
+    return atualizado_em, pendentes
+
+
+def opcoes():
+    """Classificações e responsáveis presentes no resumo (para os filtros)"""
+    r = ResumoMensal
+    classificacoes = db.session.execute(
+        select(r.classificacao).where(r.classificacao != TODOS).distinct().order_by(r.classificacao)).scalars().all()
+    responsaveis = db.session.execute(
+        select(r.responsavel).where(r.responsavel != TODOS).distinct().order_by(r.responsavel)).scalars().all()
+    return classificacoes, responsaveis
+
+
+# ==================== EVENTOS: MESES AFETADOS NA MESMA TRANSAÇÃO ====================
+def _alterou_campos_monitorados(obj):
+    estado = inspect(obj)
+    return any(estado.attrs[campo].history.has_changes() for campo in CAMPOS_MONITORADOS)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _guardar_datas_anteriores(session, flush_context, instances):
+    """Lê do banco (ainda sem o flush) as datas anteriores das investigações alteradas/excluídas"""
+    ids = [
+        obj.id for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, Investigacao) and obj.id is not None
+        and (obj in session.deleted or _alterou_campos_monitorados(obj))
+    ]
+
+    anteriores = {}
+    if ids:
+        with session.no_autoflush:
+            linhas = session.execute(
+                select(Investigacao.id, Investigacao.entrada_prfi, Investigacao.data_conclusao)
+                .where(Investigacao.id.in_(ids))
+            ).all()
+        anteriores = {linha.id: (linha.entrada_prfi, linha.data_conclusao) for linha in linhas}
+
+    session.info['tendencias_anterior'] = anteriores
+
+
+@event.listens_for(db.session, 'after_flush')
+def _marcar_meses_afetados(session, flush_context):
+    anteriores = session.info.pop('tendencias_anterior', {})
+    datas = [data for par in anteriores.values() for data in par]
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Investigacao) and (obj in session.new or obj.id in anteriores):
+            datas += [obj.entrada_prfi, obj.data_conclusao]
+    if any(d is not None for d in datas):
+        marcar_meses(datas, session.connection())
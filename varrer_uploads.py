@@ -0,0 +1,69 @@
+# varrer_uploads.py
+# Reconcilia o armazenamento de anexos (pasta de uploads ou bucket) com a tabela de anexos.
+#
+# Uso:
+#   python varrer_uploads.py                      -> só relatório (não altera nada)
+#   python varrer_uploads.py --remover-orfaos     -> apaga arquivos sem anexo no banco
+#   python varrer_uploads.py --remover-registros  -> apaga anexos cujo arquivo sumiu
+#
+# Antes do relatório processa a fila de exclusão (exclusoes_pendentes).
+# Arquivos modificados há menos de 1 hora não contam como órfãos (upload em andamento).
+# Sugestão de agendamento (cron), semanal:
+#   0 3 * * 0 cd /caminho/do/sistema && python varrer_uploads.py --remover-orfaos
+import sys
+import time
+from app import app
+from models import db, Anexo, ExclusaoPendente, HistoricoDiligencia, anexos_arquivo
+import exclusao_arquivos
+import armazenamento
+
+CARENCIA_SEGUNDOS = 3600
+
+
+with app.app_context():
+    backend = armazenamento.atual()
+    if backend.nome == 'local':
+        print(f"📁 Pasta de uploads: {backend.pasta}")
+    else:
+        print(f"☁️ Bucket: {backend.bucket}/{backend.prefixo}")
+
+    removidos, falhas = exclusao_arquivos.processar(limite=100000)
+    print(f"🗑️ Fila de exclusão: {removidos} arquivo(s) apagado(s), {falhas} falha(s)")
+
+    arquivos = {chave: mtime for chave, _, mtime in backend.listar()}
+    registrados = {caminho: (id_, inv_id) for id_, inv_id, caminho in
+                   db.session.query(Anexo.id, Anexo.investigacao_id, Anexo.caminho_arquivo)}
+    na_fila = {caminho for (caminho,) in db.session.query(ExclusaoPendente.caminho_arquivo)}
+    # Anexos de investigações arquivadas: o arquivo continua no armazenamento (ver arquivo.py)
+    arquivados = {caminho for (caminho,) in db.session.query(anexos_arquivo.c.caminho_arquivo)}
+
+    limite = time.time() - CARENCIA_SEGUNDOS
+    orfaos = sorted(nome for nome, mtime in arquivos.items()
+                    if nome not in registrados and nome not in arquivados and nome not in na_fila and mtime < limite)
+    sem_arquivo = sorted((caminho, *ids) for caminho, ids in registrados.items() if caminho not in arquivos)
+
+    print(f"\n📊 {len(arquivos)} arquivo(s) no armazenamento, {len(registrados)} anexo(s) no banco"
+          f" (+ {len(arquivados)} no arquivo)")
+    print(f"   Arquivos órfãos (sem anexo no banco): {len(orfaos)}")
+    for nome in orfaos[:50]:
+        print(f"     - {nome}")
+    print(f"   Anexos sem arquivo: {len(sem_arquivo)}")
+    for caminho, id_, inv_id in sem_arquivo[:50]:
+        print(f"     - anexo #{id_} (investigação #{inv_id}): {caminho}")
+
+    if '--remover-orfaos' in sys.argv and orfaos:
+        exclusao_arquivos.agendar(orfaos)
+        db.session.commit()
+        removidos, falhas = exclusao_arquivos.processar(limite=len(orfaos))
+        print(f"\n✅ {removidos} arquivo(s) órfão(s) apagado(s), {falhas} falha(s)")
+
+    if '--remover-registros' in sys.argv and sem_arquivo:
+        ids = [id_ for _, id_, _ in sem_arquivo]
+        db.session.add_all([
+            HistoricoDiligencia(investigacao_id=inv_id, usuario='Sistema', tipo='exclusao_anexo',
+                                descricao=f'Anexo "{caminho}" removido: arquivo não encontrado no servidor')
+            for caminho, _, inv_id in sem_arquivo
+        ])
+        Anexo.query.filter(Anexo.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        print(f"✅ {len(ids)} registro(s) de anexo sem arquivo removido(s)")
@@ -0,0 +1,125 @@
+# ==================== DOWNLOAD DOS ANEXOS EM ZIP ====================
+# O ZIP é montado enquanto é enviado: cada arquivo é lido do armazenamento em blocos
+# e os bytes do ZIP saem assim que são gerados (sem arquivo temporário e sem o ZIP
+# inteiro em memória). O zipfile escreve em saída sem seek usando data descriptors.
+#
+#   return Response(stream_with_context(zip_anexos.gerar(arquivos, anexos)), mimetype='application/zip')
+#
+# - pdf, docx/xlsx e imagens já são comprimidos: vão sem compressão (stored)
+# - nomes repetidos ganham sufixo: 'oficio.pdf', 'oficio (2).pdf'
+# - MANIFESTO.csv no fim: tamanho, SHA-256 e dados do upload de cada arquivo
+import io
+import csv
+import hashlib
+import mimetypes
+import zipfile
+import posixpath
+from contextlib import closing
+from werkzeug.utils import secure_filename
+import compressao_anexos
+
+BLOCO = 64 * 1024
+
+JA_COMPRIMIDOS = {
+    'application/pdf', 'application/zip', 'image/jpeg', 'image/png', 'image/gif',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+MAXIMO_ANEXOS = 2000  # Por download de várias investigações
+
+# Sem seek o zipfile precisa saber antes se o arquivo passa de 2 GB
+LIMITE_ZIP32 = (1 << 31) - 1
+
+
+class _Saida(io.RawIOBase):
+    """Destino do zipfile que acumula os bytes até o gerador enviá-los"""
+
+    def __init__(self):
+        self.partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def esvaziar(self):
+        dados = b''.join(self.partes)
+        self.partes.clear()
+        return dados
+
+
+def nomes_unicos(nomes):
+    """Lista de nomes sem repetição (ignorando maiúsculas, como no Windows)"""
+    usados, resultado = set(), []
+    for nome in nomes:
+        base, extensao = posixpath.splitext(nome)
+        candidato, n = nome, 1
+        while candidato.lower() in usados:
+            n += 1
+            candidato = f"{base} ({n}){extensao}"
+        usados.add(candidato.lower())
+        resultado.append(candidato)
+    return resultado
+
+
+def pasta_da_investigacao(investigacao):
+    """Pasta de cada investigação no ZIP de várias investigações"""
+    processo = secure_filename(investigacao.processo_gdoc or '')
+    return f"{investigacao.id}_{processo}" if processo else str(investigacao.id)
+
+
+def _zipinfo(nome, anexo):
+    data = anexo.data_upload.timetuple()[:6] if anexo.data_upload else (1980, 1, 1, 0, 0, 0)
+    info = zipfile.ZipInfo(nome, date_time=max(data, (1980, 1, 1, 0, 0, 0)))
+    if (anexo.tipo_mime or mimetypes.guess_type(anexo.nome_arquivo)[0]) in JA_COMPRIMIDOS:
+        info.compress_type = zipfile.ZIP_STORED
+    else:
+        info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+def gerar(arquivos, anexos, agrupar=False):
+    """Gera os bytes do ZIP. anexos: lista de Anexo (com .investigacao se agrupar=True)"""
+    if agrupar:
+        nomes = [f"{pasta_da_investigacao(a.investigacao)}/{a.nome_arquivo}" for a in anexos]
+    else:
+        nomes = [a.nome_arquivo for a in anexos]
+
+    saida = _Saida()
+    manifesto = []
+    with zipfile.ZipFile(saida, 'w') as arquivo_zip:
+        for anexo, nome in zip(anexos, nomes_unicos(nomes)):
+            linha = {
+                'arquivo': nome, 'investigacao_id': anexo.investigacao_id, 'nome_original': anexo.nome_arquivo,
+                'tipo_mime': anexo.tipo_mime or '', 'usuario_upload': anexo.usuario_upload or '',
+                'data_upload': anexo.data_upload.strftime('%d/%m/%Y %H:%M') if anexo.data_upload else '',
+            }
+            if not arquivos.existe(anexo.caminho_arquivo):
+                manifesto.append({**linha, 'tamanho_bytes': '', 'sha256': '', 'situacao': 'arquivo não encontrado'})
+                continue
+
+            grande = anexo.tamanho_bytes is None or anexo.tamanho_bytes > LIMITE_ZIP32
+            sha256, tamanho = hashlib.sha256(), 0
+            with closing(compressao_anexos.abrir(arquivos, anexo)) as origem, \
+                    arquivo_zip.open(_zipinfo(nome, anexo), 'w', force_zip64=grande) as destino:
+                while bloco := origem.read(BLOCO):
+                    destino.write(bloco)
+                    sha256.update(bloco)
+                    tamanho += len(bloco)
+                    if saida.partes:
+                        yield saida.esvaziar()
+            manifesto.append({**linha, 'tamanho_bytes': tamanho, 'sha256': sha256.hexdigest(), 'situacao': 'ok'})
+            yield saida.esvaziar()
+
+        texto = io.StringIO()
+        escritor = csv.DictWriter(texto, delimiter=';', fieldnames=[
+            'arquivo', 'investigacao_id', 'nome_original', 'tamanho_bytes', 'tipo_mime',
+            'data_upload', 'usuario_upload', 'sha256', 'situacao'])
+        escritor.writeheader()
+        escritor.writerows(manifesto)
+        arquivo_zip.writestr('MANIFESTO.csv', texto.getvalue().encode('utf-8-sig'), zipfile.ZIP_DEFLATED)
+
+    yield saida.esvaziar()